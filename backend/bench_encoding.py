@@ -0,0 +1,152 @@
+"""Microbenchmark: request parsing and response encoding of the v1
+form-based admin writes against the typed /api/v2 routes.
+
+  parse    v1  multipart form parsed by Starlette, then json.loads() of
+               sizes / measurements / images (FastAPI's per-field Form
+               checks are not included, so v1 is if anything flattered)
+           v2  raw body -> schemas.ProductCreate.model_validate_json()
+  encode   v1  jsonable_encoder() + JSONResponse, FastAPI's default path
+           v2  fastjson.FastJSONResponse returned directly
+  listing  json.dumps() against fastjson.dumps() of a page of rows, the
+           encoding EncodedJSON does for every cached catalog payload
+
+    python bench_encoding.py
+    python bench_encoding.py --rows 500 --number 5000 --out bench_results/encoding.jsonl
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import fastjson  # noqa: E402
+import schemas  # noqa: E402
+from postgrest_mock import make_rows  # noqa: E402
+
+FORM_FIELDS = ("name", "price", "category", "description", "color", "sizes", "measurements", "video_url",
+               "condition", "coupon_code", "discount_amount", "header_image", "images")
+JSON_FORM_FIELDS = ("sizes", "measurements", "images")
+BOUNDARY = "----benchboundary7MA4YWxkTrZu0gW"
+
+
+def sample_product() -> dict:
+    row = next(iter(make_rows(1).values()))
+    return {field: row[field] for field in FORM_FIELDS}
+
+
+def multipart_body(product: dict) -> bytes:
+    """What the admin dashboard's FormData sends to v1."""
+    parts = []
+    for field in FORM_FIELDS:
+        value = product[field]
+        text = json.dumps(value) if field in JSON_FORM_FIELDS else str(value)
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n{text}\r\n')
+    parts.append(f"--{BOUNDARY}--\r\n")
+    return "".join(parts).encode()
+
+
+def _request(body: bytes, content_type: str) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/", "query_string": b"",
+             "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]}
+    return Request(scope, receive)
+
+
+async def parse_v1(body: bytes) -> dict:
+    form = await _request(body, f"multipart/form-data; boundary={BOUNDARY}").form()
+    data = {field: form[field] for field in FORM_FIELDS}
+    for field in JSON_FORM_FIELDS:
+        data[field] = json.loads(data[field]) if data[field] else None
+    if data["header_image"] and data["header_image"] not in data["images"]:
+        data["images"].insert(0, data["header_image"])
+    data["price"] = float(data["price"])
+    data["discount_amount"] = float(data["discount_amount"])
+    return data
+
+
+async def parse_v2(body: bytes) -> dict:
+    raw = await _request(body, "application/json").body()
+    return schemas.ProductCreate.model_validate_json(raw).row()
+
+
+def timed(fn, number: int, repeat: int) -> float:
+    """Best-of-`repeat` mean time per call in microseconds."""
+    best = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best.append((time.perf_counter() - started) / number * 1e6)
+    return min(best)
+
+
+def timed_async(fn, arg, number: int, repeat: int) -> float:
+    async def run():
+        started = time.perf_counter()
+        for _ in range(number):
+            await fn(arg)
+        return (time.perf_counter() - started) / number * 1e6
+
+    return min(asyncio.run(run()) for _ in range(repeat))
+
+
+def bench(args) -> dict:
+    product = sample_product()
+    form_body = multipart_body(product)
+    json_body = json.dumps(product).encode()
+    row = next(iter(make_rows(1).values()))
+    page = list(make_rows(args.rows).values())
+
+    # Same result either way, or the comparison means nothing
+    v1, v2 = asyncio.run(parse_v1(form_body)), asyncio.run(parse_v2(json_body))
+    assert {k: v1[k] for k in v2} == v2, (v1, v2)
+    assert json.loads(JSONResponse(jsonable_encoder(row)).body) == json.loads(fastjson.FastJSONResponse(row).body)
+
+    n, r = args.number, args.repeat
+    results = {
+        "parse": (timed_async(parse_v1, form_body, n, r), timed_async(parse_v2, json_body, n, r)),
+        "encode": (timed(lambda: JSONResponse(jsonable_encoder(row)), n, r),
+                   timed(lambda: fastjson.FastJSONResponse(row), n, r)),
+        f"listing x{args.rows}": (
+            timed(lambda: json.dumps(page, ensure_ascii=False, separators=(",", ":")).encode(), max(1, n // 50), r),
+            timed(lambda: fastjson.dumps(page), max(1, n // 50), r),
+        ),
+    }
+    return {name: {"v1_us": round(a, 2), "v2_us": round(b, 2), "speedup": round(a / b, 2)}
+            for name, (a, b) in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200, help="rows in the listing payload")
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing")
+    parser.add_argument("--repeat", type=int, default=5, help="timings per measurement; the best is kept")
+    parser.add_argument("--out", help="append results as one JSON line to this file")
+    args = parser.parse_args()
+
+    results = bench(args)
+    print(f"encoder: {'orjson ' + fastjson.orjson.__version__ if fastjson.orjson else 'json (orjson not installed)'}")
+    print(f"  {'':<16}{'v1 µs':>10}{'v2 µs':>10}{'speedup':>10}")
+    for name, stats in results.items():
+        print(f"  {name:<16}{stats['v1_us']:>10}{stats['v2_us']:>10}{stats['speedup']:>9}x")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "a") as f:
+            f.write(json.dumps({"at": datetime.now().isoformat(timespec="seconds"),
+                                "settings": vars(args), "results": results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
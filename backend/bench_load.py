@@ -0,0 +1,285 @@
+"""Load and latency benchmark.
+
+Starts postgrest_mock.py as a local Supabase stand-in (with injected
+latency), runs the API in-process against it, and drives a weighted mix of
+reads and admin writes at each concurrency level. Reports throughput and
+p50/p95/p99 per endpoint, split by X-Cache (HIT / STALE / MISS / -), plus how
+many requests reached the mock.
+
+    python bench_load.py
+    python bench_load.py --rows 5000 --latency 40 --concurrency 1,32,128 --duration 15
+    python bench_load.py --out bench_results/load.jsonl --baseline bench_results/load.jsonl
+
+With --baseline, the latest stored run with the same settings is compared
+and p95 regressions above --tolerance are listed (exit status 1).
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# endpoint name -> weight; writes are admin PATCHes that invalidate caches
+DEFAULT_MIX = "list=30,list_fields=15,category=15,page=10,product=15,search=8,facets=5,write=2"
+SEARCH_TERMS = ["vintage", "denim", "flan", "retro cargo", "leather", "knit", "y2k", "wash"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def start_mock(args) -> tuple:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "MOCK_ROWS": str(args.rows),
+        "MOCK_LATENCY_MS": str(args.latency),
+        "MOCK_JITTER_MS": str(args.jitter),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "postgrest_mock:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/_mock/stats", timeout=0.5)
+            return proc, url
+        except httpx.TransportError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError("mock PostgREST did not start")
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, ids: list, categories: list, token: str, seed: int):
+        self.client = client
+        self.ids = ids
+        self.categories = categories
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.rng = random.Random(seed)
+        self.cursors = []
+
+    async def run(self, name: str) -> httpx.Response:
+        rng = self.rng
+        get = self.client.get
+        if name == "list":
+            return await get("/api/products")
+        if name == "list_fields":
+            return await get("/api/products", params={"fields": "id,name,price,category,header_image,sizes"})
+        if name == "category":
+            return await get("/api/products", params={"category": rng.choice(self.categories)})
+        if name == "page":
+            params = {"limit": 24, "count": "true"}
+            if self.cursors and rng.random() < 0.7:
+                params["cursor"] = rng.choice(self.cursors)
+            resp = await get("/api/products", params=params)
+            cursor = resp.headers.get("x-next-cursor")
+            if cursor and len(self.cursors) < 50:
+                self.cursors.append(cursor)
+            return resp
+        if name == "product":
+            # Skewed towards a few popular products, like real traffic
+            index = min(int(rng.expovariate(1 / 20)), len(self.ids) - 1)
+            return await get(f"/api/products/{self.ids[index]}")
+        if name == "search":
+            return await get("/api/products/search", params={"q": rng.choice(SEARCH_TERMS)})
+        if name == "facets":
+            return await get("/api/products", params={"size": rng.choice(["M", "L"]), "facets": "true",
+                                                      "price_max": rng.choice([999, 1999, 2999])})
+        if name == "write":
+            product_id = rng.choice(self.ids)
+            return await self.client.patch(f"/api/admin/products/{product_id}",
+                                           json={"price": rng.randrange(199, 4999)}, headers=self.auth)
+        raise ValueError(f"unknown endpoint {name}")
+
+
+async def run_level(workload: Workload, mix: dict, concurrency: int, duration: float) -> dict:
+    names, weights = list(mix), list(mix.values())
+    samples = defaultdict(list)  # (endpoint, cache) -> [ms]
+    errors = defaultdict(int)
+    stop_at = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < stop_at:
+            name = workload.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                resp = await workload.run(name)
+                ok = resp.status_code < 500
+                cache = resp.headers.get("x-cache", "-")
+            except httpx.HTTPError:
+                ok, cache = False, "-"
+            elapsed = (time.perf_counter() - started) * 1000
+            if ok:
+                samples[(name, cache)].append(elapsed)
+            else:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    total = sum(len(v) for v in samples.values())
+    endpoints = {}
+    for (name, cache), values in sorted(samples.items()):
+        endpoints[f"{name} [{cache}]"] = {
+            "n": len(values),
+            "p50": round(percentile(values, 0.50), 2),
+            "p95": round(percentile(values, 0.95), 2),
+            "p99": round(percentile(values, 0.99), 2),
+        }
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": round(total / wall, 1),
+        "errors": dict(errors),
+        "endpoints": endpoints,
+    }
+
+
+def print_level(result: dict, upstream_calls: int):
+    print(f"\n── concurrency {result['concurrency']}: {result['rps']} req/s, "
+          f"{result['requests']} requests, {upstream_calls} upstream calls, errors {result['errors'] or 0}")
+    print(f"  {'endpoint [cache]':<28}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in result["endpoints"].items():
+        print(f"  {name:<28}{stats['n']:>7}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}")
+
+
+def compare(report: dict, baseline_path: str, tolerance: float) -> list:
+    """p95 regressions against the last stored run with the same settings."""
+    if not os.path.exists(baseline_path):
+        return []
+    previous = None
+    with open(baseline_path) as f:
+        for line in f:
+            run = json.loads(line)
+            if run.get("settings") == report["settings"]:
+                previous = run
+    if previous is None:
+        return []
+    regressions = []
+    before = {level["concurrency"]: level for level in previous["levels"]}
+    for level in report["levels"]:
+        old = before.get(level["concurrency"])
+        if not old:
+            continue
+        for name, stats in level["endpoints"].items():
+            was = old["endpoints"].get(name)
+            if was and was["n"] >= 20 and stats["p95"] > was["p95"] * (1 + tolerance) and stats["p95"] - was["p95"] > 1:
+                regressions.append(f"c={level['concurrency']} {name}: p95 {was['p95']} -> {stats['p95']} ms")
+        if level["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"c={level['concurrency']}: throughput {old['rps']} -> {level['rps']} req/s")
+    return regressions
+
+
+async def bench(args):
+    proc, mock_url = start_mock(args)
+    try:
+        os.environ.update({
+            "SUPABASE_URL": mock_url,
+            "SUPABASE_KEY": "bench",
+            "ADMIN_PASSWORD": "bench-admin",
+            "SHARED_CACHE": "1" if args.shared_cache else "0",
+            "SHARED_CACHE_PATH": os.path.join(tempfile.mkdtemp(), "bench-cache.db"),
+            "READ_REPLICA": "0",
+            "RATE_LIMIT": "0",  # every request comes from one client here
+        })
+        sys.path.insert(0, HERE)
+        import main
+
+        mix = parse_mix(args.mix)
+        levels = []
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=30) as client:
+                for _ in range(300):  # wait for warm-up
+                    if (await client.get("/ready")).status_code == 200:
+                        break
+                    await asyncio.sleep(0.05)
+                rows = (await client.get("/api/products", params={"fields": "id,category"})).json()
+                ids = [r["id"] for r in rows]
+                categories = sorted({r["category"] for r in rows})
+                workload = Workload(client, ids, categories, "bench-admin", args.seed)
+                async with httpx.AsyncClient(base_url=mock_url) as mock:
+                    for concurrency in args.concurrency:
+                        await mock.delete("/_mock/stats")
+                        result = await run_level(workload, mix, concurrency, args.duration)
+                        result["upstream_calls"] = (await mock.get("/_mock/stats")).json()["requests"]
+                        print_level(result, result["upstream_calls"])
+                        levels.append(result)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    report = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            "rows": args.rows, "latency_ms": args.latency, "jitter_ms": args.jitter,
+            "duration_s": args.duration, "mix": args.mix, "shared_cache": args.shared_cache,
+        },
+        "levels": levels,
+    }
+    regressions = compare(report, args.baseline, args.tolerance) if args.baseline else []
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    if regressions:
+        print("\nRegressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=20.0, help="mock upstream latency, ms")
+    parser.add_argument("--jitter", type=float, default=5.0, help="± ms around --latency")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 16, 64])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,... (%(default)s)")
+    parser.add_argument("--shared-cache", action="store_true", help="enable the cross-worker cache tier")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="append results as one JSON line to this file")
+    parser.add_argument("--baseline", help="JSONL file of earlier runs to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 / throughput regression")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(bench(args)))
+
+
+if __name__ == "__main__":
+    main()
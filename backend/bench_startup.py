@@ -0,0 +1,103 @@
+"""Startup benchmark: how long `import main` takes, and how long a fresh
+server takes to accept connections (/health) and to finish warming up
+(/ready).
+
+    python bench_startup.py                 # against SUPABASE_URL from .env
+    python bench_startup.py --runs 5 --out bench_results/startup.jsonl
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(runs: int) -> list:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_ready(timeout: float, env: dict) -> dict:
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {"listening": None, "ready": None, "warmup": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - started < timeout:
+                try:
+                    if result["listening"] is None:
+                        client.get("/health")
+                        result["listening"] = time.perf_counter() - started
+                    resp = client.get("/ready")
+                    if resp.status_code == 200:
+                        result["ready"] = time.perf_counter() - started
+                        result["warmup"] = resp.json()
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for /ready")
+    parser.add_argument("--out", help="append the results as one JSON line to this file")
+    args = parser.parse_args()
+
+    env = {**os.environ, "SHARED_CACHE": os.getenv("SHARED_CACHE", "0")}
+    imports = measure_import(args.runs)
+    readies = [measure_ready(args.timeout, env) for _ in range(args.runs)]
+
+    def median(key):
+        values = [r[key] for r in readies if r[key] is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    report = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import_s": round(statistics.median(imports), 3),
+        "listening_s": median("listening"),
+        "ready_s": median("ready"),
+        "warmup": readies[-1]["warmup"],
+    }
+    print(f"import main      {report['import_s']:.3f}s (median of {args.runs})")
+    print(f"accepting conns  {report['listening_s']}s")
+    print(f"ready            {report['ready_s']}s")
+    if report["warmup"]:
+        print(f"warm-up          {report['warmup']}")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import csv
+import json
+import math
+import uuid
+from datetime import datetime
+
+# ──────────────────────────────────────────
+# BULK IMPORT: STREAMING PARSE + ROW VALIDATION
+# ──────────────────────────────────────────
+
+class RowError(ValueError):
+    pass
+
+
+async def iter_lines(chunks):
+    """Split an async stream of byte chunks into byte lines without holding
+    more than one partial line in memory."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def decode_line(line: bytes) -> str:
+    try:
+        return line.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError as e:
+        raise RowError(f"invalid UTF-8 at byte {e.start}")
+
+
+async def iter_ndjson(chunks):
+    """Yield (line_number, dict or RowError) for each non-empty line."""
+    number = 0
+    async for raw in iter_lines(chunks):
+        number += 1
+        try:
+            line = decode_line(raw)
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise RowError("expected a JSON object")
+            yield number, record
+        except ValueError as e:
+            yield number, RowError(str(e))
+
+
+async def iter_csv(chunks):
+    """Yield (line_number, dict or RowError) per CSV record; the first
+    record is the header. Quoted fields may span lines."""
+    header = None
+    record_lines, start, bad = [], 0, None
+    number = 0
+    async for raw in iter_lines(chunks):
+        number += 1
+        if not record_lines:
+            start, bad = number, None
+        try:
+            line = decode_line(raw)
+        except RowError as e:
+            # Keep reading to the end of the record, then report it
+            bad = bad or e
+            line = raw.decode("utf-8-sig", "replace").rstrip("\r")
+        record_lines.append(line)
+        text = "\n".join(record_lines)
+        if text.count('"') % 2:
+            continue  # inside a quoted field, keep reading
+        record_lines = []
+        if not text.strip():
+            continue
+        if bad:
+            yield start, bad
+            if header is None:
+                return  # no trustworthy header, so no rows either
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield start, RowError(str(e))
+            continue
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        if len(values) != len(header):
+            yield start, RowError(f"expected {len(header)} columns, got {len(values)}")
+            continue
+        yield start, {k: v for k, v in zip(header, values) if k}
+    if record_lines:
+        yield start, RowError("unterminated quoted field")
+
+
+def _as_json(value, kind, field):
+    if isinstance(value, kind):
+        return value
+    if value is None or value == "":
+        return kind()
+    if isinstance(value, str):
+        text = value.strip()
+        if kind is list and not text.startswith("["):
+            # CSV-friendly "M|L|XL"
+            return [part.strip() for part in text.split("|") if part.strip()]
+        try:
+            parsed = json.loads(text)
+        except ValueError:
+            raise RowError(f"{field}: invalid JSON")
+        if isinstance(parsed, kind):
+            return parsed
+    raise RowError(f"{field}: expected {'a list' if kind is list else 'an object'}")
+
+
+def _as_float(value, field, default=None):
+    if value is None or value == "":
+        if default is None:
+            raise RowError(f"{field}: required")
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field}: not a number")
+    # "nan", "inf" or a JSON NaN literal: Supabase can't be sent them
+    if not math.isfinite(number):
+        raise RowError(f"{field}: not a finite number")
+    return number
+
+
+# Optional columns and how to read them; the empty value gives the admin
+# form's default
+COLUMNS = {
+    "category": lambda value: str(value or "shirts"),
+    "description": lambda value: str(value or ""),
+    "header_image": lambda value: str(value or ""),
+    "images": lambda value: [str(i) for i in _as_json(value, list, "images")],
+    "video_url": lambda value: str(value or ""),
+    "measurements": lambda value: _as_json(value, dict, "measurements"),
+    "color": lambda value: str(value or ""),
+    "sizes": lambda value: [str(s) for s in _as_json(value, list, "sizes")],
+    "condition": lambda value: str(value or "Good"),
+    "coupon_code": lambda value: str(value or ""),
+    "discount_amount": lambda value: _as_float(value, "discount_amount", 0.0),
+}
+
+
+def validate_row(raw: dict) -> dict:
+    """Turn one imported record into a products row. Rows without an id are
+    new and get every column, with the admin form's defaults; rows with one
+    are upserted with only the columns they carry, so an import never
+    blanks what it leaves out."""
+    name = str(raw.get("name") or "").strip()
+    if not name:
+        raise RowError("name: required")
+    new = not raw.get("id")
+    row = {
+        "id": str(raw.get("id") or uuid.uuid4()),
+        "name": name,
+        "price": _as_float(raw.get("price"), "price"),
+    }
+    if row["price"] < 0:
+        raise RowError("price: must not be negative")
+    for column, read in COLUMNS.items():
+        if new or column in raw:
+            row[column] = read(raw.get(column))
+    header_image = row.get("header_image")
+    if header_image and "images" in row and header_image not in row["images"]:
+        row["images"].insert(0, header_image)
+    if raw.get("created_at"):
+        row["created_at"] = str(raw["created_at"])
+    elif new:
+        row["created_at"] = datetime.now().isoformat()
+    return row
@@ -0,0 +1,136 @@
+import copy
+import time
+import asyncio
+from typing import Optional
+
+# ──────────────────────────────────────────
+# IN-MEMORY CATALOG
+# ──────────────────────────────────────────
+#
+# The full product table held in memory, plus derived indexes (search,
+# facets, ...) that are kept in step with it. An index is any object with
+#
+#   rebuild(products: list)          full snapshot replaced
+#   upsert(product: dict, old)       one product added or changed
+#   remove(product_id: str, old)     one product deleted
+#
+# `old` is the previous version of the product, or None. An index may also
+# define
+#
+#   apply(upserts: list, removals: list)   (product, old) and (product_id, old)
+#                                          pairs from one batch
+#
+# to do its expensive work once per batch instead of once per row.
+#
+# Rebuilding every index takes seconds on a large catalog, so replace_async()
+# and big apply_async() batches rebuild copies of the indexes in a worker
+# thread while requests keep reading the current ones, then switch over in
+# one step on the event loop. Changes made meanwhile are replayed on top.
+
+# Batches up to this size are applied in place, on the event loop
+INLINE_BATCH = 100
+
+
+def _rebuild_all(indexes: list, snapshot: list):
+    for index in indexes:
+        index.rebuild(snapshot)
+
+
+class Catalog:
+    def __init__(self):
+        self.products: dict = {}
+        self.indexes: list = []
+        self.version = 0
+        self.loaded = False
+        self.synced_at: Optional[float] = None  # monotonic time of the last full load
+        self._pending: Optional[list] = None  # batches applied during an off-loop rebuild
+        self._rebuilding = asyncio.Lock()
+
+    def register(self, index):
+        self.indexes.append(index)
+        if self.loaded:
+            index.rebuild(list(self.products.values()))
+        return index
+
+    def replace(self, rows: list):
+        self.products = {row["id"]: row for row in rows}
+        self.version += 1
+        self.loaded = True
+        self.synced_at = time.monotonic()
+        snapshot = list(self.products.values())
+        for index in self.indexes:
+            index.rebuild(snapshot)
+
+    async def replace_async(self, rows: list):
+        """replace(), with the indexes rebuilt off the event loop."""
+        await self._rebuild_async(rows, full=True)
+
+    def upsert(self, row: dict):
+        self.apply([row])
+
+    def remove(self, product_id: str):
+        self.apply(removed=[product_id])
+
+    def apply(self, rows=(), removed=()):
+        """Upsert `rows`, then remove the ids in `removed`, as one batch."""
+        if not self.loaded:
+            return
+        upserts, removals = [], []
+        for row in rows:
+            upserts.append((row, self.products.get(row["id"])))
+            self.products[row["id"]] = row
+        for product_id in removed:
+            old = self.products.pop(product_id, None)
+            if old is not None:
+                removals.append((product_id, old))
+        if not upserts and not removals:
+            return
+        if self._pending is not None:
+            self._pending.append((list(rows), list(removed)))
+        self.version += 1
+        for index in self.indexes:
+            if hasattr(index, "apply"):
+                index.apply(upserts, removals)
+                continue
+            for row, old in upserts:
+                index.upsert(row, old)
+            for product_id, old in removals:
+                index.remove(product_id, old)
+
+    async def apply_async(self, rows=(), removed=()):
+        """apply(), rebuilding the indexes off the event loop instead when
+        the batch is bigger than INLINE_BATCH."""
+        if not self.loaded:
+            return
+        if len(rows) + len(removed) <= INLINE_BATCH:
+            self.apply(rows, removed)
+            return
+        await self._rebuild_async(rows, removed, full=False)
+
+    async def _rebuild_async(self, rows, removed=(), full: bool = False):
+        async with self._rebuilding:
+            products = {} if full else dict(self.products)
+            products.update((row["id"], row) for row in rows)
+            for product_id in removed:
+                products.pop(product_id, None)
+            # Each rebuild() starts from __init__, so a shallow copy shares
+            # nothing it will modify with the index requests are reading
+            fresh = [copy.copy(index) for index in self.indexes]
+            self._pending = []
+            try:
+                await asyncio.to_thread(_rebuild_all, fresh, list(products.values()))
+            finally:
+                pending, self._pending = self._pending, None
+            self.products = products
+            for index, built in zip(self.indexes, fresh):
+                # In place, so everyone holding the index sees the new one
+                vars(index).update(vars(built))
+            self.version += 1
+            if full:
+                self.loaded = True
+                self.synced_at = time.monotonic()
+            for rows, removed in pending:
+                self.apply(rows, removed)
+
+    def get(self, product_id: str) -> Optional[dict]:
+        return self.products.get(product_id)
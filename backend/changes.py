@@ -0,0 +1,220 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+
+import upstream
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+#
+# Delta sync: instead of re-reading the whole products table when a cache
+# entry expires, poll for rows whose updated_at moved past a high-water mark
+# plus tombstones for deleted ids (see supabase_setup.sql), and patch the
+# local copies. Upstream traffic then follows the write rate, not reads.
+
+CHANGE_SYNC_ENABLED = os.getenv("CHANGE_SYNC", "1") == "1"
+CHANGE_SYNC_INTERVAL = float(os.getenv("CHANGE_SYNC_INTERVAL", "5"))  # seconds
+CHANGE_PAGE_SIZE = 1000
+# Re-read this far behind the mark every poll: updated_at is set when a
+# transaction starts, so a slow one can commit "in the past"
+CHANGE_OVERLAP = timedelta(seconds=float(os.getenv("CHANGE_OVERLAP", "5")))
+EPOCH = "1970-01-01T00:00:00+00:00"
+
+
+def _parse(ts: str) -> datetime:
+    value = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _later(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if not a or not b:
+        return a or b
+    return a if _parse(a) >= _parse(b) else b
+
+
+def newest(rows: list) -> Optional[str]:
+    mark = None
+    for row in rows:
+        mark = _later(mark, row.get("updated_at"))
+    return mark
+
+
+class ChangesUnsupported(Exception):
+    """The source lacks the schema deltas need (the updated_at column or
+    the tombstones table), so they can't be trusted."""
+
+
+# PostgREST / Postgres codes for a table or column that isn't there
+_SCHEMA_MISSING = {"42P01", "42703", "PGRST200", "PGRST204", "PGRST205"}
+
+
+def _schema_missing(resp) -> bool:
+    if resp.status_code not in (400, 404):
+        return False
+    try:
+        code = resp.json().get("code")
+    except (ValueError, AttributeError):
+        code = None
+    # A bare 404 is PostgREST's answer for an unknown table
+    return code in _SCHEMA_MISSING or (resp.status_code == 404 and code is None)
+
+
+# ──────────────────────────────────────────
+# SOURCES
+# ──────────────────────────────────────────
+#
+# A source answers changes(since) -> (rows, tombstones): rows updated and
+# (id, deleted_at) pairs deleted at or after `since`, oldest first.
+
+class SupabaseChanges:
+    def __init__(self, base_url, headers):
+        # Both callables, read per request so config changes are picked up
+        self.base_url = base_url
+        self.headers = headers
+
+    async def _pages(self, table: str, column: str, key: str, since: str, select: str) -> list:
+        client = upstream.get_client()
+        url = f"{self.base_url()}/rest/v1/{table}"
+        found, after = [], None
+        while True:
+            params = [("select", select), ("order", f"{column}.asc,{key}.asc"), ("limit", str(CHANGE_PAGE_SIZE))]
+            if after is None:
+                params.append((column, f'gte."{since}"'))
+            else:
+                # keyset: (column, key) > last row seen
+                params.append(("or", f'({column}.gt."{after[0]}",and({column}.eq."{after[0]}",{key}.gt."{after[1]}"))'))
+            resp = await client.get(url, params=params, headers=self.headers())
+            if _schema_missing(resp):
+                raise ChangesUnsupported(f"{table}.{column} is missing; run supabase_setup.sql ({resp.text[:200]})")
+            if resp.status_code != 200:
+                raise upstream.UpstreamError(resp)
+            page = resp.json()
+            found += page
+            if len(page) < CHANGE_PAGE_SIZE:
+                return found
+            after = (page[-1][column], page[-1][key])
+
+    async def changes(self, since: str):
+        rows = await self._pages("products", "updated_at", "id", since, "*")
+        tombstones = await self._pages("product_tombstones", "deleted_at", "id", since, "id,deleted_at")
+        return rows, [(t["id"], t["deleted_at"]) for t in tombstones]
+
+
+class LocalChanges:
+    """In-memory stand-in for Supabase with the same change semantics, for
+    exercising the sync engine offline."""
+
+    def __init__(self, rows=()):
+        self.rows: dict = {}
+        self.tombstones: dict = {}  # id -> deleted_at
+        for row in rows:
+            self.put(row)
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def put(self, row: dict) -> dict:
+        row = {**self.rows.get(row["id"], {}), **row, "updated_at": self._now()}
+        row["version"] = self.rows.get(row["id"], {}).get("version", 0) + 1
+        self.rows[row["id"]] = row
+        return row
+
+    def delete(self, product_id: str):
+        if self.rows.pop(product_id, None) is not None:
+            self.tombstones[product_id] = self._now()
+
+    async def changes(self, since: str):
+        floor = _parse(since)
+        rows = sorted((r for r in self.rows.values() if _parse(r["updated_at"]) >= floor),
+                      key=lambda r: (_parse(r["updated_at"]), r["id"]))
+        tombstones = sorted(((pid, at) for pid, at in self.tombstones.items() if _parse(at) >= floor),
+                            key=lambda t: (_parse(t[1]), t[0]))
+        return rows, tombstones
+
+
+# ──────────────────────────────────────────
+# FEED
+# ──────────────────────────────────────────
+
+class ChangeFeed:
+    def __init__(self, source, interval: float = CHANGE_SYNC_INTERVAL):
+        self.source = source
+        self.interval = interval
+        self.mark: Optional[str] = None  # newest updated_at / deleted_at applied
+        self.last_success = 0.0
+        self.supported = True
+        self.polls = 0
+        self.rows_seen = 0
+        self._wake = asyncio.Event()
+
+    def seed(self, mark: Optional[str]):
+        """Start from a full snapshot the caller just loaded, whose newest
+        updated_at is `mark` (None for an empty table)."""
+        self.mark = mark or EPOCH
+        self.last_success = time.monotonic()
+
+    def wake(self):
+        """Poll now instead of at the next interval (pushed notification)."""
+        self._wake.set()
+
+    async def wait(self):
+        try:
+            await asyncio.wait_for(self._wake.wait(), self.interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    @property
+    def current(self) -> bool:
+        """True while the local copy is known to be at most a few polls old."""
+        return (self.supported and self.mark is not None
+                and time.monotonic() - self.last_success < self.interval * 3)
+
+    async def poll(self):
+        """Changes since the mark as (rows, deleted_ids), with each id's
+        latest event winning; advances the mark."""
+        since = (_parse(self.mark) - CHANGE_OVERLAP).isoformat()
+        try:
+            rows, tombstones = await self.source.changes(since)
+        except ChangesUnsupported as e:
+            self.supported = False
+            print(f"Change feed disabled: {e}")
+            raise
+        self.polls += 1
+        self.rows_seen += len(rows) + len(tombstones)
+
+        latest = {}  # id -> (timestamp, row or None)
+        mark = self.mark
+        for row in rows:
+            at = _parse(row["updated_at"])
+            if row["id"] not in latest or at >= latest[row["id"]][0]:
+                latest[row["id"]] = (at, row)
+            mark = _later(mark, row["updated_at"])
+        for product_id, deleted_at in tombstones:
+            at = _parse(deleted_at)
+            if product_id not in latest or at >= latest[product_id][0]:
+                latest[product_id] = (at, None)
+            mark = _later(mark, deleted_at)
+        self.mark = mark
+        self.last_success = time.monotonic()
+
+        upserts = [row for _, row in latest.values() if row is not None]
+        deleted = [pid for pid, (_, row) in latest.items() if row is None]
+        return upserts, deleted
+
+    def stats(self) -> dict:
+        return {
+            "mark": self.mark,
+            "current": self.current,
+            "supported": self.supported,
+            "polls": self.polls,
+            "rows_seen": self.rows_seen,
+        }
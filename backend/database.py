@@ -1,10 +1,11 @@
 import os
 import json
 import uuid
-import requests
 from datetime import datetime
 from dotenv import load_dotenv
 
+import upstream
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -20,15 +21,18 @@ def get_headers():
         "Prefer": "return=representation"
     }
 
-def init_db():
+async def init_db() -> bool:
+    """Seed an empty products table through the shared async client.
+    Returns True when Supabase answered (whether or not it needed seeding)."""
     try:
         if not SUPABASE_URL or not SUPABASE_KEY:
             print("WARNING: Missing Supabase credentials. Seed skipped.")
-            return
+            return False
 
         # Check if table has data via REST
         endpoint = f"{SUPABASE_URL}/rest/v1/products?select=id&limit=1"
-        response = requests.get(endpoint, headers=get_headers())
+        client = upstream.get_client()
+        response = await client.get(endpoint, headers=get_headers())
         
         if response.status_code == 200 and len(response.json()) == 0:
             print("Seeding Supabase with default products via REST API...")
@@ -116,7 +120,7 @@ def init_db():
                 },
             ]
             
-            insert_resp = requests.post(
+            insert_resp = await client.post(
                 f"{SUPABASE_URL}/rest/v1/products", 
                 headers=get_headers(), 
                 json=seed_products
@@ -126,6 +130,8 @@ def init_db():
                 print("Successfully seeded.")
             else:
                 print(f"Failed to seed: {insert_resp.text}")
-            
+
+        return response.status_code == 200
     except Exception as e:
         print(f"Warning: Could not initialize Supabase database (Ignore this error if the table hasn't been created yet): {e}")
+        return False
@@ -0,0 +1,238 @@
+import re
+import bisect
+from collections import defaultdict
+from typing import Optional
+
+# ──────────────────────────────────────────
+# FACETED FILTERING
+# ──────────────────────────────────────────
+#
+# Every product gets a slot number; each facet value keeps a bitset (a
+# Python int) of the slots that carry it. A filter is a handful of ANDs and
+# ORs over those ints, and a facet count is one popcount. Price and
+# measurements are kept as sorted (value, slot) arrays for range queries.
+
+FACETS = ("category", "size", "color", "condition")
+
+# Colour words we fold shop colour names ("Red Plaid", "Ice Blue",
+# "Black / Flame") onto; anything else is left out of the colour facet
+COLOR_ALIASES = {
+    "black": "black", "white": "white", "cream": "white", "ivory": "white", "offwhite": "white",
+    "grey": "grey", "gray": "grey", "charcoal": "grey", "silver": "grey",
+    "red": "red", "maroon": "red", "burgundy": "red", "wine": "red", "crimson": "red",
+    "pink": "pink", "rose": "pink", "orange": "orange", "rust": "orange",
+    "yellow": "yellow", "mustard": "yellow", "gold": "yellow",
+    "green": "green", "olive": "green", "khaki": "green", "mint": "green", "sage": "green",
+    "blue": "blue", "navy": "blue", "denim": "blue", "indigo": "blue", "teal": "blue",
+    "purple": "purple", "violet": "purple", "lavender": "purple", "lilac": "purple",
+    "brown": "brown", "tan": "brown", "beige": "brown", "camel": "brown", "chocolate": "brown",
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def normalize_colors(color) -> set:
+    return {COLOR_ALIASES[w] for w in _WORD_RE.findall(str(color or "").lower()) if w in COLOR_ALIASES}
+
+
+def normalize_sizes(sizes) -> set:
+    if not isinstance(sizes, list):
+        return set()
+    return {str(s).strip().upper() for s in sizes if str(s).strip()}
+
+
+def parse_measure(value) -> Optional[float]:
+    """'48 in' -> 48.0; None when there is no number in it."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value or ""))
+    return float(match.group()) if match else None
+
+
+def facet_values(product: dict) -> dict:
+    category = str(product.get("category") or "").strip().lower()
+    condition = str(product.get("condition") or "").strip().lower()
+    return {
+        "category": {category} if category else set(),
+        "size": normalize_sizes(product.get("sizes")),
+        "color": normalize_colors(product.get("color")),
+        "condition": {condition} if condition else set(),
+    }
+
+
+def _mask_of(slots) -> int:
+    """Bitset with the given slots set, built in one pass instead of one
+    big-int OR per slot."""
+    slots = list(slots)
+    if not slots:
+        return 0
+    buf = bytearray(max(slots) // 8 + 1)
+    for slot in slots:
+        buf[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _slots_of(mask: int) -> list:
+    # bin() runs in C, so scanning its string beats peeling bits off a big int
+    bits = bin(mask)[:1:-1]
+    slots = []
+    i = bits.find("1")
+    while i != -1:
+        slots.append(i)
+        i = bits.find("1", i + 1)
+    return slots
+
+
+class FacetIndex:
+    def __init__(self):
+        self._slot_of: dict = {}  # product_id -> slot
+        self._id_at: list = []  # slot -> product_id (None when free)
+        self._free: list = []
+        self._all = 0
+        self._bits = {facet: defaultdict(int) for facet in FACETS}
+        self._values: dict = {}  # product_id -> facet_values()
+        self._prices: list = []  # sorted (price, slot)
+        self._measures: dict = defaultdict(list)  # key -> sorted (value, slot)
+        self._ranged: dict = {}  # product_id -> [(array, entry)] to undo on removal
+
+    # ── Catalog index hooks ──
+
+    def rebuild(self, products: list):
+        self.__init__()
+        members = {facet: defaultdict(list) for facet in FACETS}
+        for product in products:
+            slot = self._add(product, bulk=True)
+            for facet, facet_vals in self._values[product["id"]].items():
+                for value in facet_vals:
+                    members[facet][value].append(slot)
+        for facet, by_value in members.items():
+            for value, slots in by_value.items():
+                self._bits[facet][value] = _mask_of(slots)
+        self._all = _mask_of(range(len(self._id_at)))
+        self._prices.sort()
+        for values in self._measures.values():
+            values.sort()
+
+    def upsert(self, product: dict, old=None):
+        self._remove(product["id"])
+        self._add(product)
+
+    def remove(self, product_id: str, old=None):
+        self._remove(product_id)
+
+    # ── internals ──
+
+    def _add(self, product: dict, bulk: bool = False):
+        product_id = product["id"]
+        slot = self._free.pop() if self._free else len(self._id_at)
+        if slot == len(self._id_at):
+            self._id_at.append(product_id)
+        else:
+            self._id_at[slot] = product_id
+        self._slot_of[product_id] = slot
+        values = facet_values(product)
+        self._values[product_id] = values
+        if not bulk:
+            # rebuild() sets all the bitsets at once afterwards
+            bit = 1 << slot
+            self._all |= bit
+            for facet, facet_vals in values.items():
+                for value in facet_vals:
+                    self._bits[facet][value] |= bit
+
+        ranged = []
+        price = parse_measure(product.get("price"))
+        if price is not None:
+            ranged.append((self._prices, (price, slot)))
+        measurements = product.get("measurements")
+        if isinstance(measurements, dict):
+            for key, raw in measurements.items():
+                value = parse_measure(raw)
+                if value is not None:
+                    ranged.append((self._measures[key.strip().lower()], (value, slot)))
+        for array, entry in ranged:
+            if bulk:
+                array.append(entry)
+            else:
+                bisect.insort(array, entry)
+        self._ranged[product_id] = ranged
+        return slot
+
+    def _remove(self, product_id: str):
+        slot = self._slot_of.pop(product_id, None)
+        if slot is None:
+            return
+        bit = 1 << slot
+        self._all &= ~bit
+        for facet, facet_vals in self._values.pop(product_id).items():
+            for value in facet_vals:
+                remaining = self._bits[facet][value] & ~bit
+                if remaining:
+                    self._bits[facet][value] = remaining
+                else:
+                    del self._bits[facet][value]
+        for array, entry in self._ranged.pop(product_id):
+            i = bisect.bisect_left(array, entry)
+            if i < len(array) and array[i] == entry:
+                del array[i]
+        self._id_at[slot] = None
+        self._free.append(slot)
+
+    @staticmethod
+    def _range_mask(array: list, low: Optional[float], high: Optional[float]) -> int:
+        start = bisect.bisect_left(array, (low, -1)) if low is not None else 0
+        end = bisect.bisect_right(array, (high, float("inf"))) if high is not None else len(array)
+        return _mask_of(slot for _, slot in array[start:end])
+
+    # ── querying ──
+
+    def _facet_masks(self, filters: dict) -> dict:
+        """facet -> OR of the selected values' bitsets."""
+        masks = {}
+        for facet, wanted in filters.items():
+            if wanted:
+                bits = self._bits[facet]
+                mask = 0
+                for value in wanted:
+                    mask |= bits.get(value, 0)
+                masks[facet] = mask
+        return masks
+
+    def _range_filter(self, price_min=None, price_max=None, measures: Optional[dict] = None) -> int:
+        mask = self._all
+        if price_min is not None or price_max is not None:
+            mask &= self._range_mask(self._prices, price_min, price_max)
+        for key, (low, high) in (measures or {}).items():
+            mask &= self._range_mask(self._measures.get(key, []), low, high)
+        return mask
+
+    def query(self, filters: dict, price_min=None, price_max=None,
+              measures: Optional[dict] = None, with_counts: bool = False):
+        """Returns (matching product ids, facet counts or None).
+
+        `filters` maps a facet to the normalised values wanted (OR within a
+        facet, AND across facets). Counts for a facet ignore that facet's
+        own selection, so shoppers can see what else they could pick.
+        """
+        base = self._range_filter(price_min, price_max, measures)
+        masks = self._facet_masks(filters)
+        mask = base
+        for facet_mask in masks.values():
+            mask &= facet_mask
+        ids = [self._id_at[slot] for slot in _slots_of(mask)]
+        if not with_counts:
+            return ids, None
+
+        counts = {}
+        for facet in FACETS:
+            others = base
+            for other, facet_mask in masks.items():
+                if other != facet:
+                    others &= facet_mask
+            counts[facet] = {
+                value: n
+                for value, bits in sorted(self._bits[facet].items())
+                if (n := (bits & others).bit_count())
+            }
+        return ids, counts
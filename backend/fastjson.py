@@ -0,0 +1,36 @@
+import json
+
+from starlette.responses import JSONResponse
+
+# ──────────────────────────────────────────
+# JSON ENCODING
+# ──────────────────────────────────────────
+#
+# orjson when it is installed: several times faster than the json module
+# on product rows, and it writes UTF-8 directly. Output is the same compact
+# JSON either way; types JSON has no form for are written as str().
+
+try:
+    import orjson
+except ImportError:  # optional, the json module still works
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps(). Returned directly from a route,
+    it also skips FastAPI's jsonable_encoder pass over the content."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
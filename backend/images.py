@@ -0,0 +1,194 @@
+import io
+import os
+import asyncio
+import hashlib
+import tempfile
+from typing import Optional
+
+import aiofiles
+from dotenv import load_dotenv
+
+import upstream
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+
+STORAGE_BUCKET = os.getenv("STORAGE_BUCKET", "product-image")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv("IMAGE_UPLOAD_CONCURRENCY", "8"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(25 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = 50_000_000
+CHUNK_SIZE = 1024 * 1024
+
+# name -> longest edge in pixels; images are only ever scaled down
+VARIANTS = {"thumb": 200, "card": 640, "full": 1600}
+FORMATS = {"webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+           "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True})}
+
+
+class ImageError(ValueError):
+    pass
+
+
+# ──────────────────────────────────────────
+# RENDERING (runs in worker processes)
+# ──────────────────────────────────────────
+
+def render_variants(path: str) -> dict:
+    """Decode the image at `path` once and encode every variant/format.
+
+    Returns {"width", "height", "sha", "variants": {name: {"width",
+    "height", fmt: bytes}}}. Top-level so the process pool can pickle it.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    try:
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.load()
+    except Image.DecompressionBombError:
+        raise ImageError(f"more than {IMAGE_MAX_PIXELS} pixels")
+    except (UnidentifiedImageError, OSError):
+        raise ImageError("not a readable image")
+
+    with open(path, "rb") as f:
+        sha = hashlib.sha256(f.read()).hexdigest()
+
+    result = {"width": img.width, "height": img.height, "sha": sha, "variants": {}}
+    for name, edge in VARIANTS.items():
+        variant = img.copy()
+        variant.thumbnail((edge, edge), Image.LANCZOS)
+        encoded = {"width": variant.width, "height": variant.height}
+        for fmt, (pil_format, _, options) in FORMATS.items():
+            buf = io.BytesIO()
+            variant.save(buf, pil_format, **options)
+            encoded[fmt] = buf.getvalue()
+        result["variants"][name] = encoded
+    return result
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # Imported here: multiprocessing is slow to import and most
+        # processes never touch an image
+        from concurrent.futures import ProcessPoolExecutor
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ──────────────────────────────────────────
+# UPLOAD PIPELINE
+# ──────────────────────────────────────────
+
+async def spool_to_disk(upload) -> str:
+    """Copy an UploadFile to a temp file chunk by chunk; returns its path."""
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".img")
+    os.close(fd)
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise ImageError(f"larger than {IMAGE_MAX_BYTES // (1024 * 1024)} MB")
+                await out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def public_url(base_url: str, object_path: str) -> str:
+    return f"{base_url}/storage/v1/object/public/{STORAGE_BUCKET}/{object_path}"
+
+
+async def _put_object(client, base_url: str, key: str, object_path: str, body: bytes,
+                      content_type: str, limiter: asyncio.Semaphore):
+    async with limiter:
+        resp = await client.post(
+            f"{base_url}/storage/v1/object/{STORAGE_BUCKET}/{object_path}",
+            content=body,
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": content_type,
+                "Cache-Control": "max-age=31536000, immutable",
+                "x-upsert": "true",
+            },
+        )
+    if resp.status_code not in [200, 201]:
+        raise upstream.UpstreamError(resp)
+
+
+async def process_upload(upload, product_id: str, base_url: str, key: str,
+                         limiter: asyncio.Semaphore) -> dict:
+    """Spool, render (off the event loop) and upload one image; returns its
+    srcset manifest. `limiter` caps concurrent storage uploads."""
+    path = await spool_to_disk(upload)
+    try:
+        return await process_file(path, product_id, base_url, key, limiter)
+    finally:
+        os.remove(path)
+
+
+async def process_bytes(data: bytes, product_id: str, base_url: str, key: str,
+                        limiter: asyncio.Semaphore) -> dict:
+    """process_upload() for an image already in memory (e.g. generated)."""
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ImageError(f"larger than {IMAGE_MAX_BYTES // (1024 * 1024)} MB")
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".img")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return await process_file(path, product_id, base_url, key, limiter)
+    finally:
+        os.remove(path)
+
+
+async def process_file(path: str, product_id: str, base_url: str, key: str,
+                       limiter: asyncio.Semaphore) -> dict:
+    loop = asyncio.get_running_loop()
+    rendered = await loop.run_in_executor(get_pool(), render_variants, path)
+
+    # Content-addressed names: re-uploading the same photo is idempotent
+    # and the URLs can be cached forever
+    prefix = f"products/{product_id}/{rendered['sha'][:16]}"
+    client = upstream.get_client()
+    uploads = []
+    manifest = {
+        "width": rendered["width"],
+        "height": rendered["height"],
+        "variants": {},
+        "srcset": {},
+    }
+    for name, variant in rendered["variants"].items():
+        entry = {"width": variant["width"], "height": variant["height"]}
+        for fmt, (_, content_type, _) in FORMATS.items():
+            object_path = f"{prefix}-{name}.{'jpg' if fmt == 'jpeg' else fmt}"
+            entry[fmt] = public_url(base_url, object_path)
+            uploads.append(_put_object(client, base_url, key, object_path, variant[fmt], content_type, limiter))
+        manifest["variants"][name] = entry
+    await asyncio.gather(*uploads)
+
+    for fmt in FORMATS:
+        manifest["srcset"][fmt] = ", ".join(
+            f"{v[fmt]} {v['width']}w" for v in manifest["variants"].values()
+        )
+    return manifest
@@ -0,0 +1,277 @@
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+
+import images
+import metrics
+import upstream
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOADS_DIR = os.path.realpath(os.getenv("UPLOADS_DIR", os.path.join(BASE_DIR, "uploads")))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(BASE_DIR, "image_cache"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Requested widths are rounded up to one of these, so a handful of files
+# per image covers every layout and the cache can't be filled with w=1..N
+WIDTHS = (160, 320, 480, 640, 960, 1280, 1600)
+DEFAULT_WIDTH = 640
+CHUNK_SIZE = 256 * 1024
+
+
+def image_key(url: str) -> str:
+    return hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+
+def snap_width(width: Optional[int]) -> int:
+    if not width:
+        return DEFAULT_WIDTH
+    for allowed in WIDTHS:
+        if width <= allowed:
+            return allowed
+    return WIDTHS[-1]
+
+
+# ──────────────────────────────────────────
+# KNOWN SOURCES (Catalog index)
+# ──────────────────────────────────────────
+#
+# /img/{key} only serves images that some product actually references, so
+# the proxy can't be pointed at arbitrary URLs.
+
+class ImageSources:
+    def __init__(self):
+        self._url_of: dict = {}  # key -> url
+        self._refs: dict = {}  # key -> number of products using it
+        self._keys_of: dict = {}  # product_id -> set of keys
+
+    def get(self, key: str) -> Optional[str]:
+        return self._url_of.get(key)
+
+    # ── Catalog index hooks ──
+
+    def rebuild(self, products: list):
+        self.__init__()
+        for product in products:
+            self._add(product)
+
+    def upsert(self, product: dict, old=None):
+        self._remove(product["id"])
+        self._add(product)
+
+    def remove(self, product_id: str, old=None):
+        self._remove(product_id)
+
+    # ── internals ──
+
+    def _add(self, product: dict):
+        urls = set(product.get("images") or []) if isinstance(product.get("images"), list) else set()
+        if product.get("header_image"):
+            urls.add(product["header_image"])
+        keys = set()
+        for url in urls:
+            if isinstance(url, str) and url:
+                key = image_key(url)
+                self._url_of[key] = url
+                self._refs[key] = self._refs.get(key, 0) + 1
+                keys.add(key)
+        self._keys_of[product["id"]] = keys
+
+    def _remove(self, product_id: str):
+        for key in self._keys_of.pop(product_id, ()):
+            self._refs[key] -= 1
+            if not self._refs[key]:
+                del self._refs[key]
+                del self._url_of[key]
+
+
+# ──────────────────────────────────────────
+# RESIZING (runs in the image process pool)
+# ──────────────────────────────────────────
+
+def render_resized(src_path: str, out_path: str, width: int, fmt: str) -> int:
+    """Scale the image at `src_path` down to at most `width` pixels wide and
+    write it to `out_path` in `fmt`; returns the output size in bytes."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    Image.MAX_IMAGE_PIXELS = images.IMAGE_MAX_PIXELS
+    pil_format, _, options = images.FORMATS[fmt]
+    try:
+        with Image.open(src_path) as img:
+            # Let JPEG decode at a reduced scale when the target is small
+            img.draft("RGB", (width, width))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            if img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            img.save(out_path, pil_format, **options)
+    except Image.DecompressionBombError:
+        raise images.ImageError(f"more than {images.IMAGE_MAX_PIXELS} pixels")
+    except (UnidentifiedImageError, OSError):
+        raise images.ImageError("not a readable image")
+    return os.path.getsize(out_path)
+
+
+# ──────────────────────────────────────────
+# CONTENT-ADDRESSED DISK CACHE (size-bounded LRU)
+# ──────────────────────────────────────────
+#
+# Files are named after the source key plus the variant, so a path never
+# changes meaning and can be served with immutable headers. Recency is kept
+# in memory (seeded from mtimes on first use); the least recently used
+# files are deleted once the directory grows past IMAGE_CACHE_MAX_BYTES.
+
+class DiskCache:
+    def __init__(self, root: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # path -> size
+        self._bytes = 0
+        self._scan_task: Optional[asyncio.Task] = None
+        self._inflight: dict = {}  # path -> asyncio.Task
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def _scan(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if filename.startswith("."):
+                    os.remove(path)  # temp file left by a crash
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._bytes += size
+        self._evict()
+
+    def lookup(self, path: str) -> bool:
+        if path in self._entries:
+            if os.path.exists(path):
+                self._entries.move_to_end(path)
+                return True
+            # deleted by another worker's eviction
+            self._bytes -= self._entries.pop(path)
+        return False
+
+    def _add(self, path: str, size: int):
+        self._bytes -= self._entries.pop(path, 0)
+        self._entries[path] = size
+        self._bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def get_or_create(self, name: str, make) -> str:
+        """Path of cache file `name`, creating it with `await make(tmp_path)`
+        if needed. Concurrent requests for the same file share one build."""
+        if self._scan_task is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._scan_task = asyncio.create_task(asyncio.to_thread(self._scan))
+        await asyncio.shield(self._scan_task)
+        path = self.path_for(name)
+        if self.lookup(path):
+            return path
+        task = self._inflight.get(path)
+        if task is None:
+            task = asyncio.create_task(self._create(path, make))
+            self._inflight[path] = task
+            task.add_done_callback(lambda _: self._inflight.pop(path, None))
+        return await asyncio.shield(task)
+
+    async def _create(self, path: str, make) -> str:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".", dir=directory)
+        os.close(fd)
+        try:
+            await make(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._add(path, os.path.getsize(path))
+        return path
+
+    def stats(self) -> dict:
+        return {"files": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+# ──────────────────────────────────────────
+# PROXY
+# ──────────────────────────────────────────
+
+disk_cache = DiskCache()
+
+
+async def _download(url: str, tmp: str):
+    client = upstream.get_client()
+    size = 0
+    async with client.stream("GET", url, follow_redirects=True, extensions=upstream.IMAGE_LANE) as resp:
+        if resp.status_code != 200:
+            raise upstream.UpstreamError(resp)
+        with open(tmp, "wb") as out:
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                size += len(chunk)
+                if size > images.IMAGE_MAX_BYTES:
+                    raise images.ImageError("source image too large")
+                out.write(chunk)
+
+
+async def source_path(key: str, url: str) -> str:
+    """Local path of the original image: a file under UPLOADS_DIR for
+    /uploads/... URLs, otherwise a cached download."""
+    if url.startswith("/uploads/"):
+        path = os.path.realpath(os.path.join(UPLOADS_DIR, url[len("/uploads/"):]))
+        if not path.startswith(UPLOADS_DIR + os.sep) or not os.path.isfile(path):
+            raise images.ImageError("source image not found")
+        return path
+    if not url.startswith(("http://", "https://")):
+        raise images.ImageError("unsupported image URL")
+    return await disk_cache.get_or_create(f"{key}.src", lambda tmp: _download(url, tmp))
+
+
+def variant_name(key: str, width: int, fmt: str) -> str:
+    return f"{key}-w{width}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+async def resized_path(key: str, url: str, width: int, fmt: str) -> str:
+    name = variant_name(key, width, fmt)
+
+    async def make(tmp):
+        src = await source_path(key, url)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        await loop.run_in_executor(images.get_pool(), render_resized, src, tmp, width, fmt)
+        metrics.IMAGE_RENDERS.labels(fmt).observe(time.perf_counter() - started)
+
+    return await disk_cache.get_or_create(name, make)
+
+
+def cached_path(key: str, width: int, fmt: str) -> Optional[str]:
+    """Path of an already rendered variant, without consulting the catalog."""
+    path = disk_cache.path_for(variant_name(key, width, fmt))
+    return path if disk_cache.lookup(path) else None
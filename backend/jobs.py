@@ -0,0 +1,508 @@
+"""Background AI image generation.
+
+Off unless AI_JOBS=1. An admin request only adds a row to a local SQLite
+queue (AI_JOBS_PATH, under AI_JOBS_DIR) and returns the job id; a dispatcher
+task in every API process claims due jobs and runs them, so no request ever
+waits on the model. Every statement runs on the queue's own thread, never on
+the event loop.
+
+    jobs.status   queued -> running -> succeeded | failed | cancelled
+
+A running job holds a lease that its worker renews while it runs; if the
+process dies the lease lapses and the job is queued again. The limits hold
+for the whole host, whatever the number of processes, because they are
+checked in the same transaction that claims a job:
+
+    AI_JOBS_CONCURRENCY   jobs running at once
+    AI_JOBS_RATE          model calls per minute, as a token bucket holding
+                          up to AI_JOBS_BURST calls
+
+A failed attempt is retried after an exponential backoff with full jitter,
+up to AI_JOBS_MAX_ATTEMPTS; errors that retrying cannot fix (a blocked
+prompt, a missing product) fail the job at once.
+
+Providers: "gemini" (google-genai, needs GOOGLE_API_KEY) and "fake", which
+draws a placeholder locally after AI_FAKE_LATENCY seconds and fails
+AI_FAKE_FAILURE_RATE of its calls, for offline runs and tests.
+"""
+import io
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+
+AI_JOBS_ENABLED = os.getenv("AI_JOBS", "0") == "1"
+# Shared by every process on the host, and kept out of the source tree
+AI_JOBS_DIR = os.getenv("AI_JOBS_DIR", os.path.join(
+    os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share"), "dicks-and-toes"))
+AI_JOBS_PATH = os.getenv("AI_JOBS_PATH", os.path.join(AI_JOBS_DIR, "jobs.db"))
+AI_JOBS_CONCURRENCY = int(os.getenv("AI_JOBS_CONCURRENCY", "2"))
+AI_JOBS_RATE = float(os.getenv("AI_JOBS_RATE", "10"))  # model calls per minute, 0 = unlimited
+AI_JOBS_BURST = float(os.getenv("AI_JOBS_BURST", "2"))
+AI_JOBS_MAX_ATTEMPTS = int(os.getenv("AI_JOBS_MAX_ATTEMPTS", "5"))
+AI_JOBS_BACKOFF_BASE = float(os.getenv("AI_JOBS_BACKOFF_BASE", "5"))  # seconds
+AI_JOBS_BACKOFF_MAX = float(os.getenv("AI_JOBS_BACKOFF_MAX", "300"))
+AI_JOBS_TIMEOUT = float(os.getenv("AI_JOBS_TIMEOUT", "180"))  # per attempt
+AI_JOBS_RETENTION = float(os.getenv("AI_JOBS_RETENTION", str(7 * 24 * 3600)))  # finished jobs
+AI_JOBS_POLL = float(os.getenv("AI_JOBS_POLL", "1"))
+LEASE_TTL = 30.0
+
+AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini" if os.getenv("GOOGLE_API_KEY") else "fake")
+AI_IMAGE_MODEL = os.getenv("AI_IMAGE_MODEL", "gemini-2.5-flash-image")
+AI_FAKE_LATENCY = float(os.getenv("AI_FAKE_LATENCY", "2"))  # seconds
+AI_FAKE_FAILURE_RATE = float(os.getenv("AI_FAKE_FAILURE_RATE", "0"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    product_id TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_at);
+CREATE INDEX IF NOT EXISTS jobs_product ON jobs (product_id, created_at);
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+ACTIVE = ("queued", "running")
+
+
+class JobError(Exception):
+    """The job cannot succeed as asked; it fails without a retry."""
+
+
+class RetryLater(Exception):
+    """A transient failure: the attempt is retried after a backoff."""
+
+
+# ──────────────────────────────────────────
+# PROVIDERS
+# ──────────────────────────────────────────
+#
+# generate(prompt, reference, report) -> (image bytes, mime type), where
+# reference is an optional (bytes, mime type) image to work from and
+# report(progress, stage) records how far along the call is.
+
+class FakeProvider:
+    name = "fake"
+
+    def __init__(self, latency: float = AI_FAKE_LATENCY, failure_rate: float = AI_FAKE_FAILURE_RATE):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    async def generate(self, prompt: str, reference: Optional[tuple], report) -> tuple:
+        self.calls += 1
+        steps = 4
+        for step in range(steps):
+            await asyncio.sleep(self.latency / steps)
+            report(0.1 + 0.6 * (step + 1) / steps, "generating")
+        if random.random() < self.failure_rate:
+            raise RetryLater("fake provider: simulated failure")
+        return await asyncio.to_thread(self._draw, prompt, reference), "image/png"
+
+    @staticmethod
+    def _draw(prompt: str, reference: Optional[tuple]) -> bytes:
+        from PIL import Image, ImageDraw
+
+        seed = hashlib.sha256(prompt.encode()).digest()
+        img = Image.new("RGB", (1024, 1024), tuple(seed[:3]))
+        if reference:
+            with Image.open(io.BytesIO(reference[0])) as ref:
+                ref = ref.convert("RGB")
+                ref.thumbnail((640, 640))
+                img.paste(ref, ((1024 - ref.width) // 2, (1024 - ref.height) // 2))
+        ImageDraw.Draw(img).multiline_text((32, 32), "\n".join(prompt[i:i + 60] for i in range(0, 300, 60)),
+                                           fill=(255, 255, 255))
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        return buf.getvalue()
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, model: str = AI_IMAGE_MODEL):
+        # Imported here: only needed with AI_PROVIDER=gemini
+        from google import genai
+        from google.genai import errors, types
+
+        self.model = model
+        self.calls = 0
+        self._client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+        self._errors = errors
+        self._types = types
+
+    async def generate(self, prompt: str, reference: Optional[tuple], report) -> tuple:
+        types = self._types
+        contents = [prompt]
+        if reference:
+            contents.insert(0, types.Part.from_bytes(data=reference[0], mime_type=reference[1]))
+        self.calls += 1
+        report(0.1, "generating")
+        try:
+            response = await self._client.aio.models.generate_content(
+                model=self.model,
+                contents=contents,
+                config=types.GenerateContentConfig(response_modalities=["IMAGE", "TEXT"]),
+            )
+        except self._errors.APIError as e:
+            if e.code == 429 or e.code >= 500:
+                raise RetryLater(f"{self.model}: {e.code} {e.message}")
+            raise JobError(f"{self.model}: {e.code} {e.message}")
+
+        for candidate in response.candidates or []:
+            for part in (candidate.content.parts if candidate.content else None) or []:
+                if part.inline_data and part.inline_data.data:
+                    return part.inline_data.data, part.inline_data.mime_type or "image/png"
+        feedback = response.prompt_feedback
+        if feedback and feedback.block_reason:
+            raise JobError(f"prompt blocked: {feedback.block_reason}")
+        raise RetryLater("no image in the model's response")
+
+
+PROVIDERS = {"fake": FakeProvider, "gemini": GeminiProvider}
+_providers: dict = {}
+
+
+def get_provider(name: str = AI_PROVIDER):
+    if name not in _providers:
+        _providers[name] = PROVIDERS[name]()
+    return _providers[name]
+
+
+# ──────────────────────────────────────────
+# QUEUE
+# ──────────────────────────────────────────
+
+def _iso(at: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(at, timezone.utc).isoformat(timespec="seconds") if at else None
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter: anywhere up to base * 2^(attempt - 1), capped."""
+    return random.uniform(0, min(AI_JOBS_BACKOFF_MAX, AI_JOBS_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+class JobQueue:
+    def __init__(self, path: str = AI_JOBS_PATH, concurrency: int = AI_JOBS_CONCURRENCY,
+                 rate: float = AI_JOBS_RATE, burst: float = AI_JOBS_BURST):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.owner = uuid.uuid4().hex
+        self.handlers: dict = {}  # kind -> async fn(job, report) -> result dict
+        # Every statement runs on this one thread, in the order it was issued
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs")
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._wake = asyncio.Event()
+        self._running: dict = {}  # job id -> task, in this process
+        self.completed = 0
+        self.retried = 0
+
+    def close(self):
+        self._io.shutdown(wait=True)
+        self._db.close()
+
+    async def _call(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._io, functools.partial(fn, *args, **kwargs))
+
+    def register(self, kind: str, handler):
+        self.handlers[kind] = handler
+
+    # ── admin side ──
+
+    async def submit(self, kind: str, params: dict, product_id: Optional[str] = None,
+                     max_attempts: int = AI_JOBS_MAX_ATTEMPTS) -> dict:
+        if kind not in self.handlers:
+            raise JobError(f"unknown job kind {kind!r}")
+        job = await self._call(self._insert, kind, json.dumps(params), product_id, max_attempts)
+        self._wake.set()
+        return job
+
+    def _insert(self, kind: str, params: str, product_id: Optional[str], max_attempts: int) -> dict:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._db.execute(
+            """INSERT INTO jobs (id, kind, product_id, params, status, max_attempts, run_at, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)""",
+            (job_id, kind, product_id, params, max_attempts, now, now, now),
+        )
+        return self._get(job_id)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self._call(self._get, job_id)
+
+    def _get(self, job_id: str) -> Optional[dict]:
+        row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._public(row) if row else None
+
+    async def list(self, status: Optional[str] = None, product_id: Optional[str] = None, limit: int = 50) -> list:
+        return await self._call(self._list, status, product_id, limit)
+
+    def _list(self, status: Optional[str], product_id: Optional[str], limit: int) -> list:
+        where, args = [], []
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        if product_id:
+            where.append("product_id = ?")
+            args.append(product_id)
+        rows = self._db.execute(
+            f"SELECT * FROM jobs {'WHERE ' + ' AND '.join(where) if where else ''} "
+            "ORDER BY created_at DESC LIMIT ?",
+            (*args, limit),
+        ).fetchall()
+        return [self._public(row) for row in rows]
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued or running job. A job running in another process
+        stops at its next lease renewal."""
+        job = await self._call(self._cancel, job_id)
+        task = self._running.get(job_id)
+        if task:
+            task.cancel()
+        return job
+
+    def _cancel(self, job_id: str) -> Optional[dict]:
+        now = time.time()
+        self._db.execute(
+            f"""UPDATE jobs SET status = 'cancelled', finished_at = ?, updated_at = ?, owner = NULL
+                WHERE id = ? AND status IN {ACTIVE}""",
+            (now, now, job_id),
+        )
+        return self._get(job_id)
+
+    @staticmethod
+    def _public(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        for field in ("run_at", "created_at", "updated_at", "finished_at"):
+            job[field] = _iso(job[field])
+        if job["status"] != "queued":
+            job["run_at"] = None
+        del job["owner"], job["lease_until"]
+        return job
+
+    async def stats(self) -> dict:
+        counts = dict(await self._call(
+            lambda: self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        ))
+        return {"provider": AI_PROVIDER, "by_status": counts, "running_here": len(self._running),
+                "completed": self.completed, "retried": self.retried,
+                "concurrency": self.concurrency, "rate_per_minute": self.rate}
+
+    # ── claiming ──
+
+    def _take_token(self, now: float) -> float:
+        """Take one model call from the bucket; 0 if taken, else seconds
+        until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        row = self._db.execute("SELECT tokens, updated FROM buckets WHERE name = 'model'").fetchone()
+        tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate / 60)
+        if tokens < 1:
+            return (1 - tokens) * 60 / self.rate
+        self._db.execute(
+            "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES ('model', ?, ?)", (tokens - 1, now)
+        )
+        return 0.0
+
+    async def claim(self) -> tuple:
+        """(job, 0) for the next due job, now running here, or (None, seconds
+        worth waiting before asking again)."""
+        return await self._call(self._claim)
+
+    def _claim(self) -> tuple:
+        now = time.time()
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose worker stopped renewing its lease
+            db.execute(
+                """UPDATE jobs SET owner = NULL, run_at = :now, updated_at = :now,
+                       error = 'worker stopped responding',
+                       status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                       finished_at = CASE WHEN attempts >= max_attempts THEN :now END
+                   WHERE status = 'running' AND lease_until < :now""",
+                {"now": now},
+            )
+            running = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            row = db.execute(
+                "SELECT id, run_at FROM jobs WHERE status = 'queued' ORDER BY run_at, created_at LIMIT 1"
+            ).fetchone()
+            if running >= self.concurrency or row is None:
+                wait = AI_JOBS_POLL
+            elif row["run_at"] > now:
+                wait = min(row["run_at"] - now, AI_JOBS_POLL)
+            else:
+                wait = self._take_token(now)
+            if wait:
+                db.execute("COMMIT")
+                return None, wait
+            db.execute(
+                """UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?,
+                       stage = 'starting', updated_at = ?
+                   WHERE id = ?""",
+                (self.owner, now + LEASE_TTL, now, row["id"]),
+            )
+            job = db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return self._public(job), 0.0
+
+    async def _update(self, job_id: str, **fields) -> bool:
+        """Update a job this worker is running; False if it no longer is
+        (cancelled, or its lease was taken over)."""
+        return await self._call(self._write, job_id, **fields)
+
+    def _write(self, job_id: str, **fields) -> bool:
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = :{name}" for name in fields)
+        cursor = self._db.execute(
+            f"UPDATE jobs SET {columns} WHERE id = :job_id AND owner = :worker AND status = 'running'",
+            {**fields, "job_id": job_id, "worker": self.owner},
+        )
+        return cursor.rowcount > 0
+
+    def _requeue_own(self):
+        # An attempt interrupted by shutdown is not a failed one
+        now = time.time()
+        self._db.execute(
+            """UPDATE jobs SET status = 'queued', attempts = attempts - 1, owner = NULL, stage = NULL,
+                   run_at = ?, updated_at = ?
+               WHERE owner = ? AND status = 'running'""",
+            (now, now, self.owner),
+        )
+
+    # ── running ──
+
+    async def run_forever(self):
+        """Claim and start jobs while this process has free slots."""
+        last_prune = 0.0
+        try:
+            while True:
+                self._wake.clear()
+                wait = AI_JOBS_POLL
+                if len(self._running) < self.concurrency:
+                    job, wait = await self.claim()
+                    if job is not None:
+                        task = asyncio.create_task(self._execute(job))
+                        self._running[job["id"]] = task
+                        task.add_done_callback(lambda _, job_id=job["id"]: self._done(job_id))
+                        continue
+                if time.time() - last_prune > 3600:
+                    last_prune = time.time()
+                    await self.prune()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(self._running.values()):
+                task.cancel()
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+            await self._call(self._requeue_own)
+
+    def _done(self, job_id: str):
+        self._running.pop(job_id, None)
+        self._wake.set()
+
+    async def _execute(self, job: dict):
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await self._finish(job, "failed", error=f"no handler for {job['kind']!r} jobs")
+            return
+
+        def report(progress: float, stage: Optional[str] = None):
+            fields = {"progress": round(min(max(progress, 0.0), 1.0), 3), "lease_until": time.time() + LEASE_TTL}
+            if stage:
+                fields["stage"] = stage
+            # Queued behind earlier statements; the handler does not wait for it
+            self._io.submit(self._write, job["id"], **fields)
+
+        work = asyncio.ensure_future(asyncio.wait_for(handler(job, report), AI_JOBS_TIMEOUT))
+        try:
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=LEASE_TTL / 3)
+                if done:
+                    break
+                if not await self._update(job["id"], lease_until=time.time() + LEASE_TTL):
+                    work.cancel()  # cancelled from another process
+                    return
+            result = work.result()
+        except asyncio.CancelledError:
+            work.cancel()
+            raise
+        except JobError as e:
+            await self._finish(job, "failed", error=str(e))
+        except asyncio.TimeoutError:
+            await self._retry(job, f"timed out after {AI_JOBS_TIMEOUT:.0f}s")
+        except Exception as e:
+            await self._retry(job, str(e) if isinstance(e, RetryLater) else repr(e))
+        else:
+            await self._finish(job, "succeeded", result=json.dumps(result), progress=1.0)
+
+    async def _finish(self, job: dict, status: str, **fields):
+        if await self._update(job["id"], status=status, stage=None, owner=None, finished_at=time.time(), **fields):
+            self.completed += 1
+            print(f"{'✅' if status == 'succeeded' else '❌'} Job {job['id']} ({job['kind']}) {status}"
+                  + (f": {fields['error']}" if "error" in fields else ""))
+
+    async def _retry(self, job: dict, error: str):
+        if job["attempts"] >= job["max_attempts"]:
+            await self._finish(job, "failed", error=f"{error} (after {job['attempts']} attempts)")
+            return
+        delay = backoff(job["attempts"])
+        if await self._update(job["id"], status="queued", owner=None, stage="waiting to retry",
+                              run_at=time.time() + delay, error=error):
+            self.retried += 1
+            print(f"Job {job['id']} attempt {job['attempts']} failed ({error}); retrying in {delay:.1f}s")
+
+    async def prune(self, max_age: float = AI_JOBS_RETENTION):
+        await self._call(
+            self._db.execute,
+            f"DELETE FROM jobs WHERE status NOT IN {ACTIVE} AND finished_at < ?", (time.time() - max_age,),
+        )
@@ -1,15 +1,45 @@
 import os
 import uuid
 import json
+import gzip
 import time
-import httpx
+import base64
+import asyncio
+import sqlite3
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+from urllib.parse import urlencode
 
-from fastapi import FastAPI, Form, HTTPException, Depends
+import httpx
+from fastapi import FastAPI, File, Form, HTTPException, Depends, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from pydantic import ValidationError
+
+import bulk
+import changes
+import fastjson
+import images
+import imgproxy
+import jobs
+import metrics
+import ratelimit
+import replica
+import schemas
+import sharedcache
+import static_export
+import upstream
+from catalog import Catalog
+from pricing import SORTS, PriceIndex
+from related import RelatedIndex
+from search import SearchIndex
+from facets import FacetIndex, normalize_colors
 
 load_dotenv()
 
@@ -18,8 +48,57 @@ WHATSAPP_NUMBER = os.getenv("WHATSAPP_NUMBER", "919999999999")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-app = FastAPI(title="DICKS & TOES API")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled upstream client for the whole process (see upstream.py)
+    global read_replica, job_queue
+    await upstream.startup()
+    tasks = [asyncio.create_task(_sweep_cache_forever()), asyncio.create_task(_warm_up())]
+    if sharedcache.SHARED_CACHE_ENABLED:
+        try:
+            cache.shared = sharedcache.SharedCache(dumps=_shared_dumps, loads=_shared_loads)
+            tasks.append(asyncio.create_task(_follow_shared_cache_forever()))
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️  Shared cache disabled, workers will not share entries or invalidations: {e}")
+    if replica.REPLICA_ENABLED:
+        read_replica = replica.Replica()
+    if changes.CHANGE_SYNC_ENABLED or read_replica:
+        tasks.append(asyncio.create_task(_sync_changes_forever()))
+    if static_export.STATIC_EXPORT_ENABLED:
+        tasks.append(asyncio.create_task(_export_forever()))
+    job_runner = None
+    if jobs.AI_JOBS_ENABLED:
+        job_queue = jobs.JobQueue()
+        for kind in JOB_PROMPTS:
+            job_queue.register(kind, run_image_job)
+        job_runner = asyncio.create_task(job_queue.run_forever())
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        if job_runner:
+            # Puts the jobs it was running back in the queue
+            job_runner.cancel()
+            await asyncio.gather(job_runner, return_exceptions=True)
+            job_queue.close()
+            job_queue = None
+        if read_replica:
+            read_replica.close()
+            read_replica = None
+        if cache.shared:
+            cache.shared.close()
+            cache.shared = None
+        images.shutdown()
+        await upstream.shutdown()
+
+
+app = FastAPI(title="DICKS & TOES API", lifespan=lifespan, default_response_class=fastjson.FastJSONResponse)
+
+# Inside CORS, so 429s carry CORS headers and preflights are never limited
+if ratelimit.RATE_LIMIT_ENABLED:
+    app.add_middleware(ratelimit.RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -29,44 +108,440 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=600,
 )
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 security = HTTPBearer(auto_error=False)
 
 # ──────────────────────────────────────────
-# SIMPLE IN-MEMORY TTL CACHE
+# PRE-ENCODED JSON RESPONSES
+# ──────────────────────────────────────────
+#
+# Cached catalog payloads are encoded (and compressed) once when they are
+# loaded, so a cache hit is a dict lookup plus a bytes write.
+
+try:
+    import brotli
+except ImportError:  # optional, gzip still works without it
+    brotli = None
+
+
+class EncodedJSON:
+    __slots__ = ("data", "headers", "body", "gzip", "br", "etag")
+
+    def __init__(self, data, headers: Optional[dict] = None):
+        self.data = data
+        self.headers = headers or {}
+        self.body = fastjson.dumps(data)
+        self.gzip = gzip.compress(self.body, compresslevel=6)
+        self.br = brotli.compress(self.body, quality=5) if brotli else None
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=16).hexdigest() + '"'
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self.gzip) + len(self.br or b"")
+
+    def pack(self) -> bytes:
+        """Bytes for the shared cache tier; unpack() restores the payload
+        without encoding or compressing it again."""
+        lengths = [len(self.body), len(self.gzip), -1 if self.br is None else len(self.br)]
+        meta = fastjson.dumps({"headers": self.headers, "etag": self.etag, "lengths": lengths})
+        return len(meta).to_bytes(4, "big") + meta + self.body + self.gzip + (self.br or b"")
+
+    @classmethod
+    def unpack(cls, blob: bytes) -> "EncodedJSON":
+        start = 4 + int.from_bytes(blob[:4], "big")
+        meta = fastjson.loads(blob[4:start])
+        parts = []
+        for length in meta["lengths"]:
+            parts.append(None if length < 0 else bytes(blob[start:start + length]))
+            start += max(length, 0)
+        encoded = cls.__new__(cls)
+        encoded.body, encoded.gzip, encoded.br = parts
+        encoded.headers = meta["headers"]
+        encoded.etag = meta["etag"]
+        encoded.data = fastjson.loads(encoded.body)
+        return encoded
+
+
+def _shared_dumps(value) -> bytes:
+    # Tagged, so EncodedJSON payloads come back as they were stored
+    if isinstance(value, EncodedJSON):
+        return b"E" + value.pack()
+    return b"J" + fastjson.dumps(value)
+
+
+def _shared_loads(blob: bytes):
+    if blob[:1] == b"E":
+        return EncodedJSON.unpack(blob[1:])
+    return fastjson.loads(blob[1:])
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def encoded_response(request: Request, encoded: EncodedJSON) -> Response:
+    headers = {
+        **encoded.headers,
+        "ETag": encoded.etag,
+        "Cache-Control": "public, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    status = cache_status.get()
+    if status:
+        headers["X-Cache"] = status
+    headers.update(degraded_headers())
+    if _etag_matches(request.headers.get("if-none-match"), encoded.etag):
+        return Response(status_code=304, headers=headers)
+
+    accept = request.headers.get("accept-encoding", "")
+    body = encoded.body
+    if encoded.br is not None and "br" in accept:
+        body = encoded.br
+        headers["Content-Encoding"] = "br"
+    elif "gzip" in accept:
+        body = encoded.gzip
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# ──────────────────────────────────────────
+# IN-MEMORY LRU/TTL CACHE (stale-while-revalidate)
 # ──────────────────────────────────────────
+#
+#   age < TTL - REFRESH_AHEAD        fresh, served as-is
+#   age < TTL                        served, one background refresh started
+#   age < TTL + GRACE                stale, served while one refresh runs
+#   older                            miss, callers await one shared load
+#   age < HARD_EXPIRY                still served if that load fails
+#
+# Entries past HARD_EXPIRY are swept in the background; the least recently
+# used ones are evicted once MAX_ENTRIES or MAX_BYTES is exceeded.
+#
+# With `shared` set (see sharedcache.py) misses are read through the
+# host-wide tier, and deletes are broadcast to the other workers.
+#
+# get_or_load() records HIT / STALE / MISS for the current request in
+# `cache_status`, which encoded_response() sends as X-Cache. When it has to
+# fall back to an old entry because upstream failed, the entry's age goes
+# in `stale_age` (see DEGRADED MODE).
+
+_CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))  # seconds
+_CACHE_REFRESH_AHEAD = float(os.getenv("CACHE_REFRESH_AHEAD", "10"))
+_CACHE_GRACE = float(os.getenv("CACHE_GRACE", "30"))
+_CACHE_HARD_EXPIRY = float(os.getenv("CACHE_HARD_EXPIRY", "3600"))
+_CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+_CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+_CACHE_SWEEP_INTERVAL = float(os.getenv("CACHE_SWEEP_INTERVAL", "60"))
+
+
+cache_status: ContextVar[Optional[str]] = ContextVar("cache_status", default=None)
+stale_age: ContextVar[Optional[float]] = ContextVar("stale_age", default=None)
+
+
+def _sizeof(value) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, EncodedJSON):
+        return value.size
+    return len(fastjson.dumps(value))
 
-_CACHE_TTL = 60  # seconds
 
 class _Cache:
-    def __init__(self):
-        self._store: dict = {}
+    def __init__(self, max_entries: int = _CACHE_MAX_ENTRIES, max_bytes: int = _CACHE_MAX_BYTES):
+        self._store: OrderedDict = OrderedDict()
+        # key -> task loading it; invalidation drops the task so a load
+        # started before a write never stores the pre-write value
+        self._inflight: dict = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared: Optional[sharedcache.SharedCache] = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def get(self, key: str):
-        entry = self._store.get(key)
-        if entry and (time.monotonic() - entry["ts"]) < _CACHE_TTL:
-            return entry["value"]
-        return None
+    def set(self, key: str, value, age: float = 0.0):
+        self._pop(key)
+        size = _sizeof(value)
+        self._store[key] = {"value": value, "ts": time.monotonic() - age, "size": size}
+        self.bytes += size
+        while len(self._store) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._store))
+            self._pop(oldest)
+            self.evictions += 1
+            metrics.CACHE_EVICTIONS.labels(metrics.cache_family(oldest)).value += 1
+
+    def delete(self, *keys: str):
+        self._drop(keys)
+        self._publish("key", keys)
 
-    def set(self, key: str, value):
-        self._store[key] = {"value": value, "ts": time.monotonic()}
+    def delete_variants(self, *keys: str):
+        """Delete each key plus its query variants (`key?limit=...`)."""
+        self._drop_variants(keys)
+        self._publish("variants", keys)
 
-    def delete(self, key: str):
-        self._store.pop(key, None)
+    def peek(self, key: str):
+        """Value for key whatever its age, without touching LRU order or stats."""
+        entry = self._store.get(key)
+        return entry["value"] if entry else None
+
+    def delete_prefix(self, prefix: str):
+        self._drop_prefix(prefix)
+        self._publish("prefix", [prefix])
 
     def clear(self):
+        self._clear()
+        self._publish("clear", [""])
+
+    def apply(self, kind: str, arg: str):
+        """Apply an invalidation another worker published, locally only."""
+        if kind == "key":
+            self._drop([arg])
+        elif kind == "variants":
+            self._drop_variants([arg])
+        elif kind == "prefix":
+            self._drop_prefix(arg)
+        elif kind == "clear":
+            self._clear()
+
+    def _publish(self, kind: str, args):
+        if self.shared:
+            for arg in args:
+                self.shared.publish(kind, arg)
+
+    def _drop(self, keys):
+        for key in keys:
+            self._pop(key)
+            self._inflight.pop(key, None)
+
+    def _drop_variants(self, keys):
+        prefixes = tuple(f"{key}?" for key in keys)
+        variants = [k for k in list(self._store) + list(self._inflight) if k.startswith(prefixes)]
+        self._drop([*keys, *variants])
+
+    def _drop_prefix(self, prefix: str):
+        self._drop([k for k in list(self._store) + list(self._inflight) if k.startswith(prefix)])
+
+    def _clear(self):
         self._store.clear()
+        self._inflight.clear()
+        self.bytes = 0
+
+    def _pop(self, key: str):
+        entry = self._store.pop(key, None)
+        if entry:
+            self.bytes -= entry["size"]
+
+    def sweep(self) -> int:
+        """Drop entries too old to be served even as stale."""
+        cutoff = time.monotonic() - _CACHE_HARD_EXPIRY
+        expired = [key for key, entry in self._store.items() if entry["ts"] < cutoff]
+        for key in expired:
+            self._pop(key)
+            metrics.CACHE_EVICTIONS.labels(metrics.cache_family(key)).value += 1
+        self.evictions += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._store),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+            "shared": self.shared.stats() if self.shared else None,
+        }
+
+    async def get_or_load(self, key: str, loader, shared: bool = True):
+        """Return the cached value for key, calling `loader()` at most once
+        per key no matter how many requests miss at the same time (and, with
+        a shared tier, at most once per host). Pass shared=False for values
+        that only mean something inside this process."""
+        entry = self._store.get(key)
+        if entry:
+            age = time.monotonic() - entry["ts"]
+            if age < _CACHE_TTL + _CACHE_GRACE:
+                self._store.move_to_end(key)
+                self.hits += 1
+                status = "HIT" if age < _CACHE_TTL else "STALE"
+                cache_status.set(status)
+                metrics.CACHE_REQUESTS.labels(metrics.cache_family(key), status.lower()).value += 1
+                if age >= _CACHE_TTL - _CACHE_REFRESH_AHEAD:
+                    self._load(key, loader, shared)
+                return entry["value"]
+        self.misses += 1
+        cache_status.set("MISS")
+        metrics.CACHE_REQUESTS.labels(metrics.cache_family(key), "miss").value += 1
+        try:
+            # shield: a disconnecting client must not cancel the shared load
+            return await asyncio.shield(self._load(key, loader, shared))
+        except (httpx.HTTPError, upstream.UpstreamError):
+            if entry and time.monotonic() - entry["ts"] < _CACHE_HARD_EXPIRY:
+                mark_stale(time.monotonic() - entry["ts"])
+                return entry["value"]
+            raise
+
+    async def get_or_load_many(self, keys: list, loader) -> dict:
+        """get_or_load() for several keys at once: fresh entries are served
+        from here (or the shared tier), and all the rest are loaded by one
+        `loader(missing_keys)` call returning {key: value}. Keys it leaves
+        out are not found, and are not cached. Returns {key: value}."""
+        found, missing, waiting = {}, [], {}
+        now = time.monotonic()
+        for key in dict.fromkeys(keys):
+            entry = self._store.get(key)
+            if entry and now - entry["ts"] < _CACHE_TTL:
+                self._store.move_to_end(key)
+                self.hits += 1
+                found[key] = entry["value"]
+            elif key in self._inflight:
+                waiting[key] = self._inflight[key]
+            else:
+                missing.append(key)
+        if missing and self.shared:
+            shared_entries = await self.shared.get_many(missing, _CACHE_TTL - _CACHE_REFRESH_AHEAD)
+            for key, (value, stored_at) in shared_entries.items():
+                self.set(key, value, max(0.0, time.time() - stored_at))
+                found[key] = value
+            # A load may have started for one of the others meanwhile
+            waiting.update((key, self._inflight[key]) for key in missing if key in self._inflight)
+            missing = [key for key in missing if key not in found and key not in waiting]
+        self.misses += len(missing)
+        for key in dict.fromkeys(keys):
+            result = "hit" if key in found else "miss"
+            metrics.CACHE_REQUESTS.labels(metrics.cache_family(key), result).value += 1
+        cache_status.set("MISS" if missing or waiting else "HIT")
+
+        if missing:
+            # Per-key futures, so get_or_load() callers of these keys wait
+            # for this load, and an invalidation meanwhile drops the result
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            for key, future in futures.items():
+                future.add_done_callback(_log_background_error)
+                self._inflight[key] = future
+            try:
+                loaded = await loader(missing)
+            except BaseException as e:
+                for key, future in futures.items():
+                    if self._inflight.get(key) is future:
+                        del self._inflight[key]
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                    else:
+                        future.cancel()
+                raise
+            for key, future in futures.items():
+                if key in loaded:
+                    found[key] = loaded[key]
+                    future.set_result(loaded[key])
+                else:
+                    future.set_exception(HTTPException(status_code=404, detail="Not found"))
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+                    if key in loaded:
+                        self.set(key, loaded[key])
+        for key, future in waiting.items():
+            try:
+                found[key] = await asyncio.shield(future)
+            except HTTPException:
+                pass
+        return found
+
+    def _load(self, key: str, loader, shared: bool = True) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(key, loader, shared))
+            future.add_done_callback(_log_background_error)
+            self._inflight[key] = future
+        return future
+
+    async def _run(self, key: str, loader, shared: bool = True):
+        task = asyncio.current_task()
+        try:
+            if shared and self.shared:
+                # An entry another worker stored keeps its age, so it is
+                # refreshed on the same schedule everywhere
+                value, age = await self.shared.fetch(key, loader, _CACHE_TTL - _CACHE_REFRESH_AHEAD)
+            else:
+                value, age = await loader(), 0.0
+            if self._inflight.get(key) is task:
+                self.set(key, value, age)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+
+async def _sweep_cache_forever():
+    while True:
+        await asyncio.sleep(_CACHE_SWEEP_INTERVAL)
+        cache.sweep()
+        if cache.shared:
+            await cache.shared.prune(_CACHE_HARD_EXPIRY)
+
+
+# While upstream is down every request's refresh fails the same way, so
+# those failures are reported at most once per interval
+_REFRESH_ERROR_LOG_INTERVAL = 60.0
+_refresh_errors = {"logged_at": None, "suppressed": 0}
+
+
+def _log_background_error(future: asyncio.Future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None or isinstance(error, HTTPException):
+        return
+    note = ""
+    if isinstance(error, (httpx.HTTPError, upstream.UpstreamError)):
+        now = time.monotonic()
+        logged_at = _refresh_errors["logged_at"]
+        if logged_at is not None and now - logged_at < _REFRESH_ERROR_LOG_INTERVAL:
+            _refresh_errors["suppressed"] += 1
+            return
+        if _refresh_errors["suppressed"]:
+            note = f" (and {_refresh_errors['suppressed']} more since the last report)"
+        _refresh_errors.update(logged_at=now, suppressed=0)
+    print(f"Cache refresh failed: {error!r}{note}")
 
 cache = _Cache()
 
+metrics.Gauge("cache_entries", "Entries in the in-process cache.", fn=lambda: len(cache._store))
+metrics.Gauge("cache_bytes", "Approximate size of the in-process cache.", fn=lambda: cache.bytes)
+metrics.Gauge("cache_loads_in_flight", "Cache keys currently being loaded.", fn=lambda: len(cache._inflight))
+
 # ──────────────────────────────────────────
 # HELPERS
 # ──────────────────────────────────────────
 
 @app.get("/health")
 def health():
+    # Liveness only; see /ready for "warmed up and able to serve"
     return {"status": "ok"}
 
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Prometheus text format; see metrics.py."""
+    if metrics.METRICS_TOKEN and (not credentials or credentials.credentials != metrics.METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+PRODUCT_COLUMNS = {
+    "id", "name", "price", "category", "description", "header_image", "images",
+    "video_url", "measurements", "color", "sizes", "condition", "coupon_code",
+    "discount_amount", "created_at", "version", "updated_at", "image_manifest",
+}
+
+
 def get_supabase_headers():
     return {
         "apikey": SUPABASE_KEY,
@@ -82,6 +557,297 @@ def verify_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return True
 
 
+def invalidate_product(product_id: str, *categories: str):
+    """Drop only the cache keys a write to this product can have changed."""
+    cache.delete(f"product:{product_id}")
+    cache.delete_variants("products:all", *(f"products:{c}" for c in categories if c))
+
+
+# ──────────────────────────────────────────
+# IN-MEMORY CATALOG + DERIVED INDEXES
+# ──────────────────────────────────────────
+
+catalog = Catalog()
+# Shared-cache key holding the raw rows every worker builds its catalog from
+CATALOG_ROWS = "catalog:rows"
+search_index = catalog.register(SearchIndex())
+facet_index = catalog.register(FacetIndex())
+related_index = catalog.register(RelatedIndex())
+price_index = catalog.register(PriceIndex())
+image_sources = catalog.register(imgproxy.ImageSources())
+
+
+# ──────────────────────────────────────────
+# READ REPLICA
+# ──────────────────────────────────────────
+
+read_replica: Optional[replica.Replica] = None
+
+
+# Past this many changed products, drop everything instead of key by key
+BULK_INVALIDATION = 100
+
+
+def invalidate_changes(changed: list):
+    """Invalidate cache keys for (id, old_category, new_category) triples."""
+    if len(changed) > BULK_INVALIDATION:
+        cache.clear()
+        return
+    for product_id, old_category, new_category in changed:
+        invalidate_product(product_id, old_category, new_category)
+
+
+async def patch_catalog(rows: list = (), removed: list = ()):
+    """Apply product changes to this worker's catalog and, through the
+    shared cache, to every other worker's. Big batches rebuild the indexes
+    off the event loop (see catalog.py)."""
+    if static_export.STATIC_EXPORT_ENABLED:
+        ids = [row["id"] for row in rows] + list(removed)
+        categories = {row.get("category") for row in rows}
+        categories.update(catalog.get(pid).get("category") for pid in ids if catalog.get(pid))
+        schedule_export(ids, categories, full=not catalog.loaded or len(ids) > BULK_INVALIDATION)
+    await catalog.apply_async(rows, removed)
+    if cache.shared and len(rows) + len(removed) <= BULK_INVALIDATION:
+        # (bigger batches go through invalidate_changes' clear, which makes
+        # every worker reload its catalog)
+        cache.shared.publish("key", CATALOG_ROWS)
+        for row in rows:
+            cache.shared.publish("catalog-upsert", json.dumps(row))
+        for product_id in removed:
+            cache.shared.publish("catalog-remove", product_id)
+
+
+async def apply_replica_changes(changed: list):
+    """Patch the catalog from the replica after a sync, then invalidate."""
+    rows, removed = [], []
+    for product_id, old_category, new_category in changed:
+        row = read_replica.get(product_id) if read_replica else None
+        if row:
+            rows.append(row)
+        else:
+            removed.append(product_id)
+    await patch_catalog(rows, removed)
+    invalidate_changes(changed)
+
+
+def _known_product(product_id: str) -> Optional[dict]:
+    product = catalog.get(product_id)
+    if product is None and read_replica:
+        product = read_replica.get(product_id)
+    if product is None:
+        cached = cache.peek(f"product:{product_id}")
+        product = cached.data if isinstance(cached, EncodedJSON) else None
+    return product
+
+
+async def record_writes(rows: list):
+    """Apply rows Supabase just accepted to the replica, catalog and cache."""
+    changed, unseen = [], False
+    for row in rows:
+        old = _known_product(row["id"])
+        # Might be an edit whose old category we can't see
+        unseen = unseen or (old is None and not catalog.loaded)
+        changed.append((row["id"], old and old.get("category"), row.get("category")))
+    if unseen:
+        # Once per batch: with the shared cache on, each call is a broadcast
+        cache.delete_prefix("products:")
+    if read_replica:
+        await asyncio.to_thread(read_replica.upsert, rows)
+    await patch_catalog(rows)
+    invalidate_changes(changed)
+
+
+async def _follow_shared_cache_forever():
+    """Apply what the other workers publish: cache invalidations and
+    catalog changes."""
+    while True:
+        global sync_leader_alive
+        await asyncio.sleep(sharedcache.SHARED_CACHE_POLL)
+        try:
+            sync_leader_alive = await cache.shared.lease_held(CHANGE_SYNC_LEASE)
+            upserts, removed = {}, {}
+            for kind, arg in await cache.shared.poll():
+                # Catalog changes are gathered up and applied as one batch
+                if kind == "catalog-upsert":
+                    row = json.loads(arg)
+                    removed.pop(row["id"], None)
+                    upserts[row["id"]] = row
+                elif kind == "catalog-remove":
+                    upserts.pop(arg, None)
+                    removed[arg] = True
+                elif kind == "changes-wake":
+                    change_feed.wake()
+                else:
+                    cache.apply(kind, arg)
+            if upserts or removed:
+                await catalog.apply_async(list(upserts.values()), list(removed))
+        except Exception as e:
+            print(f"Shared cache poll failed: {e!r}")
+
+
+# ──────────────────────────────────────────
+# DELTA SYNC
+# ──────────────────────────────────────────
+#
+# The replica (or, without one, the in-memory catalog) is kept current by
+# polling the change feed (changes.py). While the feed is current, cache
+# entries that expire are rebuilt locally instead of from Supabase.
+
+change_feed = changes.ChangeFeed(changes.SupabaseChanges(lambda: SUPABASE_URL, get_supabase_headers))
+CHANGE_SYNC_LEASE = "change-sync"
+# Another worker holds the sync lease, as of the last shared cache poll
+sync_leader_alive = False
+
+
+def catalog_is_current() -> bool:
+    """The in-memory catalog is being kept up to date by the change feed
+    (here or, with a shared cache, in the worker that holds the sync lease)."""
+    if not catalog.loaded or read_replica:
+        return False
+    if change_feed.current:
+        return True
+    return bool(cache.shared and change_feed.supported and sync_leader_alive)
+
+
+async def apply_changes(rows: list, deleted: list):
+    """Apply a change-feed delta to the replica or catalog, then invalidate
+    the affected cache keys."""
+    if read_replica:
+        # Off the loop: a sync in a worker thread may hold the write lock
+        changed = await asyncio.to_thread(read_replica.upsert, rows)
+        changed += await asyncio.to_thread(read_replica.delete, deleted)
+        await apply_replica_changes(changed)
+        return
+    changed, changed_rows, removed = [], [], []
+    for row in rows:
+        old = catalog.get(row["id"])
+        if old != row:
+            changed.append((row["id"], old and old.get("category"), row.get("category")))
+            changed_rows.append(row)
+    for product_id in deleted:
+        old = catalog.get(product_id)
+        if old is not None:
+            changed.append((product_id, old.get("category"), None))
+            removed.append(product_id)
+    if changed:
+        await patch_catalog(changed_rows, removed)
+        invalidate_changes(changed)
+
+
+
+async def _sync_changes_forever():
+    while True:
+        # The replica file and the upstream feed are shared by the workers
+        # on a host, so only the one holding the lease syncs; the rest hear
+        # about the changes through the shared cache
+        # Without a replica there is nothing to follow until the catalog
+        # has been loaded (which seeds the feed)
+        can_lead = read_replica is not None or (change_feed.mark is not None and change_feed.supported)
+        leader = can_lead and (cache.shared is None or await cache.shared.try_lease(CHANGE_SYNC_LEASE, change_feed.interval * 3))
+        try:
+            if not leader:
+                if read_replica and not read_replica.ready:
+                    read_replica.ready = read_replica.count() > 0
+            elif read_replica and (change_feed.mark is None or not change_feed.supported):
+                # First sync (or no feed): snapshot, then follow the feed
+                changed = await read_replica.sync(upstream.get_client(), SUPABASE_URL, get_supabase_headers())
+                await apply_replica_changes(changed)
+                if change_feed.supported:
+                    change_feed.seed(read_replica.newest_updated_at())
+            elif change_feed.mark is not None and change_feed.supported:
+                await apply_changes(*await change_feed.poll())
+        except Exception as e:
+            print(f"Change sync failed: {e!r}")
+            if cache.shared and leader:
+                await cache.shared.release(CHANGE_SYNC_LEASE)
+        if read_replica and not change_feed.supported:
+            await asyncio.sleep(replica.REPLICA_SYNC_INTERVAL)
+        else:
+            await change_feed.wait()
+
+
+# ──────────────────────────────────────────
+# DEGRADED MODE
+# ──────────────────────────────────────────
+#
+# When Supabase is unreachable (or its circuit is open, see upstream.py),
+# public reads fall back to the newest data we still hold: a cache entry up
+# to HARD_EXPIRY old, else the in-memory catalog, however old. Such
+# responses carry X-Stale-Age (seconds). With nothing to fall back on they
+# fail fast with 503 and Retry-After instead of an empty shop.
+
+def catalog_age() -> float:
+    """Seconds since the in-memory catalog was last known to match Supabase."""
+    synced = catalog.synced_at or 0.0
+    if change_feed.mark is not None:
+        synced = max(synced, change_feed.last_success)
+    return time.monotonic() - synced
+
+
+def mark_stale(age: float):
+    """The current request is being answered from data `age` seconds old."""
+    cache_status.set("STALE")
+    stale_age.set(age)
+
+
+def degraded_headers() -> dict:
+    age = stale_age.get()
+    return {} if age is None else {"X-Stale-Age": str(int(age))}
+
+
+def upstream_unavailable(error: Exception) -> HTTPException:
+    print(f"Upstream unavailable: {error!r}")
+    return HTTPException(status_code=503, detail="Catalog temporarily unavailable",
+                         headers={"Retry-After": str(upstream.retry_after(error))})
+
+
+@app.exception_handler(upstream.CircuitOpenError)
+@app.exception_handler(upstream.UpstreamBusyError)
+async def upstream_fail_fast(request: Request, error: httpx.TransportError):
+    """Calls refused before reaching Supabase, in routes with no fallback
+    (e.g. admin writes): 503 rather than a 500."""
+    return JSONResponse({"detail": "Service busy, try again shortly"}, status_code=503,
+                        headers={"Retry-After": str(upstream.retry_after(error))})
+
+
+# ──────────────────────────────────────────
+# STATIC EXPORT
+# ──────────────────────────────────────────
+#
+# With STATIC_EXPORT=1 the catalog is mirrored to content-hashed JSON files
+# (see static_export.py). Writes mark the shards they touch; a background
+# task exports them in batches, from the worker that made the change.
+
+exporter = static_export.StaticExport()
+_export_pending = {"full": False, "products": set(), "categories": set()}
+_export_wake = asyncio.Event()
+
+
+def schedule_export(product_ids=(), categories=(), full: bool = False):
+    if not static_export.STATIC_EXPORT_ENABLED:
+        return
+    _export_pending["full"] |= full
+    _export_pending["products"].update(product_ids)
+    _export_pending["categories"].update(categories)
+    _export_wake.set()
+
+
+async def _export_forever():
+    while True:
+        await _export_wake.wait()
+        await asyncio.sleep(static_export.STATIC_EXPORT_DEBOUNCE)
+        _export_wake.clear()
+        full, ids, categories = _export_pending["full"], _export_pending["products"], _export_pending["categories"]
+        _export_pending.update(full=False, products=set(), categories=set())
+        try:
+            await ensure_catalog()
+            rows = list(catalog.products.values())
+            await asyncio.to_thread(exporter.export, rows, None if full else ids, None if full else categories)
+        except Exception as e:
+            print(f"Static export failed: {e!r}")
+            schedule_export(ids, categories, full)
+
+
 # ──────────────────────────────────────────
 # AUTH
 # ──────────────────────────────────────────
@@ -106,6 +872,95 @@ def get_config():
 # ──────────────────────────────────────────
 # PRODUCTS — ADMIN
 # ──────────────────────────────────────────
+#
+# Updates and deletes are a single conditional PostgREST call filtered on
+# id (and on version / updated_at when the client sends them). Only when
+# nothing matched do we look again, to tell 404 from 409.
+
+JSON_FIELD_TYPES = {"images": list, "sizes": list, "measurements": dict}
+NUMBER_FIELDS = {"price", "discount_amount"}
+EDITABLE_COLUMNS = PRODUCT_COLUMNS - {"id", "created_at", "version", "updated_at", "image_manifest"}
+
+
+def validate_patch(body: dict) -> dict:
+    unknown = set(body) - EDITABLE_COLUMNS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    fields = {}
+    for field, value in body.items():
+        if field in JSON_FIELD_TYPES:
+            ok = isinstance(value, JSON_FIELD_TYPES[field])
+        elif field in NUMBER_FIELDS:
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+        else:
+            ok = isinstance(value, str)
+        if not ok:
+            raise HTTPException(status_code=400, detail=f"Invalid value for {field}")
+        fields[field] = value
+    if "name" in fields and not fields["name"].strip():
+        raise HTTPException(status_code=400, detail="name must not be empty")
+    header_image = fields.get("header_image")
+    if header_image and "images" in fields and header_image not in fields["images"]:
+        fields["images"] = [header_image] + fields["images"]
+    return fields
+
+
+def validate_precondition(version, updated_at):
+    """400 unless version / updated_at are something PostgREST can compare."""
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        raise HTTPException(status_code=400, detail="Invalid value for version")
+    if updated_at is not None:
+        try:
+            ok = isinstance(updated_at, str) and (updated_at == "" or bool(datetime.fromisoformat(updated_at)))
+        except ValueError:
+            ok = False
+        if not ok:
+            raise HTTPException(status_code=400, detail="Invalid value for updated_at")
+
+
+def write_failed(resp: httpx.Response) -> HTTPException:
+    """The error for a write Supabase refused. Its own message stays in the
+    log: it can name columns, constraints and SQL."""
+    if resp.status_code >= 500:
+        return upstream_unavailable(upstream.UpstreamError(resp))
+    print(f"Supabase rejected a product write: {resp.status_code} {resp.text[:200]}")
+    return HTTPException(status_code=400, detail="The product data was rejected")
+
+
+async def conditional_write(method: str, product_id: str, version: Optional[int] = None,
+                            updated_at: Optional[str] = None, body: Optional[dict] = None) -> dict:
+    """PATCH or DELETE one product in one round trip; returns the row."""
+    validate_precondition(version, updated_at)
+    url = f"{SUPABASE_URL}/rest/v1/products"
+    params = [("id", f"eq.{product_id}")]
+    if version is not None:
+        params.append(("version", f"eq.{version}"))
+    if updated_at:
+        params.append(("updated_at", f"eq.{updated_at}"))
+
+    client = upstream.get_client()
+    resp = await client.request(method, url, params=params, headers=get_supabase_headers(), json=body)
+    if resp.status_code not in [200, 204]:
+        raise write_failed(resp)
+    rows = resp.json() if resp.content else []
+    if rows:
+        return rows[0]
+
+    if version is not None or updated_at:
+        check = await client.get(
+            url, params=[("id", f"eq.{product_id}"), ("select", "id")], headers=get_supabase_headers()
+        )
+        if check.status_code == 200 and check.json():
+            raise HTTPException(status_code=409, detail="Product was changed by someone else; reload and retry")
+    raise HTTPException(status_code=404, detail="Product not found")
+
+
+async def record_delete(row: dict):
+    if read_replica:
+        await asyncio.to_thread(read_replica.delete, [row["id"]])
+    await patch_catalog(removed=[row["id"]])
+    invalidate_product(row["id"], row.get("category"))
+
 
 @app.post("/api/admin/products")
 async def create_product(
@@ -124,14 +979,11 @@ async def create_product(
     images: str = Form("[]"),
     _admin: bool = Depends(verify_admin),
 ):
-    product_id = str(uuid.uuid4())
-
     image_list = json.loads(images) if images else []
     if header_image and header_image not in image_list:
         image_list.insert(0, header_image)
 
-    doc_data = {
-        "id": product_id,
+    return await insert_product({
         "name": name,
         "price": price,
         "category": category,
@@ -145,20 +997,24 @@ async def create_product(
         "condition": condition,
         "coupon_code": coupon_code,
         "discount_amount": discount_amount,
-        "created_at": datetime.now().isoformat()
-    }
+    })
+
+
+async def insert_product(data: dict) -> dict:
+    """Create a product from its column values; returns the stored row."""
+    doc_data = {"id": str(uuid.uuid4()), **data, "created_at": datetime.now().isoformat()}
 
     url = f"{SUPABASE_URL}/rest/v1/products"
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.post(url, headers=get_supabase_headers(), json=doc_data)
+    client = upstream.get_client()
+    resp = await client.post(url, headers=get_supabase_headers(), json=doc_data)
 
     if resp.status_code not in [200, 201]:
-        raise HTTPException(status_code=500, detail=resp.text)
-
-    # Invalidate product list cache so new product shows immediately
-    cache.clear()
+        raise write_failed(resp)
 
-    return resp.json()[0] if resp.json() else doc_data
+    created = resp.json()[0] if resp.json() else doc_data
+    # Also invalidates the product list cache so it shows immediately
+    await record_writes([created])
+    return created
 
 
 @app.put("/api/admin/products/{product_id}")
@@ -177,107 +1033,966 @@ async def update_product(
     discount_amount: float = Form(0.0),
     header_image: str = Form(""),
     images: str = Form("[]"),
+    version: Optional[int] = Form(None),
+    updated_at: Optional[str] = Form(None),
     _admin: bool = Depends(verify_admin),
 ):
-    url = f"{SUPABASE_URL}/rest/v1/products?id=eq.{product_id}"
-    async with httpx.AsyncClient(timeout=15) as client:
-        check = await client.get(url, headers=get_supabase_headers())
-        if check.status_code != 200 or not check.json():
-            raise HTTPException(status_code=404, detail="Product not found")
+    image_list = json.loads(images) if images else []
+    if header_image and header_image not in image_list:
+        image_list.insert(0, header_image)
 
-        image_list = json.loads(images) if images else []
-        if header_image and header_image not in image_list:
-            image_list.insert(0, header_image)
-
-        update_data = {
-            "name": name,
-            "price": price,
-            "category": category,
-            "description": description,
-            "header_image": header_image,
-            "images": image_list,
-            "video_url": video_url,
-            "measurements": json.loads(measurements) if measurements else {},
-            "color": color,
-            "sizes": json.loads(sizes) if sizes else [],
-            "condition": condition,
-            "coupon_code": coupon_code,
-            "discount_amount": discount_amount,
-        }
+    update_data = {
+        "name": name,
+        "price": price,
+        "category": category,
+        "description": description,
+        "header_image": header_image,
+        "images": image_list,
+        "video_url": video_url,
+        "measurements": json.loads(measurements) if measurements else {},
+        "color": color,
+        "sizes": json.loads(sizes) if sizes else [],
+        "condition": condition,
+        "coupon_code": coupon_code,
+        "discount_amount": discount_amount,
+    }
 
-        resp = await client.patch(url, headers=get_supabase_headers(), json=update_data)
+    updated = await conditional_write("PATCH", product_id, version, updated_at, update_data)
+    await record_writes([updated])
+    return updated
 
-    if resp.status_code not in [200, 204]:
-        raise HTTPException(status_code=500, detail=resp.text)
 
-    # Invalidate cache
-    cache.clear()
+@app.patch("/api/admin/products/{product_id}")
+async def patch_product(product_id: str, body: dict, _admin: bool = Depends(verify_admin)):
+    """Change only the fields in the JSON body. Send `version` (or
+    `updated_at`) from the last read to fail with 409 on concurrent edits."""
+    version = body.pop("version", None)
+    updated_at = body.pop("updated_at", None)
+    fields = validate_patch(body)
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nothing to update")
 
-    return resp.json()[0] if resp.json() else update_data
+    updated = await conditional_write("PATCH", product_id, version, updated_at, fields)
+    await record_writes([updated])
+    return updated
 
 
 @app.delete("/api/admin/products/{product_id}")
-async def delete_product(product_id: str, _admin: bool = Depends(verify_admin)):
-    url = f"{SUPABASE_URL}/rest/v1/products?id=eq.{product_id}"
-    async with httpx.AsyncClient(timeout=15) as client:
-        check = await client.get(url, headers=get_supabase_headers())
-        if check.status_code != 200 or not check.json():
+async def delete_product(
+    product_id: str,
+    version: Optional[int] = None,
+    updated_at: Optional[str] = None,
+    _admin: bool = Depends(verify_admin),
+):
+    deleted = await conditional_write("DELETE", product_id, version, updated_at)
+    await record_delete(deleted)
+    return {"success": True, "id": product_id}
+
+
+# ── v2: typed JSON bodies ──
+#
+# The same writes as above, with bodies checked against the models in
+# schemas.py while they are parsed, and rows returned without FastAPI's
+# jsonable_encoder pass. Reads are shared with v1.
+
+def parse_body(model, raw: bytes):
+    try:
+        return model.model_validate_json(raw)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+
+
+def json_body(model) -> dict:
+    """openapi_extra documenting a body the route reads itself."""
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": model.model_json_schema()}}}}
+
+
+@app.post("/api/v2/admin/products", status_code=201, openapi_extra=json_body(schemas.ProductCreate))
+async def create_product_v2(request: Request, _admin: bool = Depends(verify_admin)):
+    product = parse_body(schemas.ProductCreate, await request.body())
+    return fastjson.FastJSONResponse(await insert_product(product.row()), status_code=201)
+
+
+@app.put("/api/v2/admin/products/{product_id}", openapi_extra=json_body(schemas.ProductReplace))
+async def update_product_v2(product_id: str, request: Request, _admin: bool = Depends(verify_admin)):
+    product = parse_body(schemas.ProductReplace, await request.body())
+    updated = await conditional_write("PATCH", product_id, product.version, product.updated_at, product.row())
+    await record_writes([updated])
+    return fastjson.FastJSONResponse(updated)
+
+
+@app.patch("/api/v2/admin/products/{product_id}", openapi_extra=json_body(schemas.ProductPatch))
+async def patch_product_v2(product_id: str, request: Request, _admin: bool = Depends(verify_admin)):
+    patch = parse_body(schemas.ProductPatch, await request.body())
+    fields = patch.changes()
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    updated = await conditional_write("PATCH", product_id, patch.version, patch.updated_at, fields)
+    await record_writes([updated])
+    return fastjson.FastJSONResponse(updated)
+
+
+IMAGE_MAX_FILES = 20
+
+
+@app.post("/api/admin/products/{product_id}/images")
+async def upload_product_images(
+    product_id: str,
+    files: List[UploadFile] = File(...),
+    _admin: bool = Depends(verify_admin),
+):
+    """Upload photos for a product. Each one is resized to thumb/card/full
+    WebP and JPEG variants in the image process pool, pushed to Storage, and
+    recorded in the product's `images` and `image_manifest` (URL -> srcset)."""
+    if len(files) > IMAGE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {IMAGE_MAX_FILES} files per request")
+
+    client = upstream.get_client()
+    url = f"{SUPABASE_URL}/rest/v1/products"
+    check = await client.get(url, params={"id": f"eq.{product_id}"}, headers=get_supabase_headers())
+    if check.status_code != 200 or not check.json():
+        raise HTTPException(status_code=404, detail="Product not found")
+    product = check.json()[0]
+
+    limiter = asyncio.Semaphore(images.IMAGE_UPLOAD_CONCURRENCY)
+    results = await asyncio.gather(
+        *(images.process_upload(f, product_id, SUPABASE_URL, SUPABASE_KEY, limiter) for f in files),
+        return_exceptions=True,
+    )
+
+    uploaded, errors = [], []
+    for upload, result in zip(files, results):
+        if isinstance(result, (images.ImageError, upstream.UpstreamError, httpx.HTTPError)):
+            errors.append({"file": upload.filename, "error": str(result)})
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        uploaded.append({"file": upload.filename, "url": result["variants"]["full"]["jpeg"], "manifest": result})
+    if not uploaded:
+        raise HTTPException(status_code=400, detail={"errors": errors})
+
+    updated = await attach_images(product, [u["manifest"] for u in uploaded])
+    return {"product": updated, "uploaded": uploaded, "errors": errors}
+
+
+async def attach_images(product: dict, manifests: list) -> dict:
+    """Add processed images (manifests from images.process_*) to a product's
+    `images` and `image_manifest`; returns the updated row."""
+    image_list = list(product.get("images") or [])
+    manifest = dict(product.get("image_manifest") or {})
+    for result in manifests:
+        full_url = result["variants"]["full"]["jpeg"]
+        if full_url not in image_list:
+            image_list.append(full_url)
+        manifest[full_url] = result
+
+    fields = {"images": image_list, "image_manifest": manifest}
+    if not product.get("header_image"):
+        fields["header_image"] = image_list[0]
+    updated = await conditional_write("PATCH", product["id"], product.get("version"), None, fields)
+    await record_writes([updated])
+    return updated
+
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "200"))
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "50000"))
+BULK_MAX_REPORTED_ERRORS = 200
+
+
+@app.post("/api/admin/products/bulk")
+async def bulk_upsert_products(
+    request: Request,
+    batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=1000),
+    _admin: bool = Depends(verify_admin),
+):
+    """Stream NDJSON (one product per line) or CSV (header row first) and
+    upsert it into Supabase in batches of `batch_size`."""
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        records = bulk.iter_csv(request.stream())
+    elif "json" in content_type:
+        records = bulk.iter_ndjson(request.stream())
+    else:
+        raise HTTPException(status_code=415, detail="Send application/x-ndjson or text/csv")
+
+    url = f"{SUPABASE_URL}/rest/v1/products"
+    headers = {**get_supabase_headers(), "Prefer": "return=representation,resolution=merge-duplicates"}
+    client = upstream.get_client()
+    started = time.perf_counter()
+    received, batches, failed = 0, 0, 0
+    errors, written, batch = [], [], {}
+
+    def fail(number, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_MAX_REPORTED_ERRORS:
+            errors.append({"row": number, "error": message})
+
+    async def flush():
+        nonlocal batches
+        # PostgREST wants identical keys across one array insert, and rows
+        # with an id carry only the columns they set: one request per shape
+        groups = {}
+        for number, row in batch.values():
+            groups.setdefault(tuple(row), []).append((number, row))
+        batch.clear()
+        for columns, group in groups.items():
+            batches += 1
+            try:
+                resp = await client.post(
+                    url,
+                    params={"on_conflict": "id", "columns": ",".join(columns)},
+                    headers=headers,
+                    json=[row for _, row in group],
+                )
+            except httpx.HTTPError as e:
+                for number, _ in group:
+                    fail(number, f"upstream error: {e!r}")
+                continue
+            if resp.status_code not in [200, 201]:
+                for number, _ in group:
+                    fail(number, f"upstream {resp.status_code}: {resp.text[:200]}")
+                continue
+            written.extend(resp.json())
+
+    try:
+        async for number, record in records:
+            received += 1
+            if received > BULK_MAX_ROWS:
+                fail(number, f"over the {BULK_MAX_ROWS} row limit; rest of the body ignored")
+                break
+            if isinstance(record, Exception):
+                fail(number, str(record))
+                continue
+            try:
+                row = bulk.validate_row(record)
+            except bulk.RowError as e:
+                fail(number, str(e))
+                continue
+            if row["id"] in batch:
+                # Postgres can't upsert the same id twice in one statement
+                await flush()
+            batch[row["id"]] = (number, row)
+            if len(batch) >= batch_size:
+                await flush()
+        if batch:
+            await flush()
+    finally:
+        # Batches already in Supabase are applied here even when the import
+        # stops part way (a client disconnect, an unexpected error)
+        if written:
+            await asyncio.shield(record_writes(written))
+
+    seconds = time.perf_counter() - started
+    return {
+        "received": received,
+        "upserted": len(written),
+        "failed": failed,
+        "batches": batches,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(len(written) / seconds, 1) if seconds else None,
+        "errors": errors,
+    }
+
+
+@app.get("/api/admin/cache")
+def cache_stats(_admin: bool = Depends(verify_admin)):
+    return {**cache.stats(), "changes": change_feed.stats(), "upstream": upstream.stats()}
+
+
+@app.post("/api/admin/export")
+async def export_catalog(_admin: bool = Depends(verify_admin)):
+    """Rebuild the whole static export now."""
+    try:
+        await ensure_catalog()
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        raise upstream_unavailable(e)
+    result = await asyncio.to_thread(exporter.export, list(catalog.products.values()))
+    return {**result, **exporter.stats()}
+
+
+@app.post("/api/admin/changes")
+def notify_changes(_admin: bool = Depends(verify_admin)):
+    """Pushed change notification (e.g. a Supabase database webhook): pull
+    the delta now rather than at the next poll."""
+    change_feed.wake()
+    if cache.shared:
+        cache.shared.publish("changes-wake")
+    return {"ok": True}
+
+
+# ──────────────────────────────────────────
+# AI IMAGE JOBS
+# ──────────────────────────────────────────
+#
+# Generation runs in the background queue in jobs.py: these endpoints only
+# enqueue and report. A finished image is resized and stored like an
+# upload; with "attach": true it is also added to the product's images.
+
+JOB_PROMPTS = {
+    "lifestyle": ("An editorial lifestyle photo of this {category} ({name}, {color}) worn and styled in "
+                  "a natural real-world setting, soft daylight. Keep the garment's colour, pattern and "
+                  "details exactly as in the reference photo. {scene}"),
+    "image": "{prompt}",
+}
+JOB_PARAMS = ("prompt", "scene", "attach", "reference")
+
+job_queue: Optional[jobs.JobQueue] = None
+
+
+def image_job_prompt(kind: str, product: Optional[dict], params: dict) -> str:
+    fields = {"name": "", "category": "garment", "color": "", "scene": params.get("scene") or "",
+              "prompt": params.get("prompt") or ""}
+    if product:
+        fields.update({k: product[k] for k in ("name", "category", "color") if product.get(k)})
+    return JOB_PROMPTS[kind].format(**fields).strip()
+
+
+async def fetch_reference(url: str) -> tuple:
+    resp = await upstream.get_client().get(url, extensions=upstream.IMAGE_LANE)
+    if resp.status_code >= 500:
+        raise jobs.RetryLater(f"reference image: {resp.status_code}")
+    if resp.status_code != 200 or len(resp.content) > images.IMAGE_MAX_BYTES:
+        raise jobs.JobError(f"reference image {url} is not usable ({resp.status_code})")
+    return resp.content, resp.headers.get("content-type", "image/jpeg").split(";")[0]
+
+
+async def run_image_job(job: dict, report) -> dict:
+    params = job["params"]
+    product = None
+    if job["product_id"]:
+        product = (await load_products([job["product_id"]])).get(job["product_id"])
+        if product is None:
+            raise jobs.JobError("Product not found")
+    prompt = image_job_prompt(job["kind"], product, params)
+    reference = None
+    if product and product.get("header_image") and params.get("reference", True):
+        report(0.05, "fetching reference image")
+        reference = await fetch_reference(product["header_image"])
+
+    image, _ = await jobs.get_provider().generate(prompt, reference, report)
+
+    report(0.75, "storing")
+    limiter = asyncio.Semaphore(images.IMAGE_UPLOAD_CONCURRENCY)
+    manifest = await images.process_bytes(image, job["product_id"] or "generated", SUPABASE_URL, SUPABASE_KEY,
+                                          limiter)
+    result = {"url": manifest["variants"]["full"]["jpeg"], "manifest": manifest, "prompt": prompt,
+              "attached": False}
+    if product and params.get("attach"):
+        report(0.9, "attaching")
+        # Re-read: the product may have been edited while the model ran
+        product = (await load_products([product["id"]])).get(product["id"]) or product
+        await attach_images(product, [manifest])
+        result["attached"] = True
+    return result
+
+
+def _job_queue() -> jobs.JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="AI jobs are disabled on this server")
+    return job_queue
+
+
+@app.post("/api/admin/jobs", status_code=202)
+async def submit_job(body: dict, _admin: bool = Depends(verify_admin)):
+    """Queue an image generation job; returns at once with the job, whose
+    progress GET /api/admin/jobs/{id} reports.
+
+    {"kind": "lifestyle", "product_id": ..., "scene"?, "attach"?, "reference"?}
+    {"kind": "image", "prompt": ..., "product_id"?, "attach"?}"""
+    queue = _job_queue()
+    kind = body.get("kind", "lifestyle")
+    product_id = body.get("product_id")
+    if kind not in JOB_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {sorted(JOB_PROMPTS)}")
+    if kind == "lifestyle" and not product_id:
+        raise HTTPException(status_code=400, detail="product_id is required")
+    if kind == "image" and not str(body.get("prompt") or "").strip():
+        raise HTTPException(status_code=400, detail="prompt is required")
+    if product_id:
+        try:
+            found = await load_products([product_id])
+        except (httpx.HTTPError, upstream.UpstreamError) as e:
+            raise upstream_unavailable(e)
+        if product_id not in found:
             raise HTTPException(status_code=404, detail="Product not found")
-        await client.delete(url, headers=get_supabase_headers())
 
-    # Invalidate cache
-    cache.clear()
+    job = await queue.submit(kind, {k: body[k] for k in JOB_PARAMS if k in body}, product_id)
+    return JSONResponse(job, status_code=202, headers={"Location": f"/api/admin/jobs/{job['id']}"})
 
-    return {"success": True, "id": product_id}
+
+@app.get("/api/admin/jobs")
+async def list_jobs(status: Optional[str] = None, product_id: Optional[str] = None,
+                    limit: int = Query(50, ge=1, le=500), _admin: bool = Depends(verify_admin)):
+    queue = _job_queue()
+    return {"jobs": await queue.list(status, product_id, limit), "stats": await queue.stats()}
+
+
+@app.get("/api/admin/jobs/{job_id}")
+async def get_job(job_id: str, _admin: bool = Depends(verify_admin)):
+    job = await _job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/admin/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, _admin: bool = Depends(verify_admin)):
+    job = await _job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 # ──────────────────────────────────────────
 # PRODUCTS — PUBLIC
 # ──────────────────────────────────────────
 
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row: dict, sort: str = "newest") -> str:
+    position = [row.get("created_at"), row["id"]]
+    if sort != "newest":
+        # The other orders resume from the row's sort key as well
+        position = [sort, price_index.sort_key(sort, row["id"])] + position
+    raw = json.dumps(position).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str = "newest"):
+    """(created_at, id) for newest; (sort key, created_at, id) otherwise."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        if sort == "newest":
+            created_at, product_id = json.loads(raw)
+            return created_at, str(product_id)
+        cursor_sort, value, created_at, product_id = json.loads(raw)
+        if cursor_sort != sort:
+            raise ValueError("cursor is for another sort")
+        return (None if value is None else float(value)), created_at, str(product_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _after_cursor(position: tuple) -> str:
+    # Keyset condition for ORDER BY created_at DESC NULLS LAST, id DESC
+    created_at, product_id = position
+    if created_at is None:
+        return f'(and(created_at.is.null,id.lt."{product_id}"))'
+    return (
+        f'(created_at.lt."{created_at}",created_at.is.null,'
+        f'and(created_at.eq."{created_at}",id.lt."{product_id}"))'
+    )
+
+
+def parse_fields(fields: Optional[str]) -> Optional[list]:
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in PRODUCT_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+async def fetch_products(category: Optional[str] = None, selected: Optional[list] = None,
+                         limit: Optional[int] = None, position: Optional[tuple] = None,
+                         count: bool = False):
+    """Rows newest first from the read replica if it is ready, the
+    in-memory catalog while the change feed keeps it current, else from
+    Supabase. Returns (rows, total) where total is "" unless counted."""
+    if read_replica and read_replica.ready:
+        rows = read_replica.list(category, selected, limit, position)
+        total = str(read_replica.count(category)) if count and not position else ""
+        return rows, total
+    if catalog_is_current():
+        return catalog_page(category, selected, limit, position, count)
+
+    params = [
+        ("select", ",".join(selected) if selected else "*"),
+        ("order", "created_at.desc.nullslast,id.desc"),
+    ]
+    if category and category != "all":
+        params.append(("category", f"eq.{category}"))
+    if position:
+        params.append(("or", _after_cursor(position)))
+    if limit:
+        params.append(("limit", str(limit)))
+    headers = get_supabase_headers()
+    if count and not position:
+        # Later pages would only count the rows after the cursor
+        headers["Prefer"] = "count=estimated"
+
+    url = f"{SUPABASE_URL}/rest/v1/products"
+    resp = await upstream.get_client().get(url, params=params, headers=headers)
+    if resp.status_code not in [200, 206]:
+        raise upstream.UpstreamError(resp)
+    total = resp.headers.get("content-range", "").rpartition("/")[2]
+    return resp.json(), total
+
+
+def catalog_page(category: Optional[str] = None, selected: Optional[list] = None,
+                 limit: Optional[int] = None, position: Optional[tuple] = None,
+                 count: bool = False, sort: str = "newest"):
+    """fetch_products() answered from the in-memory catalog, read off the
+    presorted `sort` order; other sorts add effective_price to each row."""
+    wanted = category if category and category != "all" else None
+    accept = (lambda pid: catalog.get(pid).get("category") == wanted) if wanted else None
+    after = (None, *position) if position and sort == "newest" else position
+    ids = price_index.page(sort, limit, after, accept)
+    rows = [catalog.get(pid) for pid in ids]
+    total = ""
+    if count and not position:
+        total = str(sum(1 for row in catalog.products.values() if row.get("category") == wanted)
+                    if wanted else len(catalog.products))
+    if selected:
+        rows = [{f: row.get(f) for f in selected} for row in rows]
+    if sort != "newest":
+        rows = [{**row, "effective_price": price_index.effective_price(pid)} for pid, row in zip(ids, rows)]
+    return rows, total
+
+
+async def ensure_catalog():
+    """Make sure the in-memory catalog is loaded, refreshing it on the same
+    TTL/stale-while-revalidate schedule as the cache."""
+    async def fetch_rows():
+        rows, _ = await fetch_products()
+        return rows
+
+    async def load():
+        if cache.shared:
+            # Each worker builds its own indexes, but from one upstream read
+            rows, _ = await cache.shared.fetch(CATALOG_ROWS, fetch_rows, _CACHE_TTL - _CACHE_REFRESH_AHEAD)
+        else:
+            rows = await fetch_rows()
+        await catalog.replace_async(rows)
+        schedule_export(full=True)
+        if changes.CHANGE_SYNC_ENABLED and not read_replica and change_feed.mark is None:
+            change_feed.seed(changes.newest(rows))
+        return catalog.version
+
+    if catalog_is_current():
+        return
+    try:
+        await cache.get_or_load("catalog", load, shared=False)
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        if not catalog.loaded:
+            raise
+        # Keep answering from the last good snapshot
+        print(f"Serving the catalog from memory: {e!r}")
+        mark_stale(catalog_age())
+
+
+@app.get("/api/products/search")
+async def search_products(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
+    selected = parse_fields(fields)
+    try:
+        await ensure_catalog()
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        raise upstream_unavailable(e)
+    response.headers.update(degraded_headers())
+
+    # Over-fetch when filtering by category so a full page survives it
+    fetch = limit * 4 if category and category != "all" else limit
+    results = []
+    for product_id, score in search_index.search(q, fetch):
+        product = catalog.get(product_id)
+        if product is None or (category and category != "all" and product.get("category") != category):
+            continue
+        if selected:
+            product = {f: product.get(f) for f in selected}
+        results.append(product)
+        if len(results) == limit:
+            break
+    return results
+
+
+def parse_measure_filters(measure: Optional[list]) -> dict:
+    """["chest:40-46", "length:28-"] -> {"chest": (40.0, 46.0), "length": (28.0, None)}"""
+    ranges = {}
+    for spec in measure or []:
+        key, _, bounds = spec.partition(":")
+        low, sep, high = bounds.partition("-")
+        try:
+            if not key or not sep:
+                raise ValueError
+            ranges[key.strip().lower()] = (float(low) if low else None, float(high) if high else None)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid measure filter: {spec}")
+    return ranges
+
+
+async def faceted_products(filters, price_min, price_max, measures, selected,
+                           limit, position, count, with_facets, sort="newest"):
+    """Answer a filtered listing from the in-memory facet index."""
+    try:
+        await ensure_catalog()
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        raise upstream_unavailable(e)
+
+    ids, counts = facet_index.query(filters, price_min, price_max, measures, with_facets)
+    total = len(ids)
+    after = (None, *position) if position and sort == "newest" else position
+    matching = set(ids)
+    ordered = price_index.page(sort, limit + 1 if limit else None, after, matching.__contains__)
+    rows = [catalog.get(pid) for pid in ordered]
+    if sort != "newest":
+        rows = [{**row, "effective_price": price_index.effective_price(pid)} for pid, row in zip(ordered, rows)]
+
+    headers = degraded_headers()
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1], sort)
+    if count and not position:
+        headers["X-Total-Count"] = str(total)
+    if selected:
+        fields = selected + ["effective_price"] if sort != "newest" else selected
+        rows = [{f: row.get(f) for f in fields} for row in rows]
+
+    body = {"items": rows, "facets": counts, "total": total} if with_facets else rows
+    return fastjson.FastJSONResponse(body, headers=headers)
+
+
 @app.get("/api/products")
-async def list_products(category: Optional[str] = None):
+async def list_products(
+    request: Request,
+    category: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    count: bool = False,
+    size: Optional[List[str]] = Query(None),
+    color: Optional[List[str]] = Query(None),
+    condition: Optional[List[str]] = Query(None),
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    measure: Optional[List[str]] = Query(None),
+    facets: bool = False,
+    sort: str = "newest",
+):
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SORTS)}")
+    selected = parse_fields(fields)
+    if selected and limit:
+        # The next cursor is built from these, so always fetch them
+        selected += [f for f in ("created_at", "id") if f not in selected]
+    if cursor and not limit:
+        raise HTTPException(status_code=400, detail="cursor requires limit")
+    position = decode_cursor(cursor, sort) if cursor else None
+
+    if facets or size or color or condition or measure or price_min is not None or price_max is not None:
+        filters = {
+            "category": {category.strip().lower()} if category and category != "all" else None,
+            "size": {s.strip().upper() for s in size or []},
+            "color": set().union(*(normalize_colors(c) for c in color or [])) if color else None,
+            "condition": {c.strip().lower() for c in condition or []},
+        }
+        if color and not filters["color"]:
+            filters["color"] = {"-"}  # asked for colours we don't know: match nothing
+        return await faceted_products(
+            filters, price_min, price_max, parse_measure_filters(measure),
+            selected, limit, position, count, facets, sort,
+        )
+    if sort != "newest":
+        return await sorted_products(category, selected, limit, position, count, sort)
+
+    try:
+        encoded = await cached_listing(category, selected, limit, cursor, position, count)
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        if not catalog.loaded:
+            raise upstream_unavailable(e)
+        rows, total = catalog_page(category, selected, limit + 1 if limit else None, position, count)
+        encoded = listing_page(rows, total, limit)
+        mark_stale(catalog_age())
+    return encoded_response(request, encoded)
+
+
+async def sorted_products(category, selected, limit, position, count, sort):
+    """A listing in price or discount order. Every order is kept presorted
+    in memory, so this is a slice of it rather than an upstream query."""
+    try:
+        await ensure_catalog()
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        raise upstream_unavailable(e)
+    rows, total = catalog_page(category, selected, limit + 1 if limit else None, position, count, sort)
+    headers = degraded_headers()
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1], sort)
+    if total:
+        headers["X-Total-Count"] = total
+    return fastjson.FastJSONResponse(rows, headers=headers)
+
+
+async def cached_listing(category: Optional[str] = None, selected: Optional[list] = None,
+                         limit: Optional[int] = None, cursor: Optional[str] = None,
+                         position: Optional[tuple] = None, count: bool = False) -> EncodedJSON:
+    """One page of an unfiltered listing, through the cache."""
     cache_key = f"products:{category or 'all'}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
+    variant = {"limit": limit, "cursor": cursor, "fields": ",".join(selected or []), "count": int(count)}
+    variant = {k: v for k, v in variant.items() if v}
+    if variant:
+        cache_key += "?" + urlencode(sorted(variant.items()))
+
+    async def load():
+        # One extra row tells us whether there is a next page
+        rows, total = await fetch_products(category, selected, limit + 1 if limit else None, position, count)
+        return listing_page(rows, total, limit)
+
+    return await cache.get_or_load(cache_key, load)
+
+
+def listing_page(rows: list, total: str, limit: Optional[int]) -> EncodedJSON:
+    """Encode up to `limit` of `rows` (fetched with one extra to detect a
+    next page) with the paging headers."""
+    extra = {}
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        extra["X-Next-Cursor"] = encode_cursor(rows[-1])
+    if total.isdigit():
+        extra["X-Total-Count"] = total
+    return EncodedJSON(rows, headers=extra)
+
+
+# Wishlist / recently-viewed / cart views: many products in one round trip.
+# Hits come from the product:{id} cache entries get_product() uses; all
+# misses are fetched with one id=in.(...) query and cached one by one.
+
+MAX_BATCH = 100
+
+
+def _in_list_item(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+async def load_products(ids: list) -> dict:
+    """{id: row} for those of `ids` that exist, in at most one upstream call."""
+    if read_replica and read_replica.ready:
+        rows = [read_replica.get(product_id) for product_id in ids]
+    elif catalog_is_current():
+        rows = [catalog.get(product_id) for product_id in ids]
+    else:
+        params = {"select": "*", "id": f"in.({','.join(_in_list_item(pid) for pid in ids)})"}
+        url = f"{SUPABASE_URL}/rest/v1/products"
+        resp = await upstream.get_client().get(url, params=params, headers=get_supabase_headers())
+        if resp.status_code != 200:
+            raise upstream.UpstreamError(resp)
+        rows = resp.json()
+    return {row["id"]: row for row in rows if row}
+
+
+async def product_batch(ids: list, with_config: bool) -> Response:
+    ids = list(dict.fromkeys(pid.strip() for pid in ids if pid and pid.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids is required")
+    if len(ids) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} ids per batch")
+    keys = [f"product:{pid}" for pid in ids]
+
+    async def load(missing: list) -> dict:
+        rows = await load_products([key.partition(":")[2] for key in missing])
+        return {f"product:{pid}": EncodedJSON(row) for pid, row in rows.items()}
 
     try:
-        url = f"{SUPABASE_URL}/rest/v1/products?select=*"
-        if category and category != "all":
-            url += f"&category=eq.{category}"
-        url += "&order=created_at.desc"
-
-        async with httpx.AsyncClient(timeout=15) as client:
-            resp = await client.get(url, headers=get_supabase_headers())
-
-        if resp.status_code == 200:
-            data = resp.json()
-            cache.set(cache_key, data)
-            return data
-        return []
-    except Exception as e:
-        print(e)
-        return []
+        found = await cache.get_or_load_many(keys, load)
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        if not catalog.loaded:
+            raise upstream_unavailable(e)
+        found = {key: EncodedJSON(catalog.get(pid)) for pid, key in zip(ids, keys) if catalog.get(pid)}
+        mark_stale(catalog_age())
+
+    # Splice the cached encodings together rather than re-encoding rows
+    body = b'{"items":[' + b",".join(found[key].body for key in keys if key in found) + b"]"
+    body += b',"missing":' + fastjson.dumps([pid for pid, key in zip(ids, keys) if key not in found])
+    if with_config:
+        body += b',"config":' + fastjson.dumps(get_config())
+    headers = {"X-Cache": cache_status.get() or "MISS", **degraded_headers()}
+    return Response(content=body + b"}", media_type="application/json", headers=headers)
+
+
+@app.get("/api/products/batch")
+async def get_products_batch(ids: List[str] = Query(...), config: bool = False):
+    """?ids=a,b,c (or repeated ids=) -> {"items": [...], "missing": [...]},
+    items in request order; with config=true also the /api/config payload."""
+    return await product_batch([pid for value in ids for pid in value.split(",")], config)
+
+
+@app.post("/api/products/batch")
+async def post_products_batch(body: dict):
+    """Same as the GET form, for id lists too long for a URL:
+    {"ids": [...], "config": false}."""
+    ids = body.get("ids")
+    if not isinstance(ids, list) or not all(isinstance(pid, str) for pid in ids):
+        raise HTTPException(status_code=400, detail="ids must be a list of strings")
+    return await product_batch(ids, bool(body.get("config")))
+
+
+@app.get("/api/products/{product_id}/related")
+async def related_products(
+    response: Response,
+    product_id: str,
+    limit: int = Query(8, ge=1, le=related_index.k),
+    fields: Optional[str] = None,
+):
+    """Products most like this one (see related.py), most similar first."""
+    selected = parse_fields(fields)
+    try:
+        await ensure_catalog()
+    except (httpx.HTTPError, upstream.UpstreamError) as e:
+        raise upstream_unavailable(e)
+    if catalog.get(product_id) is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    response.headers.update(degraded_headers())
+    results = []
+    for other_id, _ in related_index.related(product_id, limit):
+        product = catalog.get(other_id)
+        if product is not None:
+            results.append({f: product.get(f) for f in selected} if selected else product)
+    return results
 
 
 @app.get("/api/products/{product_id}")
-async def get_product(product_id: str):
+async def get_product(request: Request, product_id: str):
     cache_key = f"product:{product_id}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
 
-    url = f"{SUPABASE_URL}/rest/v1/products?id=eq.{product_id}"
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.get(url, headers=get_supabase_headers())
+    async def load():
+        if read_replica and read_replica.ready:
+            row = read_replica.get(product_id)
+            if row is None:
+                raise HTTPException(status_code=404, detail="Product not found")
+            return EncodedJSON(row)
+
+        url = f"{SUPABASE_URL}/rest/v1/products?id=eq.{product_id}"
+        resp = await upstream.get_client().get(url, headers=get_supabase_headers())
+        if resp.status_code != 200:
+            raise upstream.UpstreamError(resp)
+        rows = resp.json()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return EncodedJSON(rows[0])
+
+    try:
+        return encoded_response(request, await cache.get_or_load(cache_key, load))
+    except upstream.UpstreamError as e:
+        if e.response.status_code < 500:
+            # e.g. an id that isn't a uuid
+            raise HTTPException(status_code=404, detail="Product not found")
+        error = e
+    except httpx.HTTPError as e:
+        error = e
+    row = catalog.get(product_id)
+    if row is None:
+        raise upstream_unavailable(error)
+    mark_stale(catalog_age())
+    return encoded_response(request, EncodedJSON(row))
+
+
+# ──────────────────────────────────────────
+# STARTUP WARM-UP
+# ──────────────────────────────────────────
+#
+# Runs in the background from the lifespan, so the server accepts
+# connections straight away; /ready answers 503 until the cache holds the
+# listings first visitors ask for (or WARMUP_TIMEOUT passes).
+
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "20"))
+# The projection the home page asks for
+WARMUP_FIELDS = "id,name,price,category,header_image,sizes"
+_PROCESS_STARTED = time.monotonic()
+warmup = {"ready": False, "seconds": None, "supabase": None, "prefetched": 0, "error": None}
+
+
+async def _warm_up_steps():
+    import database  # seed data is only needed once, here
+
+    warmup["supabase"] = await database.init_db()
+    await ensure_catalog()
+    categories = sorted({p.get("category") for p in catalog.products.values() if p.get("category")})
+    listings = [cached_listing(), cached_listing(selected=parse_fields(WARMUP_FIELDS))]
+    listings += [cached_listing(category) for category in categories]
+    await asyncio.gather(*listings)
+    warmup["prefetched"] = len(listings)
+
+
+async def _warm_up():
+    try:
+        await asyncio.wait_for(_warm_up_steps(), WARMUP_TIMEOUT)
+    except Exception as e:
+        # Serve anyway: the cache fills on demand
+        warmup["error"] = repr(e)
+        print(f"Warm-up incomplete: {e!r}")
+    warmup["seconds"] = round(time.monotonic() - _PROCESS_STARTED, 3)
+    warmup["ready"] = True
+    print(f"🚀 Ready in {warmup['seconds']}s ({warmup['prefetched']} listings prefetched)")
+
+
+@app.get("/ready")
+def ready():
+    return JSONResponse(warmup, status_code=200 if warmup["ready"] else 503)
+
+
+# ──────────────────────────────────────────
+# IMAGE PROXY
+# ──────────────────────────────────────────
+#
+# /img?src=<product image url>&w=640 permanently redirects to
+# /img/{key}?w=640&fmt=webp, where key is a hash of the source URL. That
+# URL is resized once, kept in the on-disk cache (see imgproxy.py) and
+# served as a file with immutable caching.
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+IMAGE_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def _pick_format(request: Request, fmt: Optional[str]) -> str:
+    if fmt:
+        if fmt not in IMAGE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"fmt must be one of {', '.join(IMAGE_FORMATS)}")
+        return fmt
+    return "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+
+
+@app.get("/img")
+def image_redirect(request: Request, src: str, w: Optional[int] = Query(None, ge=1), fmt: Optional[str] = None):
+    fmt_param = _pick_format(request, fmt)
+    target = f"/img/{imgproxy.image_key(src)}?" + urlencode({"w": imgproxy.snap_width(w), "fmt": fmt_param})
+    return RedirectResponse(target, status_code=308, headers={
+        "Cache-Control": "public, max-age=31536000",
+        "Vary": "Accept",
+    })
 
-    if resp.status_code != 200 or not resp.json():
-        raise HTTPException(status_code=404, detail="Product not found")
 
-    data = resp.json()[0]
-    cache.set(cache_key, data)
-    return data
+@app.get("/img/{key}")
+async def image_variant(request: Request, key: str, w: Optional[int] = Query(None, ge=1), fmt: Optional[str] = None):
+    negotiated = fmt is None
+    fmt = _pick_format(request, fmt)
+    width = imgproxy.snap_width(w)
+    path = imgproxy.cached_path(key, width, fmt)
+    if path is None:
+        try:
+            await ensure_catalog()
+        except (httpx.HTTPError, upstream.UpstreamError) as e:
+            raise upstream_unavailable(e)
+        url = image_sources.get(key)
+        if url is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        try:
+            path = await imgproxy.resized_path(key, url, width, fmt)
+        except images.ImageError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except (upstream.UpstreamError, httpx.HTTPError):
+            raise HTTPException(status_code=502, detail="Could not fetch source image")
+    headers = {"Cache-Control": IMMUTABLE}
+    if negotiated:
+        headers["Vary"] = "Accept"
+    return FileResponse(path, media_type=IMAGE_FORMATS[fmt], headers=headers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+import os
+import time
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+#
+# Minimal Prometheus instrumentation, served as text from /metrics.
+#
+# Everything runs on the event loop thread, so counters are plain attribute
+# increments with no locks. Each labelled child is created once and reused;
+# a histogram observation is one bisect and two additions. Buckets are
+# stored per bucket and only made cumulative when rendered.
+#
+# Values are per process: with several workers, each answers /metrics with
+# its own numbers (scrape them individually or sum by instance).
+
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+# When set, /metrics wants "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._children: dict = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(str(v))}"' for k, v in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = _Value
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {_format(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None):
+        # fn: read the value at scrape time instead of tracking it
+        super().__init__(name, help, labels)
+        self.fn = fn
+        if fn is not None:
+            self.labels()
+
+    def _render_child(self, values, child):
+        if self.fn is not None:
+            child.value = self.fn()
+        return super()._render_child(values, child)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def _render_child(self, values, child):
+        lines, running = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            running += count
+            le = 'le="' + _format(bound) + '"'
+            lines.append(f"{self.name}_bucket{self._label_text(values, le)} {running}")
+        labels = self._label_text(values)
+        lines.append(f"{self.name}_sum{labels} {child.sum!r}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+REGISTRY: list = []
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ──────────────────────────────────────────
+# METRICS
+# ──────────────────────────────────────────
+
+HTTP_REQUESTS = Counter("http_requests_total", "Requests handled, by route and status.",
+                        ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Time to the last response byte.",
+                         ("method", "route"))
+HTTP_RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size.",
+                               ("method", "route"), SIZE_BUCKETS)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.")
+
+CACHE_REQUESTS = Counter("cache_requests_total", "In-process cache lookups, by key family and result.",
+                         ("family", "result"))
+CACHE_EVICTIONS = Counter("cache_evictions_total", "Entries dropped for size or age, by key family.",
+                          ("family",))
+
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds",
+                             "Supabase calls until response headers, by table and PostgREST operation.",
+                             ("target", "operation", "status"))
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Upstream calls retried, by host.", ("host",))
+UPSTREAM_SHORT_CIRCUITS = Counter("upstream_short_circuits_total",
+                                  "Upstream calls failed fast by an open circuit, by host.", ("host",))
+
+IMAGE_RENDERS = Histogram("image_render_duration_seconds", "Image proxy resizes, by output format.", ("format",))
+
+
+def cache_family(key: str) -> str:
+    """Label for a cache key: products:shirts?limit=24 -> products."""
+    return key.partition(":")[0].partition("?")[0]
+
+
+# ──────────────────────────────────────────
+# ASGI MIDDLEWARE
+# ──────────────────────────────────────────
+
+_in_flight = HTTP_IN_FLIGHT.labels()
+
+
+class MetricsMiddleware:
+    """Per-route request counts, latency and response size. Routes are
+    labelled by their template ("/api/products/{product_id}"), so label
+    cardinality stays bounded; unmatched paths share one label."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        state = [500, 0]  # status, body bytes
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                state[1] += len(message.get("body", b""))
+            await send(message)
+
+        _in_flight.value += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _in_flight.value -= 1
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, path, str(state[0])).value += 1
+            HTTP_LATENCY.labels(method, path).observe(time.perf_counter() - started)
+            HTTP_RESPONSE_SIZE.labels(method, path).observe(state[1])
@@ -0,0 +1,268 @@
+"""Local stand-in for the Supabase PostgREST endpoints the API uses
+(`products`, `product_tombstones`), plus Storage uploads, for benchmarks
+and offline runs.
+
+    MOCK_ROWS=2000 MOCK_LATENCY_MS=20 uvicorn postgrest_mock:app --port 54321
+
+Supports the subset of PostgREST the backend sends: select, eq/neq/gt/gte/
+lt/lte/in/is filters with not., or=(...)/and(...), order with nullsfirst/
+nullslast, limit/offset, Prefer count=..., return=representation and
+resolution=merge-duplicates. Updates bump version/updated_at and deletes
+leave tombstones, like the triggers in supabase_setup.sql.
+"""
+import os
+import json
+import uuid
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+MOCK_ROWS = int(os.getenv("MOCK_ROWS", "500"))
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", "0"))
+MOCK_JITTER_MS = float(os.getenv("MOCK_JITTER_MS", "0"))
+MOCK_SEED = int(os.getenv("MOCK_SEED", "42"))
+
+CATEGORIES = ["shirts", "jackets", "pants", "tees", "accessories"]
+COLORS = ["Red Plaid", "Black", "Ice Blue", "Olive Green", "Cream", "Navy", "Rust"]
+SIZES = ["XS", "S", "M", "L", "XL", "XXL"]
+WORDS = ["vintage", "oversized", "flannel", "denim", "graphic", "washed", "cargo",
+         "leather", "corduroy", "bomber", "knit", "y2k", "retro", "distressed", "linen"]
+CONDITIONS = ["Good", "Very Good", "Excellent"]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def make_rows(n: int, seed: int = MOCK_SEED) -> dict:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = {}
+    for i in range(n):
+        product_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        name = " ".join(rng.sample(WORDS, 3)).title()
+        rows[product_id] = {
+            "id": product_id,
+            "name": name,
+            "price": rng.randrange(199, 4999),
+            "category": rng.choice(CATEGORIES),
+            "description": f"{name}. " + " ".join(rng.choices(WORDS, k=20)),
+            "header_image": f"https://images.example.com/{product_id}.jpg",
+            "images": [f"https://images.example.com/{product_id}-{k}.jpg" for k in range(3)],
+            "video_url": "",
+            "measurements": {"chest": f"{rng.randrange(36, 52)} in", "length": f"{rng.randrange(24, 34)} in"},
+            "color": rng.choice(COLORS),
+            "sizes": sorted(rng.sample(SIZES, rng.randrange(1, 4)), key=SIZES.index),
+            "condition": rng.choice(CONDITIONS),
+            "coupon_code": "",
+            "discount_amount": 0,
+            "created_at": (start + timedelta(minutes=i * 7)).isoformat(),
+            "version": 1,
+            "updated_at": (start + timedelta(minutes=i * 7)).isoformat(timespec="microseconds"),
+            "image_manifest": {},
+        }
+    return rows
+
+
+TABLES = {"products": make_rows(MOCK_ROWS), "product_tombstones": {}}
+OBJECTS: dict = {}  # "bucket/path" -> (content type, bytes)
+STATS = {"requests": 0, "by_method": {}}
+
+
+# ── filter parsing ──
+
+def _split_top(text: str) -> list:
+    """Split on commas outside parentheses and double quotes."""
+    parts, depth, quoted, current = [], 0, False, ""
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    parts.append(current)
+    return parts
+
+
+def _comparable(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            return value
+    return value
+
+
+def _compare(current, op: str, raw: str) -> bool:
+    if op == "is":
+        return current is None if raw == "null" else str(current).lower() == raw
+    if op == "in":
+        values = [v.strip().strip('"') for v in _split_top(raw.strip()[1:-1])]
+        return str(current) in values
+    if current is None:
+        return False
+    left, right = _comparable(current), _comparable(raw.strip('"'))
+    if type(left) is not type(right):
+        left, right = str(current), raw.strip('"')
+    return {
+        "eq": lambda: left == right, "neq": lambda: left != right,
+        "gt": lambda: left > right, "gte": lambda: left >= right,
+        "lt": lambda: left < right, "lte": lambda: left <= right,
+    }[op]()
+
+
+def _condition(row: dict, column: str, expr: str) -> bool:
+    if column in ("or", "and"):
+        results = []
+        for part in _split_top(expr.strip()[1:-1]):
+            if part.startswith(("or(", "and(")):
+                kind, _, rest = part.partition("(")
+                results.append(_condition(row, kind, "(" + rest))
+            else:
+                col, _, sub = part.partition(".")
+                results.append(_condition(row, col, sub))
+        return any(results) if column == "or" else all(results)
+    op, _, raw = expr.partition(".")
+    negate = op == "not"
+    if negate:
+        op, _, raw = raw.partition(".")
+    return _compare(row.get(column), op, raw) != negate
+
+
+RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _filtered(table: dict, params) -> list:
+    rows = list(table.values())
+    for key, value in params:
+        if key not in RESERVED:
+            rows = [row for row in rows if _condition(row, key, value)]
+    return rows
+
+
+def _ordered(rows: list, order: str) -> list:
+    for spec in reversed([s for s in order.split(",") if s]):
+        column, *flags = spec.split(".")
+        desc = "desc" in flags
+        nulls_first = "nullsfirst" in flags or ("nullslast" not in flags and desc)
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: _comparable(r[column]), reverse=desc)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+def _project(rows: list, select: str) -> list:
+    if select in ("", "*"):
+        return [dict(r) for r in rows]
+    columns = select.split(",")
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+# ── handlers ──
+
+async def _latency():
+    if MOCK_LATENCY_MS or MOCK_JITTER_MS:
+        await asyncio.sleep(max(0.0, MOCK_LATENCY_MS + random.uniform(-MOCK_JITTER_MS, MOCK_JITTER_MS)) / 1000)
+
+
+async def table_endpoint(request: Request):
+    name = request.path_params["table"]
+    table = TABLES.get(name)
+    if table is None:
+        return JSONResponse({"message": f'relation "public.{name}" does not exist'}, status_code=404)
+    STATS["requests"] += 1
+    STATS["by_method"][request.method] = STATS["by_method"].get(request.method, 0) + 1
+    await _latency()
+
+    params = list(request.query_params.multi_items())
+    query = dict(params)
+    prefer = request.headers.get("prefer", "")
+
+    if request.method == "GET":
+        rows = _ordered(_filtered(table, params), query.get("order", ""))
+        total = len(rows)
+        offset = int(query.get("offset", 0))
+        rows = rows[offset:]
+        if "limit" in query:
+            rows = rows[:int(query["limit"])]
+        headers = {}
+        if "count=" in prefer:
+            headers["content-range"] = f"{offset}-{offset + len(rows) - 1}/{total}"
+        return JSONResponse(_project(rows, query.get("select", "*")), headers=headers)
+
+    body = json.loads(await request.body() or b"null")
+    if request.method == "POST":
+        items = body if isinstance(body, list) else [body]
+        out = []
+        for item in items:
+            old = table.get(item.get("id"))
+            if old is not None and "merge-duplicates" not in prefer:
+                return JSONResponse({"message": "duplicate key value violates unique constraint"}, status_code=409)
+            row = {**(old or {"version": 1}), **item, "updated_at": _now()}
+            if old is not None:
+                row["version"] = old.get("version", 1) + 1
+            table[row["id"]] = row
+            out.append(row)
+        return JSONResponse(out if "return=representation" in prefer else None, status_code=201)
+
+    if request.method == "PATCH":
+        rows = _filtered(table, params)
+        for row in rows:
+            row.update(body)
+            row["version"] = row.get("version", 1) + 1
+            row["updated_at"] = _now()
+        return JSONResponse(rows if "return=representation" in prefer else None)
+
+    if request.method == "DELETE":
+        rows = _filtered(table, params)
+        for row in rows:
+            del table[row["id"]]
+            if name == "products":
+                TABLES["product_tombstones"][row["id"]] = {"id": row["id"], "deleted_at": _now()}
+        return JSONResponse(rows if "return=representation" in prefer else None)
+
+    return Response(status_code=405)
+
+
+async def object_endpoint(request: Request):
+    path = request.path_params["path"]
+    if request.method == "POST":
+        await _latency()
+        OBJECTS[path] = (request.headers.get("content-type", ""), await request.body())
+        return JSONResponse({"Key": path})
+    found = OBJECTS.get(path.removeprefix("public/"))
+    if found is None:
+        return JSONResponse({"message": "Object not found"}, status_code=404)
+    return Response(found[1], media_type=found[0])
+
+
+async def stats_endpoint(request: Request):
+    if request.method == "DELETE":
+        STATS.update(requests=0, by_method={})
+    return JSONResponse({**STATS, "rows": len(TABLES["products"]), "objects": len(OBJECTS)})
+
+
+app = Starlette(routes=[
+    Route("/rest/v1/{table}", table_endpoint, methods=["GET", "POST", "PATCH", "DELETE"]),
+    Route("/storage/v1/object/{path:path}", object_endpoint, methods=["GET", "POST"]),
+    Route("/_mock/stats", stats_endpoint, methods=["GET", "DELETE"]),
+])
@@ -0,0 +1,227 @@
+from typing import Callable, Optional
+
+import numpy as np
+
+from facets import parse_measure
+
+# ──────────────────────────────────────────
+# PRICING + SORT ORDERS
+# ──────────────────────────────────────────
+#
+# The effective price is what the product page charges once the product's
+# coupon is applied: price - discount_amount, never below 0, and only when
+# the product has a coupon_code (without one there is nothing to apply).
+#
+# Prices, discounts and newest-first keys are kept per slot. A catalog
+# change only marks the index dirty; the next read recomputes every
+# effective price in one vectorized pass and re-sorts the presorted orders:
+#
+#   newest       created_at DESC NULLS LAST, id DESC (the API's default)
+#   price_asc    effective price, cheapest first
+#   price_desc   effective price, dearest first
+#   discount     size of the coupon discount, biggest first
+#
+# Ties in every order fall back to newest first, and products without a
+# price sort last. A page is then a slice of an order, found from its
+# cursor by binary search, so paging never re-sorts.
+
+SORTS = ("newest", "price_asc", "price_desc", "discount")
+# Rows checked per step when a filter has to skip rows to fill a page
+SCAN_CHUNK = 256
+
+
+def effective_price(product: dict) -> Optional[float]:
+    price = parse_measure(product.get("price"))
+    if price is None:
+        return None
+    if not product.get("coupon_code"):
+        return price
+    return max(0.0, price - (parse_measure(product.get("discount_amount")) or 0.0))
+
+
+def _newest_key(product: dict) -> tuple:
+    created_at = product.get("created_at")
+    return (created_at is not None, created_at or "", product["id"])
+
+
+class PriceIndex:
+    def __init__(self):
+        self._slot_of: dict = {}  # product_id -> slot
+        self._id_at: list = []  # slot -> product_id (None when free)
+        self._free: list = []
+        self._newest_at: list = []  # slot -> _newest_key()
+        self._price = np.zeros(0, dtype=np.float64)  # NaN = no price
+        self._discount = np.zeros(0, dtype=np.float64)
+        self._coupon = np.zeros(0, dtype=bool)
+        self._live = np.zeros(0, dtype=bool)
+        self._dirty = True
+        # Rebuilt on read when dirty
+        self._effective = np.zeros(0, dtype=np.float64)
+        self._saving = np.zeros(0, dtype=np.float64)
+        self._rank = np.zeros(0, dtype=np.int64)  # slot -> position in the newest order
+        self._orders: dict = {}  # sort -> slots in order
+        self._keys: dict = {}  # sort -> (primary key, newest rank) of each position, both ascending
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    # ── Catalog index hooks ──
+
+    def rebuild(self, products: list):
+        self.__init__()
+        n = len(products)
+        self._id_at = [p["id"] for p in products]
+        self._slot_of = {pid: slot for slot, pid in enumerate(self._id_at)}
+        self._newest_at = [_newest_key(p) for p in products]
+        self._price = np.array([self._number(p.get("price")) for p in products], dtype=np.float64)
+        self._discount = np.array([self._number(p.get("discount_amount")) for p in products], dtype=np.float64)
+        self._coupon = np.array([bool(p.get("coupon_code")) for p in products], dtype=bool)
+        self._live = np.ones(n, dtype=bool)
+
+    def upsert(self, product: dict, old=None):
+        slot = self._slot_of.get(product["id"])
+        if slot is None:
+            slot = self._take_slot(product["id"])
+        self._newest_at[slot] = _newest_key(product)
+        self._price[slot] = self._number(product.get("price"))
+        self._discount[slot] = self._number(product.get("discount_amount"))
+        self._coupon[slot] = bool(product.get("coupon_code"))
+        self._live[slot] = True
+        self._dirty = True
+
+    def remove(self, product_id: str, old=None):
+        slot = self._slot_of.pop(product_id, None)
+        if slot is None:
+            return
+        self._id_at[slot] = None
+        self._free.append(slot)
+        self._live[slot] = False
+        self._dirty = True
+
+    # ── lookups ──
+
+    def effective_price(self, product_id: str) -> Optional[float]:
+        self._refresh()
+        slot = self._slot_of.get(product_id)
+        if slot is None or np.isnan(self._effective[slot]):
+            return None
+        return float(self._effective[slot])
+
+    def page(self, sort: str, limit: Optional[int] = None, after: Optional[tuple] = None,
+             accept: Optional[Callable[[str], bool]] = None) -> list:
+        """Product ids in `sort` order after the cursor position `after`
+        ((sort key, created_at, id) of the last row seen; the sort key is
+        ignored for newest), up to `limit` of those `accept` lets through."""
+        self._refresh()
+        order = self._orders[sort]
+        start = self._start(sort, after) if after else 0
+        if accept is None:
+            end = start + limit if limit else len(order)
+            return [self._id_at[slot] for slot in order[start:end].tolist()]
+
+        found = []
+        while start < len(order) and (not limit or len(found) < limit):
+            for slot in order[start:start + SCAN_CHUNK].tolist():
+                product_id = self._id_at[slot]
+                if accept(product_id):
+                    found.append(product_id)
+                    if len(found) == limit:
+                        break
+            start += SCAN_CHUNK
+        return found
+
+    def sort_key(self, sort: str, product_id: str) -> Optional[float]:
+        """The value `sort` orders product_id by, for its cursor."""
+        self._refresh()
+        slot = self._slot_of[product_id]
+        value = self._saving[slot] if sort == "discount" else self._effective[slot]
+        return None if sort == "newest" or np.isnan(value) else float(value)
+
+    # ── internals ──
+
+    @staticmethod
+    def _number(value) -> float:
+        number = parse_measure(value)
+        return np.nan if number is None else number
+
+    def _take_slot(self, product_id: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._id_at[slot] = product_id
+        else:
+            slot = len(self._id_at)
+            self._id_at.append(product_id)
+            self._newest_at.append(None)
+            if slot >= len(self._price):
+                self._grow(max(16, slot * 2))
+        self._slot_of[product_id] = slot
+        return slot
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self._price)
+        self._price = np.concatenate([self._price, np.full(extra, np.nan)])
+        self._discount = np.concatenate([self._discount, np.zeros(extra)])
+        self._coupon = np.concatenate([self._coupon, np.zeros(extra, dtype=bool)])
+        self._live = np.concatenate([self._live, np.zeros(extra, dtype=bool)])
+
+    def _refresh(self):
+        """Recompute effective prices and every order, in one pass."""
+        if not self._dirty:
+            return
+        n = len(self._id_at)
+        price, live = self._price[:n], self._live[:n]
+        discount = np.nan_to_num(self._discount[:n])
+        self._saving = np.where(self._coupon[:n], np.clip(discount, 0.0, np.nan_to_num(price)), 0.0)
+        self._effective = price - self._saving
+
+        # The newest keys are strings, so sort them once and give every slot
+        # its rank; the other orders then tie-break on the integer rank
+        keys = sorted((key, slot) for slot, key in enumerate(self._newest_at[:n]) if live[slot])
+        newest = np.array([slot for _, slot in reversed(keys)], dtype=np.int64)
+        self._rank = np.full(n, len(newest), dtype=np.int64)
+        self._rank[newest] = np.arange(len(newest))
+
+        slots = np.nonzero(live)[0]
+        rank = self._rank[slots]
+        primaries = {
+            "price_asc": self._effective[slots],
+            "price_desc": -self._effective[slots],
+            "discount": -self._saving[slots],
+        }
+        self._orders = {"newest": newest}
+        self._keys = {"newest": (None, np.arange(len(newest)))}
+        for sort, primary in primaries.items():
+            order = np.lexsort((rank, primary))  # NaN (no price) sorts last
+            self._orders[sort] = slots[order]
+            self._keys[sort] = (primary[order], rank[order])
+        self._dirty = False
+
+    def _newest_position(self, created_at, product_id: str) -> float:
+        """Where (created_at, id) falls in the newest order: its index if
+        it is there, else halfway between its neighbours."""
+        key = (created_at is not None, created_at or "", str(product_id))
+        newest = self._orders["newest"]
+        lo, hi = 0, len(newest)
+        while lo < hi:  # first position whose key is <= key (keys descend)
+            mid = (lo + hi) // 2
+            if self._newest_at[newest[mid]] > key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(newest) and self._newest_at[newest[lo]] == key:
+            return float(lo)
+        return lo - 0.5
+
+    def _start(self, sort: str, after: tuple) -> int:
+        value, created_at, product_id = after
+        rank = self._newest_position(created_at, product_id)
+        primary, ranks = self._keys[sort]
+        if primary is None:
+            return int(np.searchsorted(ranks, rank, side="right"))
+        if value is None:
+            value = np.nan
+        elif sort != "price_asc":
+            value = -value
+        lo = int(np.searchsorted(primary, value, side="left"))
+        hi = int(np.searchsorted(primary, value, side="right"))
+        return lo + int(np.searchsorted(ranks[lo:hi], rank, side="right"))
@@ -0,0 +1,162 @@
+import os
+import time
+import ipaddress
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+#
+# Per-client token buckets, in memory and per process. Each rule is
+# "requests per second, burst": a client may make `burst` requests at once
+# and `rate` per second after that; the rest get 429 with Retry-After.
+#
+#   login    POST /api/auth/login, strict, to slow password guessing
+#   images   /img/..., where one page asks for many variants at once
+#   public   everything else
+#
+# /health, /ready and /metrics are never limited. Idle buckets are dropped
+# every RATE_LIMIT_COMPACT_INTERVAL, so memory follows active clients only.
+#
+# Behind a proxy (Render's, for one) every request comes from the proxy's
+# address, so without RATE_LIMIT_PROXY_HOPS all visitors would share one
+# bucket. Limiting is therefore off until the hop count is set (or
+# RATE_LIMIT=1 says the app is reached directly). X-Forwarded-For is only
+# read from peers in RATE_LIMIT_TRUSTED_PROXIES, private networks by
+# default, so clients that reach the app directly can't pick their IP.
+
+# Proxies in front of the app that append to X-Forwarded-For (1 on
+# Render); 0 = use the socket peer. Only count proxies you run.
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS") or "0")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT", "1" if RATE_LIMIT_PROXY_HOPS else "0") == "1"
+RATE_LIMIT_TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip())
+    for net in os.getenv("RATE_LIMIT_TRUSTED_PROXIES",
+                         "10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,127.0.0.0/8,::1/128,fc00::/7").split(",")
+    if net.strip()
+]
+RATE_LIMIT_COMPACT_INTERVAL = float(os.getenv("RATE_LIMIT_COMPACT_INTERVAL", "60"))  # seconds
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+
+
+def _rule(name: str, default: str) -> tuple:
+    rate, _, burst = os.getenv(f"RATE_LIMIT_{name.upper()}", default).partition(",")
+    return float(rate), float(burst or rate)
+
+
+RULES = {
+    "login": _rule("login", "0.1,5"),  # 6 a minute after the first 5
+    "images": _rule("images", "50,200"),
+    "public": _rule("public", "20,60"),
+}
+EXEMPT = {"/health", "/ready", "/metrics"}
+
+RATE_LIMITED = metrics.Counter("rate_limited_total", "Requests refused with 429, by rule.", ("rule",))
+
+
+def rule_for(method: str, path: str) -> str:
+    if path == "/api/auth/login" and method == "POST":
+        return "login"
+    if path == "/img" or path.startswith("/img/"):
+        return "images"
+    return "public"
+
+
+def _trusted(peer: str) -> bool:
+    try:
+        address = ipaddress.ip_address(peer)
+    except ValueError:
+        return False
+    return any(address in net for net in RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def client_ip(scope) -> str:
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if not RATE_LIMIT_PROXY_HOPS or not _trusted(peer):
+        return peer
+    # Repeated headers count as one list, in order
+    hops = [ip.strip() for name, value in scope["headers"] if name == b"x-forwarded-for"
+            for ip in value.decode("latin-1").split(",")]
+    hops = [ip for ip in hops if ip]
+    # Each of our N proxies appended the address it got the request from,
+    # so the client's is the Nth from the right
+    if len(hops) >= RATE_LIMIT_PROXY_HOPS:
+        return hops[-RATE_LIMIT_PROXY_HOPS]
+    return peer
+
+
+class TokenBuckets:
+    def __init__(self, rules: dict = RULES, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.rules = rules
+        self.max_clients = max_clients
+        self._buckets: dict = {}  # (rule, client) -> [tokens, updated]
+        self._compacted = time.monotonic()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, rule: str, client: str) -> float:
+        """Spend one token; 0 if there was one, else seconds until there is."""
+        rate, burst = self.rules[rule]
+        now = time.monotonic()
+        if now - self._compacted > RATE_LIMIT_COMPACT_INTERVAL or len(self._buckets) > self.max_clients:
+            self.compact(now)
+        bucket = self._buckets.get((rule, client))
+        if bucket is None:
+            bucket = self._buckets[(rule, client)] = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def compact(self, now: float):
+        """Drop buckets that have refilled (a new one would be identical);
+        past max_clients, drop the least recently used as well."""
+        self._compacted = now
+        for key, (tokens, updated) in list(self._buckets.items()):
+            rate, burst = self.rules[key[0]]
+            if tokens + (now - updated) * rate >= burst:
+                del self._buckets[key]
+        if len(self._buckets) > self.max_clients:
+            oldest = sorted(self._buckets.items(), key=lambda item: item[1][1])
+            for key, _ in oldest[:len(self._buckets) - self.max_clients // 2]:
+                del self._buckets[key]
+
+
+buckets = TokenBuckets()
+metrics.Gauge("rate_limit_buckets", "Clients currently tracked by the rate limiter.", fn=lambda: len(buckets))
+
+
+# ──────────────────────────────────────────
+# ASGI MIDDLEWARE
+# ──────────────────────────────────────────
+
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        rule = rule_for(scope["method"], scope["path"])
+        wait = buckets.take(rule, client_ip(scope))
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        RATE_LIMITED.labels(rule).value += 1
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"retry-after", str(max(1, int(wait + 0.999))).encode())],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Too many requests"}'})
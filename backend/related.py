@@ -0,0 +1,325 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+from facets import COLOR_ALIASES, normalize_colors, normalize_sizes, parse_measure
+
+# ──────────────────────────────────────────
+# RELATED PRODUCTS
+# ──────────────────────────────────────────
+#
+# Each product becomes a feature vector made of weighted, unit-length blocks:
+#
+#   category       one-hot
+#   color          multi-hot over the colour families in facets.py
+#   sizes          multi-hot, so the dot product measures size overlap
+#   price          soft one-hot over log-spaced price bands
+#   measurements   soft one-hot over bands of each common measurement
+#
+# A dot product of two vectors is then a weighted sum of per-feature
+# similarities. Scores for the whole catalog are computed BLOCK rows at a
+# time in one matrix product, and only the top NEIGHBORS per product are
+# kept, so a lookup is a row read. A catalog change rescores the changed
+# products against everyone, plus the few rows whose neighbour lists they
+# entered or left, in one pass per batch.
+#
+# The category and size blocks keep SPARE_COLUMNS unused columns, so a new
+# category or size takes one of those instead of a full rebuild; only when
+# they run out is the layout built again (once per batch).
+
+NEIGHBORS = 24
+BLOCK = 1024
+WEIGHTS = {"category": 3.0, "color": 1.5, "sizes": 1.0, "price": 1.5, "measurements": 1.0}
+# Price bands are 25% apart; a band's neighbours still count a little
+PRICE_STEP = math.log(1.25)
+PRICE_SPREAD = 1.0  # in bands
+MEASURE_KEYS = 6  # most common measurement keys that get a block
+MEASURE_BANDS = 8
+SPARE_COLUMNS = 8
+
+COLORS = sorted(set(COLOR_ALIASES.values()))
+
+
+def _soft_bands(value: float, start: float, step: float, count: int, spread: float) -> np.ndarray:
+    centres = start + step * np.arange(count)
+    return np.exp(-0.5 * ((value - centres) / (step * spread)) ** 2)
+
+
+class _Layout:
+    """Column ranges of each feature block, fixed at rebuild time from the
+    values the catalog has."""
+
+    def __init__(self, products: list):
+        self.categories = {c: i for i, c in enumerate(sorted({self.category(p) for p in products} - {""}))}
+        self.sizes = {s: i for i, s in enumerate(sorted(set().union(*(normalize_sizes(p.get("sizes")) for p in products))))}
+        self.colors = {c: i for i, c in enumerate(COLORS)}
+        self.category_columns = len(self.categories) + SPARE_COLUMNS
+        self.size_columns = len(self.sizes) + SPARE_COLUMNS
+
+        prices = [v for v in (parse_measure(p.get("price")) for p in products) if v and v > 0]
+        low, high = (math.log(min(prices)), math.log(max(prices))) if prices else (0.0, 0.0)
+        self.price_start = low
+        self.price_bands = int((high - low) / PRICE_STEP) + 1
+
+        seen = Counter()
+        ranges = {}
+        for product in products:
+            for key, value in self.measurements(product).items():
+                seen[key] += 1
+                lo, hi = ranges.get(key, (value, value))
+                ranges[key] = (min(lo, value), max(hi, value))
+        self.measures = {}  # key -> (start, step)
+        for key, _ in seen.most_common(MEASURE_KEYS):
+            lo, hi = ranges[key]
+            self.measures[key] = (lo, max(hi - lo, 1.0) / (MEASURE_BANDS - 1))
+
+        self.blocks = {}
+        width = 0
+        for name, size in (("category", self.category_columns), ("color", len(self.colors)),
+                           ("sizes", self.size_columns), ("price", self.price_bands),
+                           ("measurements", MEASURE_BANDS * len(self.measures))):
+            self.blocks[name] = (width, width + size)
+            width += size
+        self.width = width
+
+    @staticmethod
+    def category(product: dict) -> str:
+        return str(product.get("category") or "").strip().lower()
+
+    @staticmethod
+    def measurements(product: dict) -> dict:
+        raw = product.get("measurements")
+        if not isinstance(raw, dict):
+            return {}
+        values = {key.strip().lower(): parse_measure(value) for key, value in raw.items()}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def make_room(self, product: dict) -> bool:
+        """Give each new categorical value of product a spare column; False
+        if there are not enough left."""
+        category = self.category(product)
+        new_categories = {category} - self.categories.keys() - {""}
+        new_sizes = normalize_sizes(product.get("sizes")) - self.sizes.keys()
+        if (len(self.categories) + len(new_categories) > self.category_columns
+                or len(self.sizes) + len(new_sizes) > self.size_columns):
+            return False
+        for value in new_categories:
+            self.categories[value] = len(self.categories)
+        for value in sorted(new_sizes):
+            self.sizes[value] = len(self.sizes)
+        return True
+
+    def vector(self, product: dict) -> np.ndarray:
+        vec = np.zeros(self.width, dtype=np.float32)
+        parts = {name: vec[start:end] for name, (start, end) in self.blocks.items()}
+
+        category = self.category(product)
+        if category in self.categories:
+            parts["category"][self.categories[category]] = 1.0
+        for color in normalize_colors(product.get("color")):
+            parts["color"][self.colors[color]] = 1.0
+        for size in normalize_sizes(product.get("sizes")):
+            if size in self.sizes:
+                parts["sizes"][self.sizes[size]] = 1.0
+        price = parse_measure(product.get("price"))
+        if price and price > 0 and self.price_bands:
+            parts["price"][:] = _soft_bands(math.log(price), self.price_start, PRICE_STEP,
+                                            self.price_bands, PRICE_SPREAD)
+        values = self.measurements(product)
+        for i, (key, (start, step)) in enumerate(self.measures.items()):
+            if key in values:
+                bands = parts["measurements"][i * MEASURE_BANDS:(i + 1) * MEASURE_BANDS]
+                bands[:] = _soft_bands(values[key], start, step, MEASURE_BANDS, 1.0)
+                # each measurement gets an equal share of the block's weight
+                bands *= 1.0 / math.sqrt(len(self.measures))
+
+        for name, part in parts.items():
+            norm = float(np.linalg.norm(part))
+            if norm and name != "measurements":
+                part *= math.sqrt(WEIGHTS[name]) / norm
+            elif norm:
+                part *= math.sqrt(WEIGHTS[name])
+        return vec
+
+
+class RelatedIndex:
+    def __init__(self, neighbors: int = NEIGHBORS):
+        self.k = neighbors
+        self._layout = _Layout([])
+        self._rows: dict = {}  # product_id -> product, to lay out again from
+        self._slot_of: dict = {}  # product_id -> row
+        self._id_at: list = []  # row -> product_id (None when free)
+        self._free: list = []
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._live = np.zeros(0, dtype=bool)
+        self._nbr = np.zeros((0, neighbors), dtype=np.int32)  # row -> neighbour rows, best first (-1 = none)
+        self._nbr_score = np.zeros((0, neighbors), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    # ── Catalog index hooks ──
+
+    def rebuild(self, products: list):
+        self.__init__(self.k)
+        self._layout = _Layout(products)
+        n = len(products)
+        self._rows = {p["id"]: p for p in products}
+        self._id_at = [p["id"] for p in products]
+        self._slot_of = {pid: row for row, pid in enumerate(self._id_at)}
+        self._vectors = np.zeros((n, self._layout.width), dtype=np.float32)
+        for row, product in enumerate(products):
+            self._vectors[row] = self._layout.vector(product)
+        self._live = np.ones(n, dtype=bool)
+        self._nbr = np.full((n, self.k), -1, dtype=np.int32)
+        self._nbr_score = np.zeros((n, self.k), dtype=np.float32)
+        self._rescore(np.arange(n))
+
+    def upsert(self, product: dict, old=None):
+        self.apply([(product, old)], [])
+
+    def remove(self, product_id: str, old=None):
+        self.apply([], [(product_id, old)])
+
+    def apply(self, upserts: list, removals: list):
+        products = [product for product, _ in upserts]
+        if not all([self._layout.make_room(product) for product in products]):
+            # Out of spare columns: lay out again, once for the whole batch
+            rows = dict(self._rows)
+            rows.update((product["id"], product) for product in products)
+            for product_id, _ in removals:
+                rows.pop(product_id, None)
+            self.rebuild(list(rows.values()))
+            return
+
+        changed = []
+        for product in products:
+            row = self._slot_of.get(product["id"])
+            if row is None:
+                row = self._take_row(product["id"])
+            self._rows[product["id"]] = product
+            self._vectors[row] = self._layout.vector(product)
+            self._live[row] = True
+            changed.append(row)
+        dropped = []
+        for product_id, _ in removals:
+            row = self._slot_of.pop(product_id, None)
+            if row is None:
+                continue
+            self._rows.pop(product_id, None)
+            self._id_at[row] = None
+            self._free.append(row)
+            self._vectors[row] = 0.0
+            self._live[row] = False
+            self._nbr[row] = -1
+            dropped.append(row)
+        changed = [row for row in dict.fromkeys(changed) if self._live[row]]
+        if changed or dropped:
+            self._refresh_around(np.array(changed, dtype=np.int64), np.array(dropped, dtype=np.int64))
+
+    # ── lookups ──
+
+    def related(self, product_id: str, limit: int = 8) -> list:
+        """Up to `limit` (product_id, score) pairs, most similar first."""
+        row = self._slot_of.get(product_id)
+        if row is None:
+            return []
+        found = []
+        for other, score in zip(self._nbr[row], self._nbr_score[row]):
+            if other < 0 or len(found) == limit:
+                break
+            found.append((self._id_at[other], float(score)))
+        return found
+
+    # ── internals ──
+
+    def _take_row(self, product_id: str) -> int:
+        if self._free:
+            row = self._free.pop()
+            self._id_at[row] = product_id
+        else:
+            row = len(self._id_at)
+            self._id_at.append(product_id)
+            if row >= len(self._vectors):
+                self._grow(max(16, row * 2))
+        self._slot_of[product_id] = row
+        return row
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self._vectors)
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self._layout.width), dtype=np.float32)])
+        self._live = np.concatenate([self._live, np.zeros(extra, dtype=bool)])
+        self._nbr = np.vstack([self._nbr, np.full((extra, self.k), -1, dtype=np.int32)])
+        self._nbr_score = np.vstack([self._nbr_score, np.zeros((extra, self.k), dtype=np.float32)])
+
+    def _rescore(self, rows: np.ndarray):
+        """Recompute the neighbour lists of `rows` against every product,
+        BLOCK rows per matrix product."""
+        live = self._live
+        k = min(self.k, max(int(live.sum()) - 1, 0))
+        for start in range(0, len(rows), BLOCK):
+            block = rows[start:start + BLOCK]
+            scores = self._vectors[block] @ self._vectors.T
+            scores[:, ~live] = -np.inf
+            scores[np.arange(len(block)), block] = -np.inf  # not related to itself
+            self._nbr[block] = -1
+            self._nbr_score[block] = 0.0
+            if k == 0:
+                continue
+            top = np.argpartition(scores, -k, axis=1)[:, -k:]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            self._nbr[block, :k] = np.take_along_axis(top, order, axis=1)
+            self._nbr_score[block, :k] = np.take_along_axis(top_scores, order, axis=1)
+
+    def _refresh_around(self, changed: np.ndarray, dropped: np.ndarray):
+        """After the vectors of `changed` rows changed and `dropped` rows
+        went, bring every neighbour list up to date.
+
+        Every row outside a list scores at most the list's weakest entry
+        `w`. So a row that lost no neighbour, and whose listed changed rows
+        still score at least `w`, gets its exact new list by merging the
+        changed rows' new scores into the old list. Only the changed rows
+        themselves and the rest are rescored against everyone."""
+        count = len(self._id_at)
+        live = self._live[:count]
+        k = min(self.k, max(int(live.sum()) - 1, 0))
+        if len(changed) > BLOCK or k == 0:
+            self._rescore(np.nonzero(live)[0])
+            return
+        if not len(changed):
+            self._rescore(np.nonzero(np.isin(self._nbr[:count], dropped).any(axis=1) & live)[0])
+            return
+
+        nbr, nbr_score = self._nbr[:count], self._nbr_score[:count]
+        scores = self._vectors[:count] @ self._vectors[changed].T  # row x changed row
+        scores[changed, np.arange(len(changed))] = -np.inf
+        weakest = np.where(nbr[:, k - 1] < 0, -np.inf, nbr_score[:, k - 1])
+
+        column = np.full(len(self._live), -1)
+        column[changed] = np.arange(len(changed))
+        listed = np.where(nbr >= 0, column[nbr], -1)  # column of each listed changed row
+        is_listed = listed >= 0
+        listed_score = np.take_along_axis(scores, np.maximum(listed, 0), axis=1)
+
+        rescore = np.isin(nbr, dropped).any(axis=1)
+        rescore |= (is_listed & (listed_score < weakest[:, None])).any(axis=1)
+        rescore[changed] = True
+        rescore &= live
+        merge = live & ~rescore & (is_listed.any(axis=1) | (scores > weakest[:, None]).any(axis=1))
+
+        rows = np.nonzero(merge)[0]
+        if len(rows):
+            kept_score = np.where((nbr[rows] >= 0) & ~is_listed[rows], nbr_score[rows], -np.inf)
+            candidates = np.hstack([np.where(np.isinf(kept_score), -1, nbr[rows]),
+                                    np.broadcast_to(changed, (len(rows), len(changed)))])
+            candidate_scores = np.hstack([kept_score, scores[rows]]).astype(np.float32)
+            order = np.argsort(-candidate_scores, axis=1, kind="stable")[:, :k]
+            top = np.take_along_axis(candidates, order, axis=1)
+            top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+            self._nbr[rows] = -1
+            self._nbr_score[rows] = 0.0
+            self._nbr[rows, :k] = np.where(np.isinf(top_scores), -1, top)
+            self._nbr_score[rows, :k] = np.where(np.isinf(top_scores), 0.0, top_scores)
+        self._rescore(np.nonzero(rescore)[0])
@@ -0,0 +1,263 @@
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+from typing import Optional
+
+from dotenv import load_dotenv
+
+import upstream
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+#
+# Optional local copy of the Supabase `products` table. Public reads are
+# served from it once it has synced; admin writes go to Supabase first and
+# are then applied here.
+
+REPLICA_ENABLED = os.getenv("READ_REPLICA", "0") == "1"
+REPLICA_PATH = os.getenv("READ_REPLICA_PATH", os.path.join(os.path.dirname(__file__), "replica.db"))
+REPLICA_SYNC_INTERVAL = float(os.getenv("READ_REPLICA_SYNC_INTERVAL", "15"))
+# Used when the change feed (changes.py) is unavailable: every Nth sync
+# re-reads the whole table to pick up edits and deletes made outside this
+# process; the others only pull rows newer than the newest one
+REPLICA_FULL_SYNC_EVERY = int(os.getenv("READ_REPLICA_FULL_SYNC_EVERY", "20"))
+REPLICA_PAGE_SIZE = 1000
+
+COLUMNS = [
+    "id", "name", "price", "category", "description", "header_image", "images",
+    "video_url", "measurements", "color", "sizes", "condition", "coupon_code",
+    "discount_amount", "created_at", "version", "updated_at", "image_manifest",
+]
+JSON_COLUMNS = {"images": [], "measurements": {}, "sizes": [], "image_manifest": {}}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    category TEXT DEFAULT 'shirts',
+    description TEXT,
+    header_image TEXT,
+    images TEXT DEFAULT '[]',
+    video_url TEXT DEFAULT '',
+    measurements TEXT DEFAULT '{}',
+    color TEXT DEFAULT '',
+    sizes TEXT DEFAULT '[]',
+    condition TEXT DEFAULT 'Good',
+    coupon_code TEXT DEFAULT '',
+    discount_amount REAL DEFAULT 0,
+    created_at TEXT,
+    version INTEGER DEFAULT 1,
+    updated_at TEXT,
+    image_manifest TEXT DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS products_category_created
+    ON products (category, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS products_created
+    ON products (created_at DESC, id DESC);
+"""
+
+MIGRATIONS = {
+    "version": "version INTEGER DEFAULT 1",
+    "updated_at": "updated_at TEXT",
+    "image_manifest": "image_manifest TEXT DEFAULT '{}'",
+}
+
+ORDER_BY = "ORDER BY created_at IS NULL, created_at DESC, id DESC"
+
+
+def _to_db(row: dict) -> tuple:
+    values = []
+    for col in COLUMNS:
+        value = row.get(col)
+        if col in JSON_COLUMNS:
+            value = json.dumps(value if value is not None else JSON_COLUMNS[col])
+        values.append(value)
+    return tuple(values)
+
+
+def _from_db(cursor: sqlite3.Cursor, values: tuple) -> dict:
+    row = {}
+    for (col, *_), value in zip(cursor.description, values):
+        if col in JSON_COLUMNS:
+            value = json.loads(value) if value else JSON_COLUMNS[col]
+        row[col] = value
+    return row
+
+
+# ──────────────────────────────────────────
+# REPLICA
+# ──────────────────────────────────────────
+
+class Replica:
+    def __init__(self, path: str = REPLICA_PATH):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self._migrate()
+        self._reader = self._connect()
+        self._reader.row_factory = _from_db
+        self._syncs = 0
+        # A replica left over from a previous run is good enough to serve
+        # from straight away (and is what keeps us up if Supabase is not)
+        self.ready = self.count() > 0
+
+    def _migrate(self):
+        # Replicas created before a column existed upstream
+        present = {row[1] for row in self._writer.execute("PRAGMA table_info(products)")}
+        for column, ddl in MIGRATIONS.items():
+            if column not in present:
+                self._writer.execute(f"ALTER TABLE products ADD COLUMN {ddl}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
+    # ── reads (fast enough to run on the event loop) ──
+
+    def count(self, category: Optional[str] = None) -> int:
+        if category and category != "all":
+            return self._reader.execute(
+                "SELECT COUNT(*) AS n FROM products WHERE category = ?", (category,)
+            ).fetchone()["n"]
+        return self._reader.execute("SELECT COUNT(*) AS n FROM products").fetchone()["n"]
+
+    def get(self, product_id: str) -> Optional[dict]:
+        return self._reader.execute("SELECT * FROM products WHERE id = ?", (product_id,)).fetchone()
+
+    def list(self, category: Optional[str] = None, fields: Optional[list] = None,
+             limit: Optional[int] = None, after: Optional[tuple] = None) -> list:
+        """Rows in API order (newest first); `after` is a decoded
+        (created_at, id) keyset cursor."""
+        select = ", ".join(c for c in (fields or COLUMNS) if c in COLUMNS)
+        where, args = [], []
+        if category and category != "all":
+            where.append("category = ?")
+            args.append(category)
+        if after:
+            created_at, product_id = after
+            if created_at is None:
+                where.append("(created_at IS NULL AND id < ?)")
+                args.append(product_id)
+            else:
+                where.append("(created_at < ? OR created_at IS NULL OR (created_at = ? AND id < ?))")
+                args += [created_at, created_at, product_id]
+        sql = f"SELECT {select} FROM products"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " " + ORDER_BY
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return self._reader.execute(sql, args).fetchall()
+
+    def newest_created_at(self) -> Optional[str]:
+        return self._reader.execute("SELECT MAX(created_at) AS ts FROM products").fetchone()["ts"]
+
+    def newest_updated_at(self) -> Optional[str]:
+        return self._reader.execute("SELECT MAX(updated_at) AS ts FROM products").fetchone()["ts"]
+
+    # ── writes (call through asyncio.to_thread for big batches) ──
+
+    def upsert(self, rows: list) -> list:
+        """Insert or replace rows; returns (id, old_category, new_category)
+        for every row that actually changed."""
+        changed = []
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        with self._write_lock:
+            self._writer.execute("BEGIN")
+            try:
+                for row in rows:
+                    values = _to_db(row)
+                    old = self._writer.execute(
+                        f"SELECT {', '.join(COLUMNS)} FROM products WHERE id = ?", (row["id"],)
+                    ).fetchone()
+                    if old == values:
+                        continue
+                    self._writer.execute(
+                        f"INSERT OR REPLACE INTO products ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                        values,
+                    )
+                    changed.append((row["id"], old[3] if old else None, row.get("category")))
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                raise
+        return changed
+
+    def delete(self, ids: list) -> list:
+        changed = []
+        with self._write_lock:
+            self._writer.execute("BEGIN")
+            try:
+                for product_id in ids:
+                    old = self._writer.execute(
+                        "DELETE FROM products WHERE id = ? RETURNING category", (product_id,)
+                    ).fetchone()
+                    if old:
+                        changed.append((product_id, old[0], None))
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                raise
+        return changed
+
+    def replace_all(self, rows: list) -> list:
+        """Make the replica match `rows` exactly (a full upstream snapshot)."""
+        keep = {row["id"] for row in rows}
+        with self._write_lock:
+            existing = [r[0] for r in self._writer.execute("SELECT id FROM products")]
+        changed = self.upsert(rows)
+        changed += self.delete([pid for pid in existing if pid not in keep])
+        return changed
+
+    # ── sync ──
+
+    async def sync(self, client, base_url: str, headers: dict) -> list:
+        """Pull changes from Supabase; returns the changed (id, old, new)
+        category triples so callers can invalidate derived caches."""
+        full = not self.ready or self._syncs % REPLICA_FULL_SYNC_EVERY == 0
+        self._syncs += 1
+        url = f"{base_url}/rest/v1/products"
+
+        if full:
+            rows, last_id = [], None
+            while True:
+                params = [("select", "*"), ("order", "id"), ("limit", str(REPLICA_PAGE_SIZE))]
+                if last_id is not None:
+                    params.append(("id", f'gt."{last_id}"'))
+                page = await _fetch(client, url, params, headers)
+                rows += page
+                if len(page) < REPLICA_PAGE_SIZE:
+                    break
+                last_id = page[-1]["id"]
+            changed = await asyncio.to_thread(self.replace_all, rows)
+        else:
+            params = [("select", "*"), ("order", "created_at")]
+            newest = self.newest_created_at()
+            if newest:
+                params.append(("created_at", f'gt."{newest}"'))
+            rows = await _fetch(client, url, params, headers)
+            changed = await asyncio.to_thread(self.upsert, rows) if rows else []
+
+        self.ready = True
+        return changed
+
+
+async def _fetch(client, url: str, params: list, headers: dict) -> list:
+    resp = await client.get(url, params=params, headers=headers)
+    if resp.status_code != 200:
+        raise upstream.UpstreamError(resp)
+    return resp.json()
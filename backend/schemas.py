@@ -0,0 +1,83 @@
+"""Typed product bodies for the /api/v2 admin routes.
+
+Bodies are decoded with Model.model_validate_json(raw_bytes): pydantic-core
+parses and validates the JSON in one pass, nested lists and objects
+included, instead of json.loads() followed by checks on the result.
+"""
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+Measurement = Union[str, float]
+
+
+class _ProductFields(BaseModel):
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    name: str = Field(min_length=1)
+    price: float = Field(ge=0)
+    category: str = "shirts"
+    description: str = ""
+    color: str = ""
+    sizes: List[str] = []
+    measurements: Dict[str, Measurement] = {}
+    video_url: str = ""
+    condition: str = "Good"
+    coupon_code: str = ""
+    discount_amount: float = Field(0.0, ge=0)
+    header_image: str = ""
+    images: List[str] = []
+
+    def row(self) -> dict:
+        """Column values, with header_image first in images like v1."""
+        data = self.model_dump(exclude={"version", "updated_at"})
+        if data["header_image"] and data["header_image"] not in data["images"]:
+            data["images"].insert(0, data["header_image"])
+        return data
+
+
+class ProductCreate(_ProductFields):
+    pass
+
+
+class ProductReplace(_ProductFields):
+    # Optimistic concurrency: the write fails with 409 if the row moved on
+    version: Optional[int] = None
+    updated_at: Optional[str] = None
+
+
+class ProductPatch(BaseModel):
+    """Only the fields sent are changed; none may be null."""
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    version: Optional[int] = None
+    updated_at: Optional[str] = None
+
+    name: Optional[str] = Field(None, min_length=1)
+    price: Optional[float] = Field(None, ge=0)
+    category: Optional[str] = None
+    description: Optional[str] = None
+    color: Optional[str] = None
+    sizes: Optional[List[str]] = None
+    measurements: Optional[Dict[str, Measurement]] = None
+    video_url: Optional[str] = None
+    condition: Optional[str] = None
+    coupon_code: Optional[str] = None
+    discount_amount: Optional[float] = Field(None, ge=0)
+    header_image: Optional[str] = None
+    images: Optional[List[str]] = None
+
+    @model_validator(mode="after")
+    def _no_nulls(self):
+        nulls = sorted(name for name in self.model_fields_set - {"version", "updated_at"}
+                       if getattr(self, name) is None)
+        if nulls:
+            raise ValueError(f"fields cannot be null: {', '.join(nulls)}")
+        return self
+
+    def changes(self) -> dict:
+        data = self.model_dump(exclude_unset=True, exclude={"version", "updated_at"})
+        header_image = data.get("header_image")
+        if header_image and "images" in data and header_image not in data["images"]:
+            data["images"].insert(0, header_image)
+        return data
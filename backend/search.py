@@ -0,0 +1,173 @@
+import re
+import math
+import heapq
+import bisect
+import unicodedata
+from collections import defaultdict
+from operator import itemgetter
+
+# ──────────────────────────────────────────
+# FULL-TEXT PRODUCT SEARCH
+# ──────────────────────────────────────────
+#
+# Inverted index over a few product fields, ranked with BM25 on a
+# field-weighted term frequency. Kept up to date through the Catalog index
+# hooks, so a query never leaves the process.
+
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "color": 2.0, "description": 1.0}
+K1 = 1.2
+B = 0.75
+# Prefix matches rank a little below exact ones
+PREFIX_PENALTY = 0.7
+MAX_PREFIX_EXPANSIONS = 50
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text) -> list:
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text)
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings: dict = defaultdict(dict)  # term -> {product_id: weighted tf}
+        self._terms: list = []  # sorted vocabulary, for prefix lookups
+        self._doc_terms: dict = {}  # product_id -> set of its terms
+        self._doc_len: dict = {}
+        self._total_len = 0.0
+        # term -> {product_id: BM25 contribution}, filled lazily by queries
+        # and dropped whenever the term's postings or the length norm change
+        self._scored: dict = {}
+        self._norm_avg = 0.0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    # ── Catalog index hooks ──
+
+    def rebuild(self, products: list):
+        self.__init__()
+        for product in products:
+            self._add(product)
+        self._terms = sorted(self._postings)
+
+    def upsert(self, product: dict, old=None):
+        self._remove(product["id"])
+        for term in self._add(product):
+            i = bisect.bisect_left(self._terms, term)
+            if i == len(self._terms) or self._terms[i] != term:
+                self._terms.insert(i, term)
+
+    def remove(self, product_id: str, old=None):
+        self._remove(product_id)
+
+    # ── internals ──
+
+    def _add(self, product: dict) -> list:
+        """Index one product; returns terms that are new to the vocabulary."""
+        product_id = product["id"]
+        tf = defaultdict(float)
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(product.get(field)):
+                tf[term] += weight
+                length += weight
+        new_terms = []
+        for term, freq in tf.items():
+            if term not in self._postings:
+                new_terms.append(term)
+            self._postings[term][product_id] = freq
+            self._scored.pop(term, None)
+        self._doc_terms[product_id] = set(tf)
+        self._doc_len[product_id] = length
+        self._total_len += length
+        return new_terms
+
+    def _remove(self, product_id: str):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self._total_len -= self._doc_len.pop(product_id)
+        for term in terms:
+            self._scored.pop(term, None)
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                i = bisect.bisect_left(self._terms, term)
+                if i < len(self._terms) and self._terms[i] == term:
+                    del self._terms[i]
+
+    def _expand(self, token: str, prefix: bool) -> list:
+        """Index terms a query token matches, as (term, weight) pairs."""
+        matches = [(token, 1.0)] if token in self._postings else []
+        if prefix:
+            i = bisect.bisect_left(self._terms, token)
+            while i < len(self._terms) and self._terms[i].startswith(token) and len(matches) < MAX_PREFIX_EXPANSIONS:
+                if self._terms[i] != token:
+                    matches.append((self._terms[i], PREFIX_PENALTY))
+                i += 1
+        return matches
+
+    # ── querying ──
+
+    def _term_scores(self, term: str) -> dict:
+        scored = self._scored.get(term)
+        if scored is None:
+            postings = self._postings[term]
+            n_docs = len(self._doc_len)
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            avg_len = self._norm_avg or 1.0
+            doc_len = self._doc_len
+            scored = {
+                pid: idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * doc_len[pid] / avg_len))
+                for pid, tf in postings.items()
+            }
+            self._scored[term] = scored
+        return scored
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True) -> list:
+        """Return [(product_id, score)] best first. Every query token must
+        match; the last one also matches as a prefix (typeahead)."""
+        tokens = tokenize(query)
+        if not tokens or not self._doc_len:
+            return []
+        avg_len = self._total_len / len(self._doc_len)
+        if abs(avg_len - self._norm_avg) > 0.02 * avg_len:
+            # Collection statistics drifted enough to matter; re-score lazily
+            self._scored.clear()
+            self._norm_avg = avg_len
+
+        per_token = []
+        for position, token in enumerate(tokens):
+            matches = self._expand(token, prefix and position == len(tokens) - 1)
+            if not matches:
+                return []
+            if len(matches) == 1 and matches[0][1] == 1.0:
+                per_token.append(self._term_scores(matches[0][0]))
+                continue
+            merged: dict = {}
+            for term, weight in matches:
+                for pid, score in self._term_scores(term).items():
+                    score *= weight
+                    if score > merged.get(pid, 0.0):
+                        merged[pid] = score
+            per_token.append(merged)
+
+        # Walk the rarest token's matches and probe the others
+        per_token.sort(key=len)
+        first, rest = per_token[0], per_token[1:]
+        scores = {}
+        for pid, score in first.items():
+            for other in rest:
+                extra = other.get(pid)
+                if extra is None:
+                    break
+                score += extra
+            else:
+                scores[pid] = score
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
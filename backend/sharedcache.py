@@ -0,0 +1,296 @@
+import os
+import json
+import stat
+import time
+import uuid
+import sqlite3
+import asyncio
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+#
+# A second cache tier shared by every worker process on the host, plus the
+# channel workers use to tell each other about writes. Both live in one
+# SQLite file (in /dev/shm when there is one, so it never touches disk):
+#
+#   entries        key -> encoded value, stored_at
+#   leases         key -> worker currently loading it from upstream
+#   invalidations  append-only log every worker tails
+#
+# A worker that misses its own in-process cache looks here first; if the
+# entry is missing too, only the worker that wins the key's lease goes
+# upstream and the rest wait for its result, so upstream load per host does
+# not grow with the number of workers.
+#
+# The file sits in a directory only this user can open, named after the
+# Supabase project, so other users and other deployments on the host can
+# neither read it nor plant one. Values are stored as bytes from the
+# caller's `dumps`/`loads` (JSON by default), never pickled. SQLite runs on
+# one thread of its own, off the event loop.
+#
+# With a single worker there is nobody to share with, so it is off unless
+# WEB_CONCURRENCY (the worker count uvicorn and gunicorn read) is above 1.
+
+_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1") or "1")
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE", "1" if _WORKERS > 1 else "0") == "1"
+_SHM = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR", os.path.join(_SHM, f"dicks-and-toes-{os.getuid()}"))
+_PROJECT = hashlib.sha256((os.getenv("SUPABASE_URL") or "").encode()).hexdigest()[:16]
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(SHARED_CACHE_DIR, f"cache-{_PROJECT}.db"))
+SHARED_CACHE_POLL = float(os.getenv("SHARED_CACHE_POLL", "0.25"))  # seconds
+LEASE_TTL = 15.0
+LEASE_WAIT_STEP = 0.02
+LOG_RETENTION = 600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    arg TEXT NOT NULL,
+    at REAL NOT NULL
+);
+"""
+
+# Stored keys an invalidation of each kind covers, given its :arg
+_MATCHES = {
+    "key": "key = :arg",
+    "variants": "(key = :arg OR substr(key, 1, length(:arg) + 1) = :arg || '?')",
+    "prefix": "substr(key, 1, length(:arg)) = :arg",
+    "clear": "1",
+}
+# The same test the other way round: logged invalidations covering :key
+_COVERS_KEY = """(kind = 'clear'
+    OR (kind = 'key' AND arg = :key)
+    OR (kind = 'variants' AND (arg = :key OR arg || '?' = substr(:key, 1, length(arg) + 1)))
+    OR (kind = 'prefix' AND arg = substr(:key, 1, length(arg))))"""
+
+
+def _json_dumps(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def private_dir(path: str) -> str:
+    """Create `path` as 0700, or check an existing one is a real directory
+    of ours that nobody else can write to."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory (want a 0700 directory owned by uid {os.getuid()})")
+    return path
+
+
+class SharedCache:
+    def __init__(self, path: str = SHARED_CACHE_PATH, dumps=_json_dumps, loads=json.loads):
+        private_dir(os.path.dirname(os.path.abspath(path)))
+        self.path = path
+        self.origin = uuid.uuid4().hex
+        self._dumps = dumps
+        self._loads = loads
+        # Every statement runs on this one thread: SQLite never blocks the
+        # event loop, and statements run in the order they were issued
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.executescript(SCHEMA)
+        # Only messages published after we started are ours to apply
+        self.last_seq = self._current_seq()
+        self.hits = 0
+        self.loads = 0
+        self.waits = 0
+        self.entries = 0  # as of the last prune()
+        self.bytes = 0
+
+    def close(self):
+        # Queued publishes go out first
+        self._io.shutdown(wait=True)
+        self._db.close()
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._io, fn, *args)
+
+    def _current_seq(self) -> int:
+        return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()[0]
+
+    # ── entries ──
+
+    def _get_many(self, keys: list, max_age: float) -> dict:
+        found = {}
+        for key in keys:
+            row = self._db.execute(
+                "SELECT value, stored_at FROM entries WHERE key = ? AND stored_at > ?",
+                (key, time.time() - max_age),
+            ).fetchone()
+            if row is not None:
+                found[key] = (self._loads(row[0]), row[1])
+        return found
+
+    async def get(self, key: str, max_age: float):
+        """(value, stored_at) if there is an entry younger than max_age."""
+        return (await self.get_many([key], max_age)).get(key)
+
+    async def get_many(self, keys: list, max_age: float) -> dict:
+        """{key: (value, stored_at)} for those of keys younger than max_age."""
+        return await self._call(self._get_many, keys, max_age)
+
+    def _put(self, key: str, blob: bytes, since_seq: int) -> bool:
+        cursor = self._db.execute(
+            f"""INSERT OR REPLACE INTO entries (key, value, stored_at)
+                SELECT :key, :value, :now
+                WHERE NOT EXISTS (SELECT 1 FROM invalidations WHERE seq > :since AND {_COVERS_KEY})""",
+            {"key": key, "value": blob, "now": time.time(), "since": since_seq},
+        )
+        return cursor.rowcount > 0
+
+    async def put(self, key: str, value, since_seq: int) -> bool:
+        """Store value unless an invalidation covering key was published
+        after `since_seq` (i.e. while the value was being loaded)."""
+        return await self._call(self._put, key, self._dumps(value), since_seq)
+
+    def _claim(self, key: str, max_age: float):
+        """One lookup for fetch(): ("hit", (value, stored_at)), ("lease",
+        seq) if we are to load it, or ("wait", None)."""
+        found = self._get_many([key], max_age)
+        if key in found:
+            return "hit", found[key]
+        since = self._current_seq()
+        if self._try_lease(key, LEASE_TTL):
+            return "lease", since
+        return "wait", None
+
+    async def fetch(self, key: str, loader, max_age: float):
+        """Read-through: returns (value, age_in_seconds). At most one worker
+        on the host runs `loader()` for a key at a time."""
+        while True:
+            state, found = await self._call(self._claim, key, max_age)
+            if state == "hit":
+                self.hits += 1
+                return found[0], max(0.0, time.time() - found[1])
+            if state == "lease":
+                since = found
+                break
+            # Someone else is loading it; wait for their result (or for
+            # their lease to lapse if they died)
+            self.waits += 1
+            await asyncio.sleep(LEASE_WAIT_STEP)
+        try:
+            self.loads += 1
+            value = await loader()
+            await self.put(key, value, since)
+            return value, 0.0
+        finally:
+            await self.release(key)
+
+    # ── leases ──
+
+    def _try_lease(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = self._db.execute(
+            """INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?)
+               ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+               WHERE leases.owner = excluded.owner OR leases.expires < ?""",
+            (key, self.origin, now + ttl, now),
+        )
+        return cursor.rowcount > 0
+
+    async def try_lease(self, key: str, ttl: float = LEASE_TTL) -> bool:
+        """Take (or renew) the lease on key; False if another live worker
+        holds it."""
+        return await self._call(self._try_lease, key, ttl)
+
+    def _lease_held(self, key: str) -> bool:
+        row = self._db.execute(
+            "SELECT 1 FROM leases WHERE key = ? AND owner != ? AND expires > ?",
+            (key, self.origin, time.time()),
+        ).fetchone()
+        return row is not None
+
+    async def lease_held(self, key: str) -> bool:
+        """Whether some other worker currently holds a live lease on key."""
+        return await self._call(self._lease_held, key)
+
+    def _release(self, key: str):
+        self._db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.origin))
+
+    async def release(self, key: str):
+        await self._call(self._release, key)
+
+    # ── invalidation channel ──
+
+    def _publish(self, kind: str, arg: str):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "INSERT INTO invalidations (origin, kind, arg, at) VALUES (?, ?, ?, ?)",
+                (self.origin, kind, arg, time.time()),
+            )
+            if kind in _MATCHES:
+                self._db.execute(f"DELETE FROM entries WHERE {_MATCHES[kind]}", {"arg": arg})
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def publish(self, kind: str, arg: str = ""):
+        """Drop matching shared entries and tell the other workers to drop
+        theirs. `kind` is one of "key", "variants", "prefix", "clear", or
+        any other message kind the caller understands.
+
+        Returns at once: the write is queued on the cache's thread, ahead
+        of any read or store this worker issues after it."""
+        future = self._io.submit(self._publish, kind, arg)
+        future.add_done_callback(_log_publish_error)
+        return future
+
+    def _poll(self) -> list:
+        rows = self._db.execute(
+            "SELECT seq, origin, kind, arg FROM invalidations WHERE seq > ? ORDER BY seq",
+            (self.last_seq,),
+        ).fetchall()
+        if rows:
+            self.last_seq = rows[-1][0]
+        return [(kind, arg) for _, origin, kind, arg in rows if origin != self.origin]
+
+    async def poll(self) -> list:
+        """(kind, arg) messages other workers published since the last poll."""
+        return await self._call(self._poll)
+
+    def _prune(self, max_age: float):
+        now = time.time()
+        self._db.execute("DELETE FROM entries WHERE stored_at < ?", (now - max_age,))
+        self._db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+        self._db.execute("DELETE FROM invalidations WHERE at < ?", (now - LOG_RETENTION,))
+        self.entries, self.bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length(value)), 0) FROM entries").fetchone()
+
+    async def prune(self, max_age: float):
+        """Forget entries older than max_age and old log messages."""
+        await self._call(self._prune, max_age)
+
+    def stats(self) -> dict:
+        return {"entries": self.entries, "bytes": self.bytes, "hits": self.hits, "loads": self.loads, "waits": self.waits}
+
+
+def _log_publish_error(future):
+    error = future.exception()
+    if error is not None:
+        print(f"Shared cache publish failed: {error!r}")
@@ -0,0 +1,226 @@
+"""Static catalog export: the catalog rendered into immutable,
+content-hashed JSON files a CDN (or Next.js ISR) can serve without the API.
+
+    STATIC_EXPORT_DIR/
+      manifest.json                       the only mutable file
+      index.<hash>.json                   every product, listing fields only
+      category/<slug>.<hash>.json         full rows per category
+      product/<id>.<hash>.json            one full row
+
+All lists are newest first, like /api/products. Clients fetch manifest.json
+(short cache) and follow its paths to shards that never change, so shards
+can be cached forever. Files are written to a temp name and renamed, the
+manifest last, so a reader never sees a half-written file or a path that
+does not exist yet. Shards the manifest stops pointing at are listed under
+"retired" and deleted STATIC_EXPORT_RETENTION later, so readers still
+holding an old manifest can finish.
+
+With STATIC_EXPORT=1 the API re-exports only the shards an admin write
+touched (see main.py). For a one-off build from Supabase:
+
+    python static_export.py [--out DIR]
+"""
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+
+STATIC_EXPORT_ENABLED = os.getenv("STATIC_EXPORT", "0") == "1"
+STATIC_EXPORT_DIR = os.getenv("STATIC_EXPORT_DIR", os.path.join(os.path.dirname(__file__), "static_catalog"))
+# Writes within this window are exported together
+STATIC_EXPORT_DEBOUNCE = float(os.getenv("STATIC_EXPORT_DEBOUNCE", "1"))
+STATIC_EXPORT_RETENTION = float(os.getenv("STATIC_EXPORT_RETENTION", "3600"))  # seconds
+
+# What the home page asks /api/products for
+INDEX_FIELDS = ("id", "name", "price", "category", "header_image", "sizes")
+MANIFEST = "manifest.json"
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9_-]+", "-", str(value).lower()).strip("-") or "_"
+
+
+def _newest_first(rows: Iterable[dict]) -> list:
+    # Same order as the API: created_at DESC NULLS LAST, id DESC
+    return sorted(rows, key=lambda r: (r.get("created_at") is not None, r.get("created_at") or "", r["id"]),
+                  reverse=True)
+
+
+def _encode(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+
+class StaticExport:
+    def __init__(self, root: str = STATIC_EXPORT_DIR):
+        self.root = root
+        self.written = 0
+        self.exports = 0
+        self.last_export: Optional[str] = None
+
+    # ── files ──
+
+    def _write(self, name: str, body: bytes) -> str:
+        """Write body as <name>.<hash>.json (once) and return its path
+        relative to root."""
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        relative = f"{name}.{digest}.json"
+        path = os.path.join(self.root, relative)
+        if not os.path.exists(path):
+            self._replace(path, body)
+            self.written += 1
+        return relative
+
+    @staticmethod
+    def _replace(path: str, body: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def read_manifest(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.root, MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _live(manifest: Optional[dict]) -> set:
+        if not manifest:
+            return set()
+        return {manifest["index"], *manifest["categories"].values(), *manifest["products"].values()}
+
+    def _retire(self, manifest: dict, before: set) -> int:
+        """Note when shards stopped being referenced, and delete those
+        unreferenced for longer than the retention period."""
+        now = time.time()
+        live = self._live(manifest)
+        retired = manifest.setdefault("retired", {})
+        for path in before - live:
+            retired.setdefault(path, now)
+        for path in live:
+            retired.pop(path, None)
+        removed = 0
+        for path, since in list(retired.items()):
+            if since < now - STATIC_EXPORT_RETENTION:
+                try:
+                    os.unlink(os.path.join(self.root, path))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                del retired[path]
+        return removed
+
+    def _prune_orphans(self, manifest: dict) -> int:
+        """Delete old files no manifest knows about (e.g. from a crash)."""
+        known = self._live(manifest) | set(manifest["retired"])
+        cutoff = time.time() - STATIC_EXPORT_RETENTION
+        removed = 0
+        for folder in ("", "category", "product"):
+            directory = os.path.join(self.root, folder)
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                relative = os.path.join(folder, entry.name) if folder else entry.name
+                if (entry.is_file() and entry.name not in (MANIFEST, ".lock") and relative not in known
+                        and entry.stat().st_mtime < cutoff):
+                    os.unlink(entry.path)
+                    removed += 1
+        return removed
+
+    # ── export ──
+
+    def export(self, products: list, product_ids: Optional[Iterable[str]] = None,
+               categories: Optional[Iterable[str]] = None) -> dict:
+        """Bring the export in line with `products` (the whole catalog).
+        With product_ids/categories only those shards (plus the index) are
+        regenerated; without them, or without a manifest yet, everything is.
+        Safe to call from several processes at once."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return self._export(products, product_ids, categories)
+
+    def _export(self, products: list, product_ids, categories) -> dict:
+        by_id = {row["id"]: row for row in products}
+        manifest = self.read_manifest()
+        before = self._live(manifest)
+        full = manifest is None or product_ids is None or categories is None
+        if full:
+            old = manifest or {"categories": {}, "products": {}}
+            manifest = {"categories": {}, "products": {}, "retired": old.get("retired", {})}
+            categories = {row.get("category") for row in products} | set(old["categories"])
+            product_ids = set(by_id)
+
+        listing = _newest_first(by_id.values())
+        manifest["index"] = self._write("index", _encode([{f: row.get(f) for f in INDEX_FIELDS} for row in listing]))
+        for category in categories:
+            if category is None:
+                continue
+            rows = [row for row in listing if row.get("category") == category]
+            if rows:
+                manifest["categories"][category] = self._write(f"category/{_slug(category)}", _encode(rows))
+            else:
+                manifest["categories"].pop(category, None)
+        for product_id in product_ids:
+            row = by_id.get(product_id)
+            if row is not None:
+                manifest["products"][product_id] = self._write(f"product/{_slug(product_id)}", _encode(row))
+            else:
+                manifest["products"].pop(product_id, None)
+
+        manifest["generated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        manifest["count"] = len(by_id)
+        pruned = self._retire(manifest, before)
+        self._replace(os.path.join(self.root, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+        if full:
+            pruned += self._prune_orphans(manifest)
+        self.exports += 1
+        self.last_export = manifest["generated_at"]
+        return {"full": full, "products": len(product_ids), "categories": len(categories), "pruned": pruned}
+
+    def stats(self) -> dict:
+        return {"dir": self.root, "exports": self.exports, "files_written": self.written,
+                "last_export": self.last_export}
+
+
+# ──────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────
+
+def main():
+    import argparse
+    import httpx
+
+    parser = argparse.ArgumentParser(description="Export the catalog as static JSON shards.")
+    parser.add_argument("--out", default=STATIC_EXPORT_DIR)
+    args = parser.parse_args()
+
+    key = os.getenv("SUPABASE_KEY")
+    resp = httpx.get(
+        f"{os.getenv('SUPABASE_URL')}/rest/v1/products",
+        params={"select": "*", "order": "created_at.desc.nullslast,id.desc"},
+        headers={"apikey": key, "Authorization": f"Bearer {key}"},
+        timeout=60,
+    )
+    resp.raise_for_status()
+    rows = resp.json()
+    result = StaticExport(args.out).export(rows)
+    print(f"Exported {len(rows)} products to {args.out}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,3 +16,49 @@ CREATE TABLE IF NOT EXISTS public.products (
     discount_amount REAL DEFAULT 0,
     created_at TEXT
 );
+
+-- Optimistic concurrency: every update bumps version and updated_at, so
+-- admin edits can be made conditional on the version they started from
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION public.products_bump_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_bump_version ON public.products;
+CREATE TRIGGER products_bump_version BEFORE UPDATE ON public.products
+    FOR EACH ROW EXECUTE FUNCTION public.products_bump_version();
+
+-- Responsive image variants uploaded through /api/admin/products/{id}/images:
+-- full-size image URL -> {width, height, variants, srcset}
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS image_manifest JSONB DEFAULT '{}'::jsonb;
+
+-- Delta sync (backend/changes.py): the API polls for rows whose updated_at
+-- passed its high-water mark, plus tombstones for rows deleted since
+CREATE INDEX IF NOT EXISTS products_updated_at_idx ON public.products (updated_at, id);
+
+CREATE TABLE IF NOT EXISTS public.product_tombstones (
+    id TEXT PRIMARY KEY,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS product_tombstones_deleted_at_idx ON public.product_tombstones (deleted_at, id);
+
+CREATE OR REPLACE FUNCTION public.products_record_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO public.product_tombstones (id, deleted_at) VALUES (OLD.id, now())
+        ON CONFLICT (id) DO UPDATE SET deleted_at = excluded.deleted_at;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_record_tombstone ON public.products;
+CREATE TRIGGER products_record_tombstone AFTER DELETE ON public.products
+    FOR EACH ROW EXECUTE FUNCTION public.products_record_tombstone();
+
+-- Tombstones only need to outlive the slowest poller; prune them now and then:
+-- DELETE FROM public.product_tombstones WHERE deleted_at < now() - interval '7 days';
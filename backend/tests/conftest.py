@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+
+# Offline settings, in place before the app modules read their config
+os.environ.update(
+    SUPABASE_URL="http://supabase.test",
+    SUPABASE_KEY="test-key",
+    ADMIN_PASSWORD="test-admin",
+    SHARED_CACHE="0",
+    READ_REPLICA="0",
+    CHANGE_SYNC="0",
+    STATIC_EXPORT="0",
+    AI_JOBS="0",
+    RATE_LIMIT="0",
+    IMAGE_CACHE_DIR=tempfile.mkdtemp(prefix="image-cache-"),
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import main  # noqa: E402
+import postgrest_mock  # noqa: E402
+import upstream  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class Supabase:
+    """postgrest_mock answering in process, with a switch to take it down."""
+
+    def __init__(self, rows: dict):
+        self._app = postgrest_mock.app
+        self.rows = rows
+        postgrest_mock.TABLES.update(products=rows, product_tombstones={})
+        self.down = False
+        self.requests = 0
+
+    async def __call__(self, scope, receive, send):
+        self.requests += 1
+        if self.down:
+            response = JSONResponse({"message": "upstream unavailable"}, status_code=503)
+            return await response(scope, receive, send)
+        await self._app(scope, receive, send)
+
+
+@pytest.fixture
+async def supabase(monkeypatch):
+    """A fresh 40-row mock behind the app's real upstream client (retries,
+    circuit breaker, admission), with the app's cache and catalog emptied."""
+    mock = Supabase(postgrest_mock.make_rows(40, seed=7))
+    monkeypatch.setattr(upstream, "_breakers", {})
+    monkeypatch.setattr(upstream, "_backoff", lambda attempt: 0)
+    upstream._client = upstream.build_client(httpx.ASGITransport(app=mock))
+    main.cache._clear()
+    await main.catalog.replace_async([])
+    main.catalog.loaded = False
+    yield mock
+    await upstream._client.aclose()
+    upstream._client = None
+    main.cache._clear()
+
+
+@pytest.fixture
+async def api(supabase):
+    """A client for the app, without its lifespan tasks."""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
@@ -0,0 +1,35 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_batch_keeps_request_order_and_lists_missing_ids(api, supabase):
+    ids = list(supabase.rows)[:5][::-1]
+    sent = supabase.requests
+
+    resp = await api.get("/api/products/batch", params={"ids": ",".join(ids[:3] + ["nope"]), "config": "true"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [row["id"] for row in body["items"]] == ids[:3]
+    assert body["missing"] == ["nope"] and "config" in body
+    assert supabase.requests == sent + 1
+
+    # Cached rows are reused; only the rest go upstream, in one call
+    resp = await api.post("/api/products/batch", json={"ids": ids})
+    assert [row["id"] for row in resp.json()["items"]] == ids
+    assert supabase.requests == sent + 2
+
+    resp = await api.get("/api/products/batch", params=[("ids", pid) for pid in ids])
+    assert resp.headers["x-cache"] == "HIT"
+    assert supabase.requests == sent + 2
+
+
+async def test_batch_items_match_single_product_reads(api, supabase):
+    pid = next(iter(supabase.rows))
+    single = (await api.get(f"/api/products/{pid}")).json()
+    assert (await api.get("/api/products/batch", params={"ids": pid})).json()["items"] == [single]
+
+
+@pytest.mark.parametrize("body", [{"ids": []}, {"ids": "a,b"}, {"ids": [1, 2]}, {"ids": [f"id{n}" for n in range(101)]}])
+async def test_bad_batches_are_400(api, supabase, body):
+    assert (await api.post("/api/products/batch", json=body)).status_code == 400
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+NDJSON = {**ADMIN, "Content-Type": "application/x-ndjson"}
+CSV = {**ADMIN, "Content-Type": "text/csv"}
+
+
+async def test_bulk_import_reports_each_bad_row(api, supabase):
+    existing = next(iter(supabase.rows))
+    lines = [
+        json.dumps({"name": "Wool Coat", "price": 50, "category": "jackets"}),
+        "{not json",
+        json.dumps({"name": "", "price": 5}),
+        json.dumps({"name": "Cheap Tee", "price": -1}),
+        json.dumps({"id": existing, "name": "Imported Name", "price": 12}),
+        json.dumps(["not", "an", "object"]),
+        json.dumps({"name": "Plain Tee", "price": "twelve"}),
+    ]
+    resp = await api.post("/api/admin/products/bulk", content="\n".join(lines).encode(), headers=NDJSON)
+
+    assert resp.status_code == 200
+    report = resp.json()
+    assert (report["received"], report["upserted"], report["failed"]) == (7, 2, 5)
+    assert [error["row"] for error in report["errors"]] == [2, 3, 4, 6, 7]
+    assert report["errors"][1]["error"] == "name: required"
+    assert supabase.rows[existing]["name"] == "Imported Name"
+    names = [row["name"] for row in (await api.get("/api/products", params={"category": "jackets"})).json()]
+    assert "Wool Coat" in names
+
+
+async def test_bulk_import_reports_rows_upstream_refused(api, supabase):
+    csv = "name,price,category\nLinen Shirt,20,shirts\nCord Pants,30,pants\n"
+    supabase.down = True
+    resp = await api.post("/api/admin/products/bulk", content=csv.encode(), headers=CSV)
+
+    report = resp.json()
+    assert (report["upserted"], report["failed"]) == (0, 2)
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+    assert all(error["error"].startswith("upstream 503") for error in report["errors"])
+
+
+async def test_bulk_import_refuses_non_finite_numbers(api, supabase):
+    lines = [
+        '{"name": "Wool Coat", "price": 50}',
+        '{"name": "Nan Coat", "price": NaN}',
+        '{"name": "Inf Coat", "price": "inf"}',
+        '{"name": "Odd Coat", "price": 5, "discount_amount": "-Infinity"}',
+    ]
+    resp = await api.post("/api/admin/products/bulk", content="\n".join(lines).encode(), headers=NDJSON)
+
+    assert resp.status_code == 200
+    report = resp.json()
+    assert (report["upserted"], report["failed"]) == (1, 3)
+    assert [error["error"] for error in report["errors"]] == [
+        "price: not a finite number", "price: not a finite number", "discount_amount: not a finite number",
+    ]
+
+
+async def test_bulk_import_reports_invalid_utf8_per_row(api, supabase):
+    ndjson = b'{"name": "Wool Coat", "price": 50}\n{"name": "Bad \xff Coat", "price": 5}\n{"name": "Tee", "price": 9}\n'
+    report = (await api.post("/api/admin/products/bulk", content=ndjson, headers=NDJSON)).json()
+    assert (report["upserted"], report["failed"]) == (2, 1)
+    assert report["errors"] == [{"row": 2, "error": "invalid UTF-8 at byte 14"}]
+
+    csv = b'name,price,description\nLinen Shirt,20,"two\nlines \xfe"\nCord Pants,30,ok\n'
+    report = (await api.post("/api/admin/products/bulk", content=csv, headers=CSV)).json()
+    assert (report["upserted"], report["failed"]) == (1, 1)
+    assert report["errors"] == [{"row": 2, "error": "invalid UTF-8 at byte 6"}]
+
+
+async def test_bulk_import_with_an_undecodable_csv_header_stops(api, supabase):
+    report = (await api.post("/api/admin/products/bulk", content=b"na\xffme,price\nTee,9\n", headers=CSV)).json()
+    assert (report["received"], report["upserted"], report["failed"]) == (1, 0, 1)
+
+
+async def test_bulk_update_keeps_the_columns_it_leaves_out(api, supabase):
+    existing = dict(next(iter(supabase.rows.values())))
+    csv = f"id,name,price\n{existing['id']},Imported Name,12\n"
+    ndjson = json.dumps({"id": existing["id"], "name": "Imported Name", "price": 12, "color": "Cream",
+                         "header_image": "https://images.example.com/new.jpg"})
+
+    report = (await api.post("/api/admin/products/bulk", content=csv.encode(), headers=CSV)).json()
+    assert report["upserted"] == 1
+    row = supabase.rows[existing["id"]]
+    assert (row["name"], row["price"]) == ("Imported Name", 12)
+    for column in ("description", "header_image", "images", "measurements", "color", "sizes", "condition"):
+        assert row[column] == existing[column], column
+
+    report = (await api.post("/api/admin/products/bulk", content=ndjson.encode(), headers=NDJSON)).json()
+    assert report["upserted"] == 1
+    row = supabase.rows[existing["id"]]
+    assert row["color"] == "Cream" and row["header_image"] == "https://images.example.com/new.jpg"
+    assert row["images"] == existing["images"] and row["created_at"] == existing["created_at"]
+
+
+async def test_rows_written_before_a_failure_still_reach_the_catalog(supabase, monkeypatch):
+    monkeypatch.setattr(main.catalog, "loaded", True)
+
+    class Request:
+        headers = {"content-type": "application/x-ndjson"}
+
+        async def stream(self):
+            yield b'{"name": "Early Coat", "price": 50}\n{"name": "Late Coat", "price": 60}\n'
+            raise ClientDisconnect()
+
+    with pytest.raises(ClientDisconnect):
+        await main.bulk_upsert_products(Request(), batch_size=1, _admin=True)
+
+    written = {row["name"]: pid for pid, row in supabase.rows.items() if row["name"].endswith("Coat")}
+    assert set(written) == {"Early Coat", "Late Coat"}
+    assert all(main.catalog.get(pid) for pid in written.values())
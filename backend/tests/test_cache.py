@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+import upstream
+
+pytestmark = pytest.mark.anyio
+
+
+def failed(error: Exception) -> asyncio.Future:
+    future = asyncio.get_running_loop().create_future()
+    future.set_exception(error)
+    return future
+
+
+async def test_refresh_failures_are_logged_once_while_upstream_is_down(capsys, monkeypatch):
+    monkeypatch.setattr(main, "_refresh_errors", {"logged_at": None, "suppressed": 0})
+    request = httpx.Request("GET", "http://supabase.test/rest/v1/products")
+    for _ in range(50):
+        main._log_background_error(failed(upstream.CircuitOpenError("supabase.test", 5, request)))
+    assert capsys.readouterr().out.count("Cache refresh failed") == 1
+
+    # Anything else is still reported every time
+    main._log_background_error(failed(KeyError("price")))
+    main._log_background_error(failed(KeyError("price")))
+    assert capsys.readouterr().out.count("KeyError") == 2
+
+    # Once the interval is over, the next report says how many were skipped
+    main._refresh_errors["logged_at"] -= main._REFRESH_ERROR_LOG_INTERVAL
+    main._log_background_error(failed(httpx.ConnectError("refused", request=request)))
+    assert "(and 49 more since the last report)" in capsys.readouterr().out
+
+
+def test_cache_evicts_least_recently_used_first():
+    cache = main._Cache(max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+    cache._store.move_to_end("a")  # a read
+    cache.set("d", "d")
+
+    assert list(cache._store) == ["c", "a", "d"]
+    assert cache.evictions == 1
+
+
+async def test_product_write_drops_only_its_own_keys(api, supabase):
+    jackets = next(pid for pid, row in supabase.rows.items() if row["category"] == "jackets")
+    shirts = next(pid for pid, row in supabase.rows.items() if row["category"] == "shirts")
+    for path in ("/api/products", f"/api/products/{jackets}", f"/api/products/{shirts}",
+                 "/api/products?category=jackets", "/api/products?category=shirts"):
+        await api.get(path)
+    assert main.cache.peek("products:jackets") is not None and main.cache.peek("products:all") is not None
+
+    await api.patch(f"/api/admin/products/{jackets}", json={"name": "Renamed"},
+                    headers={"Authorization": "Bearer test-admin"})
+
+    assert main.cache.peek(f"product:{jackets}") is None
+    assert main.cache.peek("products:jackets") is None and main.cache.peek("products:all") is None
+    assert main.cache.peek(f"product:{shirts}") is not None
+    assert main.cache.peek("products:shirts") is not None
+
+
+class Published:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, kind, arg):
+        self.messages.append((kind, arg))
+
+
+async def test_unseen_rows_clear_the_listings_once_per_batch(supabase, monkeypatch):
+    shared = Published()
+    monkeypatch.setattr(main.cache, "shared", shared)
+    rows = [dict(row, name="Imported") for row in supabase.rows.values()]
+
+    await main.record_writes(rows[:20])
+
+    assert shared.messages.count(("prefix", "products:")) == 1
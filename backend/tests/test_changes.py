@@ -0,0 +1,88 @@
+import httpx
+import pytest
+
+import changes
+import main
+import upstream
+from postgrest_mock import make_rows
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def rows():
+    return [dict(row) for row in make_rows(20).values()]
+
+
+@pytest.fixture
+def mock_upstream():
+    """Point the shared client at a handler; yields a setter for it."""
+    state = {}
+    upstream._client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: state["handler"](request)))
+    yield lambda handler: state.update(handler=handler)
+    upstream._client = None
+
+
+async def test_feed_reports_latest_event_per_id(rows):
+    source = changes.LocalChanges(rows)
+    feed = changes.ChangeFeed(source)
+    feed.seed(changes.newest(source.rows.values()))
+    first, second, third = (row["id"] for row in rows[:3])
+
+    source.put({"id": first, "name": "Renamed"})
+    source.delete(second)
+    source.put({"id": third, "name": "Back"})
+    source.delete(third)
+    upserts, deleted = await feed.poll()
+
+    assert [row["name"] for row in upserts if row["id"] == first] == ["Renamed"]
+    assert sorted(deleted) == sorted([second, third])
+    assert feed.current and feed.mark >= source.rows[first]["updated_at"]
+
+
+async def test_sync_loop_patches_catalog_and_cache_offline(rows):
+    source = changes.LocalChanges(rows)
+    await main.catalog.replace_async(list(source.rows.values()))
+    feed = changes.ChangeFeed(source)
+    feed.seed(changes.newest(main.catalog.products.values()))
+    edited, removed = rows[0]["id"], rows[1]["id"]
+    main.cache.set(f"product:{edited}", main.EncodedJSON(rows[0]))
+
+    source.put({"id": edited, "name": "Zebra Print Shirt"})
+    source.delete(removed)
+    await main.apply_changes(*await feed.poll())
+
+    assert main.catalog.get(edited)["name"] == "Zebra Print Shirt"
+    assert main.catalog.get(removed) is None
+    assert [pid for pid, _ in main.search_index.search("zebra", 5)] == [edited]
+    assert main.cache.peek(f"product:{edited}") is None
+    # The overlap window reads the same changes again; applying them is a no-op
+    version = main.catalog.version
+    await main.apply_changes(*await feed.poll())
+    assert main.catalog.version == version
+
+
+@pytest.mark.parametrize("status, body", [
+    (400, {"code": "42703", "message": "column products.updated_at does not exist"}),
+    (404, {"code": "PGRST205", "message": "Could not find the table 'public.product_tombstones'"}),
+])
+async def test_missing_schema_disables_feed(mock_upstream, status, body):
+    mock_upstream(lambda request: httpx.Response(status, json=body))
+    feed = changes.ChangeFeed(changes.SupabaseChanges(lambda: main.SUPABASE_URL, main.get_supabase_headers))
+    feed.seed(None)
+
+    with pytest.raises(changes.ChangesUnsupported):
+        await feed.poll()
+    assert not feed.supported and not feed.current
+
+
+async def test_upstream_outage_keeps_feed(mock_upstream, monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRIES", 0)
+    mock_upstream(lambda request: httpx.Response(500, json={"message": "boom"}))
+    feed = changes.ChangeFeed(changes.SupabaseChanges(lambda: main.SUPABASE_URL, main.get_supabase_headers))
+    feed.seed(None)
+
+    with pytest.raises(upstream.UpstreamError):
+        await feed.poll()
+    assert feed.supported
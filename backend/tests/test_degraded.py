@@ -0,0 +1,73 @@
+import uuid
+
+import pytest
+
+import main
+import upstream
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def expire_cache(monkeypatch):
+    """Make every cache entry too old to serve unless upstream fails."""
+    def expire():
+        monkeypatch.setattr(main, "_CACHE_TTL", 0.0)
+        monkeypatch.setattr(main, "_CACHE_GRACE", 0.0)
+    return expire
+
+
+async def test_cached_listing_is_served_stale_while_upstream_is_down(api, supabase, expire_cache):
+    fresh = await api.get("/api/products", params={"limit": 5})
+    supabase.down = True
+    expire_cache()
+
+    stale = await api.get("/api/products", params={"limit": 5})
+    assert stale.status_code == 200
+    assert stale.json() == fresh.json()
+    assert stale.headers["x-cache"] == "STALE"
+    assert int(stale.headers["x-stale-age"]) >= 0
+
+
+async def test_product_falls_back_to_the_catalog(api, supabase):
+    await api.get("/api/products", params={"sort": "price_asc"})  # loads the catalog
+    pid = next(iter(supabase.rows))
+    supabase.down = True
+
+    resp = await api.get(f"/api/products/{pid}")
+    assert resp.status_code == 200 and resp.json()["id"] == pid
+    assert "x-stale-age" in resp.headers
+
+
+async def test_nothing_to_fall_back_on_is_503(api, supabase):
+    supabase.down = True
+
+    for path in ("/api/products", f"/api/products/{next(iter(supabase.rows))}", "/api/products/search?q=coat"):
+        resp = await api.get(path)
+        assert resp.status_code == 503, path
+        assert int(resp.headers["retry-after"]) >= 1
+
+
+async def test_open_circuit_stops_calling_upstream(api, supabase):
+    supabase.down = True
+    for _ in range(upstream.BREAKER_FAILURES):
+        assert (await api.get(f"/api/products/{uuid.uuid4()}")).status_code == 503
+    assert upstream.breaker("supabase.test").state == "open"
+
+    sent = supabase.requests
+    resp = await api.get("/api/products", params={"limit": 3})
+    assert resp.status_code == 503
+    assert supabase.requests == sent
+
+
+async def test_recovers_once_upstream_is_back(api, supabase, monkeypatch):
+    supabase.down = True
+    for _ in range(upstream.BREAKER_FAILURES):
+        await api.get(f"/api/products/{uuid.uuid4()}")
+    supabase.down = False
+    # The cooldown is over: the next call is the probe, and closes the circuit
+    monkeypatch.setattr(upstream.breaker("supabase.test"), "opened_at", 0.0)
+
+    resp = await api.get("/api/products", params={"limit": 3})
+    assert resp.status_code == 200 and "x-stale-age" not in resp.headers
+    assert upstream.breaker("supabase.test").state == "closed"
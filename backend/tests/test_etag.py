@@ -0,0 +1,28 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+async def test_product_etag_revalidates_until_it_changes(api, supabase):
+    pid = next(iter(supabase.rows))
+    first = await api.get(f"/api/products/{pid}")
+    etag = first.headers["etag"]
+
+    again = await api.get(f"/api/products/{pid}", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag
+
+    await api.patch(f"/api/admin/products/{pid}", json={"name": "Renamed Coat"}, headers=ADMIN)
+    changed = await api.get(f"/api/products/{pid}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()["name"] == "Renamed Coat"
+    assert changed.headers["etag"] != etag
+
+
+async def test_listing_etag_revalidates(api):
+    first = await api.get("/api/products", params={"limit": 5})
+    again = await api.get("/api/products", params={"limit": 5}, headers={"If-None-Match": first.headers["etag"]})
+
+    assert again.status_code == 304
+    assert again.headers["x-next-cursor"] == first.headers["x-next-cursor"]
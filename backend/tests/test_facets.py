@@ -0,0 +1,75 @@
+import pytest
+
+from facets import FacetIndex, normalize_colors, parse_measure
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def index():
+    index = FacetIndex()
+    index.rebuild([
+        {"id": "a", "category": "shirts", "sizes": ["S", "M"], "color": "Red Plaid", "condition": "Good",
+         "price": 20, "measurements": {"chest": "40 in"}},
+        {"id": "b", "category": "shirts", "sizes": ["L"], "color": "Navy", "condition": "Excellent",
+         "price": 35, "measurements": {"chest": "46 in"}},
+        {"id": "c", "category": "jackets", "sizes": ["M"], "color": "Black / Flame", "condition": "Good",
+         "price": 80, "measurements": {}},
+    ])
+    return index
+
+
+def test_values_are_normalised():
+    assert normalize_colors("Black / Flame") == {"black"}
+    assert normalize_colors("Ice Blue") == {"blue"}
+    assert parse_measure("48.5 in") == 48.5 and parse_measure("n/a") is None
+
+
+def test_or_within_a_facet_and_across_facets(index):
+    ids, _ = index.query({"size": {"M", "L"}})
+    assert sorted(ids) == ["a", "b", "c"]
+    ids, _ = index.query({"size": {"M", "L"}, "category": {"shirts"}, "condition": {"good"}})
+    assert ids == ["a"]
+
+
+def test_ranges(index):
+    assert sorted(index.query({}, price_min=20, price_max=35)[0]) == ["a", "b"]
+    assert index.query({}, measures={"chest": (44, None)})[0] == ["b"]
+
+
+def test_counts_ignore_their_own_facet(index):
+    _, counts = index.query({"category": {"shirts"}}, with_counts=True)
+    assert counts["category"] == {"jackets": 1, "shirts": 2}
+    assert counts["size"] == {"L": 1, "M": 1, "S": 1}
+    assert counts["color"] == {"blue": 1, "red": 1}
+
+
+def test_upsert_and_remove(index):
+    index.upsert({"id": "a", "category": "shirts", "sizes": ["XL"], "color": "Cream", "price": 20})
+    assert index.query({"size": {"M"}})[0] == ["c"]
+    index.remove("c")
+    assert index.query({"size": {"M"}})[0] == []
+
+
+async def test_filtered_listing_matches_a_scan(api, supabase):
+    params = {"size": ["M", "L"], "condition": "Good", "price_min": 1000, "price_max": 3000, "facets": "true"}
+    resp = await api.get("/api/products", params=params)
+    assert resp.status_code == 200
+
+    expected = {
+        pid for pid, row in supabase.rows.items()
+        if {"M", "L"} & set(row["sizes"]) and row["condition"] == "Good" and 1000 <= row["price"] <= 3000
+    }
+    body = resp.json()
+    assert {row["id"] for row in body["items"]} == expected
+    assert body["total"] == len(expected)
+    assert sum(body["facets"]["condition"].values()) >= len(expected)
+
+
+async def test_unknown_colour_matches_nothing(api, supabase):
+    resp = await api.get("/api/products", params={"color": "chartreuse-ish"})
+    assert resp.status_code == 200 and resp.json() == []
+
+
+async def test_bad_measure_filter_is_400(api, supabase):
+    assert (await api.get("/api/products", params={"measure": "chest40"})).status_code == 400
@@ -0,0 +1,38 @@
+import httpx
+import pytest
+from PIL import Image
+
+import images
+import imgproxy
+import main
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_image_variant_is_503_while_the_catalog_cannot_load(monkeypatch):
+    async def down():
+        raise httpx.ConnectError("refused")
+
+    monkeypatch.setattr(main, "ensure_catalog", down)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        resp = await client.get(f"/img/{'0' * 32}", params={"w": 320, "fmt": "webp"})
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"]
+
+
+async def test_renders_are_timed_in_metrics_not_printed(tmp_path, monkeypatch, capsys):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    Image.new("RGB", (800, 400), "red").save(uploads / "coat.jpg")
+    monkeypatch.setattr(imgproxy, "UPLOADS_DIR", str(uploads))
+    monkeypatch.setattr(imgproxy, "disk_cache", imgproxy.DiskCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(images, "get_pool", lambda: None)  # the loop's default executor
+    renders = metrics.IMAGE_RENDERS.labels("webp")
+    before = renders.count
+
+    path = await imgproxy.resized_path("coat", "/uploads/coat.jpg", 320, "webp")
+    with Image.open(path) as img:
+        assert img.size == (320, 160)
+    assert renders.count == before + 1
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,118 @@
+import asyncio
+
+import anyio
+import pytest
+
+import jobs
+
+pytestmark = pytest.mark.anyio
+
+DONE = ("succeeded", "failed", "cancelled")
+
+
+@pytest.fixture
+async def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "AI_JOBS_POLL", 0.02)
+    monkeypatch.setattr(jobs, "AI_JOBS_BACKOFF_BASE", 0.0)  # retry at once
+    queue = jobs.JobQueue(str(tmp_path / "jobs.db"), concurrency=2, rate=0)
+    runner = asyncio.create_task(queue.run_forever())
+    yield queue
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+    queue.close()
+
+
+def generate_with(provider):
+    async def handler(job, report):
+        image, mime = await provider.generate(job["params"]["prompt"], None, report)
+        return {"bytes": len(image), "mime": mime, "signature": image[:8].hex()}
+    return handler
+
+
+async def finished(queue, job_id, timeout=5.0):
+    with anyio.fail_after(timeout):
+        while True:
+            job = await queue.get(job_id)
+            if job["status"] in DONE:
+                return job
+            await asyncio.sleep(0.01)
+
+
+async def test_job_runs_through_fake_provider(queue):
+    provider = jobs.FakeProvider(latency=0, failure_rate=0)
+    queue.register("image", generate_with(provider))
+
+    job = await queue.submit("image", {"prompt": "a red jacket"})
+    assert job["status"] == "queued" and job["attempts"] == 0
+
+    job = await finished(queue, job["id"])
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 1 and job["progress"] == 1.0
+    assert job["result"]["mime"] == "image/png"
+    assert job["result"]["signature"] == b"\x89PNG\r\n\x1a\n".hex()
+    assert provider.calls == 1
+    assert (await queue.stats())["by_status"] == {"succeeded": 1}
+
+
+async def test_transient_failure_is_retried(queue):
+    provider = jobs.FakeProvider(latency=0, failure_rate=1)
+    attempts = []
+
+    async def flaky(job, report):
+        attempts.append(job["attempts"])
+        if len(attempts) == 1:
+            await provider.generate("a coat", None, report)  # raises RetryLater
+        return {"ok": True}
+
+    queue.register("image", flaky)
+    job = await finished(queue, (await queue.submit("image", {}))["id"])
+
+    assert job["status"] == "succeeded" and job["result"] == {"ok": True}
+    assert attempts == [1, 2]
+    assert job["error"] == "fake provider: simulated failure"
+    assert queue.retried == 1
+
+
+async def test_job_fails_after_max_attempts(queue):
+    queue.register("image", generate_with(jobs.FakeProvider(latency=0, failure_rate=1)))
+
+    job = await finished(queue, (await queue.submit("image", {"prompt": "x"}, max_attempts=3))["id"])
+
+    assert job["status"] == "failed" and job["attempts"] == 3
+    assert job["error"] == "fake provider: simulated failure (after 3 attempts)"
+    assert queue.retried == 2
+
+
+async def test_job_error_fails_without_retry(queue):
+    async def blocked(job, report):
+        raise jobs.JobError("prompt blocked: SAFETY")
+
+    queue.register("image", blocked)
+    job = await finished(queue, (await queue.submit("image", {}))["id"])
+
+    assert job["status"] == "failed" and job["attempts"] == 1
+    assert job["error"] == "prompt blocked: SAFETY"
+    assert queue.retried == 0
+
+
+async def test_cancel_stops_a_running_job(queue):
+    started = asyncio.Event()
+
+    async def slow(job, report):
+        report(0.5, "halfway")
+        started.set()
+        await asyncio.sleep(30)
+
+    queue.register("image", slow)
+    job = await queue.submit("image", {})
+    await asyncio.wait_for(started.wait(), 5)
+
+    job = await queue.cancel(job["id"])
+    assert job["status"] == "cancelled"
+    await asyncio.sleep(0.05)
+    assert queue._running == {}
+
+
+async def test_unknown_kind_is_rejected(queue):
+    with pytest.raises(jobs.JobError):
+        await queue.submit("video", {})
@@ -0,0 +1,55 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def newest_first(rows: dict) -> list:
+    return [row["id"] for row in sorted(rows.values(), key=lambda row: (row["created_at"], row["id"]), reverse=True)]
+
+
+async def walk(api, **params) -> tuple:
+    """Every page of a listing, following X-Next-Cursor; (ids, responses)."""
+    ids, pages, cursor = [], [], None
+    while True:
+        resp = await api.get("/api/products", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert resp.status_code == 200, resp.text
+        pages.append(resp)
+        ids += [row["id"] for row in resp.json()]
+        cursor = resp.headers.get("x-next-cursor")
+        if not cursor:
+            return ids, pages
+
+
+async def test_cursor_pages_cover_the_listing_once(api, supabase):
+    ids, pages = await walk(api, limit=7, count="true")
+
+    assert ids == newest_first(supabase.rows)
+    assert len(pages) == 6
+    assert pages[0].headers["x-total-count"] == "40"
+
+
+async def test_cursor_pages_within_a_category(api, supabase):
+    jackets = {pid: row for pid, row in supabase.rows.items() if row["category"] == "jackets"}
+    ids, pages = await walk(api, category="jackets", limit=3, fields="id,name")
+
+    assert ids == newest_first(jackets)
+    # created_at rides along: the next cursor is built from it
+    assert all(set(row) == {"id", "name", "created_at"} for page in pages for row in page.json())
+
+
+async def test_cursor_pages_in_price_order(api, supabase):
+    ids, pages = await walk(api, sort="price_asc", limit=9)
+
+    prices = [row["effective_price"] for page in pages for row in page.json()]
+    assert prices == sorted(prices)
+    assert sorted(ids) == sorted(supabase.rows)
+
+
+@pytest.mark.parametrize("params", [
+    {"limit": 5, "cursor": "not-a-cursor"},
+    {"cursor": "WyIyMDI1LTAxLTAxIiwgImlkIl0"},  # a valid cursor needs a limit
+    {"limit": 5, "sort": "price_asc", "cursor": "WyIyMDI1LTAxLTAxIiwgImlkIl0"},  # a newest cursor
+    {"sort": "cheapest"},
+])
+async def test_bad_cursor_is_400(api, params):
+    assert (await api.get("/api/products", params=params)).status_code == 400
@@ -0,0 +1,51 @@
+import pytest
+
+from pricing import PriceIndex, effective_price
+
+PRODUCTS = [
+    {"id": "a", "price": 30, "created_at": "2025-01-03"},
+    {"id": "b", "price": 50, "coupon_code": "SAVE", "discount_amount": 25, "created_at": "2025-01-02"},
+    {"id": "c", "price": 20, "coupon_code": "SAVE", "discount_amount": 40, "created_at": "2025-01-01"},
+    {"id": "d", "price": "30.00", "discount_amount": 10, "created_at": "2025-01-04"},
+    {"id": "e", "price": None, "created_at": "2025-01-05"},
+]
+
+
+@pytest.mark.parametrize("product, expected", [
+    (PRODUCTS[0], 30.0),
+    (PRODUCTS[1], 25.0),
+    (PRODUCTS[2], 0.0),  # never below zero
+    (PRODUCTS[3], 30.0),  # a discount only counts with a coupon
+    (PRODUCTS[4], None),
+])
+def test_effective_price(product, expected):
+    assert effective_price(product) == expected
+
+
+@pytest.fixture
+def index():
+    index = PriceIndex()
+    index.rebuild(PRODUCTS)
+    return index
+
+
+def test_orders(index):
+    # Ties go newest first; products without a price go last
+    assert index.page("price_asc") == ["c", "b", "d", "a", "e"]
+    assert index.page("price_desc") == ["d", "a", "b", "c", "e"]
+    assert index.page("discount")[:2] == ["b", "c"]
+    assert index.page("newest") == ["e", "d", "a", "b", "c"]
+
+
+def test_pages_resume_after_the_cursor(index):
+    first = index.page("price_asc", 2)
+    last = next(p for p in PRODUCTS if p["id"] == first[-1])
+    after = (index.effective_price(last["id"]), last["created_at"], last["id"])
+    assert first + index.page("price_asc", 10, after) == index.page("price_asc")
+
+
+def test_edits_move_products(index):
+    index.upsert({"id": "a", "price": 5, "created_at": "2025-01-03"})
+    index.remove("c")
+    assert index.page("price_asc") == ["a", "b", "d", "e"]
+    assert index.page("price_asc", 2, accept=lambda pid: pid != "a") == ["b", "d"]
@@ -0,0 +1,58 @@
+import httpx
+import pytest
+
+import main
+import ratelimit
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    """Clients for the app behind the rate limiter (off in the test env),
+    with a burst of 3 public requests and no refill to speak of."""
+    monkeypatch.setattr(ratelimit, "buckets", ratelimit.TokenBuckets(
+        {"public": (0.001, 3), "login": (0.001, 1), "images": (0.001, 2)}))
+    app = ratelimit.RateLimitMiddleware(main.app)
+
+    def client(ip: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(ip, 40000)), base_url="http://test")
+    return client
+
+
+async def test_burst_then_429(limited):
+    async with limited("203.0.113.7") as client:
+        codes = [(await client.get("/api/config")).status_code for _ in range(4)]
+        assert codes == [200, 200, 200, 429]
+        refused = await client.get("/api/config")
+        assert refused.json() == {"detail": "Too many requests"}
+        assert int(refused.headers["retry-after"]) >= 1
+        # Health checks are never limited
+        assert (await client.get("/health")).status_code == 200
+
+    async with limited("203.0.113.8") as other:
+        assert (await other.get("/api/config")).status_code == 200
+
+
+async def test_login_has_its_own_stricter_bucket(limited):
+    async with limited("203.0.113.7") as client:
+        codes = [(await client.post("/api/auth/login", json={"password": "wrong"})).status_code for _ in range(2)]
+        assert codes == [401, 429]
+        assert (await client.get("/api/config")).status_code == 200
+
+
+async def test_forwarded_for_is_read_from_trusted_proxies_only(limited, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PROXY_HOPS", 1)
+
+    async with limited("10.0.0.5") as proxy:
+        for visitor in ("198.51.100.1", "198.51.100.2"):
+            codes = [(await proxy.get("/api/config", headers={"X-Forwarded-For": visitor})).status_code
+                     for _ in range(3)]
+            assert codes == [200, 200, 200], visitor
+        assert (await proxy.get("/api/config", headers={"X-Forwarded-For": "198.51.100.1"})).status_code == 429
+
+    # A client reaching the app directly can't pick its address
+    async with limited("203.0.113.9") as direct:
+        codes = [(await direct.get("/api/config", headers={"X-Forwarded-For": f"198.51.100.{n}"})).status_code
+                 for n in range(10, 14)]
+        assert codes == [200, 200, 200, 429]
@@ -0,0 +1,56 @@
+import pytest
+
+import postgrest_mock
+from related import RelatedIndex
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def products():
+    return list(postgrest_mock.make_rows(60, seed=11).values())
+
+
+def neighbours(index, products):
+    return {p["id"]: [pid for pid, _ in index.related(p["id"], 5)] for p in products}
+
+
+def test_a_near_twin_is_the_closest_match(products):
+    original = products[0]
+    twin = dict(original, id="twin", name="Twin", price=original["price"] + 1)
+    index = RelatedIndex()
+    index.rebuild(products + [twin])
+
+    found = index.related(original["id"], 5)
+    assert found[0][0] == "twin"
+    assert original["id"] not in [pid for pid, _ in found]
+    assert [score for _, score in found] == sorted((score for _, score in found), reverse=True)
+
+
+def test_incremental_changes_match_a_rebuild(products):
+    index = RelatedIndex()
+    index.rebuild(products[:40])
+    # New rows, an edit that moves a product to another category, a new
+    # category (taking a spare column) and a removal, in one batch
+    moved = dict(products[1], category="coats")
+    index.apply([(p, None) for p in products[40:]] + [(moved, products[1])], [(products[2]["id"], products[2])])
+
+    final = [p for p in products if p["id"] != products[2]["id"]]
+    final[final.index(products[1])] = moved
+    fresh = RelatedIndex()
+    fresh.rebuild(final)
+
+    assert len(index) == len(fresh) == 59
+    assert neighbours(index, final) == neighbours(fresh, final)
+    assert all(products[2]["id"] not in found for found in neighbours(index, final).values())
+
+
+async def test_related_endpoint(api, supabase):
+    pid = next(iter(supabase.rows))
+    resp = await api.get(f"/api/products/{pid}/related", params={"limit": 4, "fields": "id,category"})
+    assert resp.status_code == 200
+    rows = resp.json()
+    assert len(rows) == 4 and pid not in [row["id"] for row in rows]
+    assert all(set(row) == {"id", "category"} for row in rows)
+
+    assert (await api.get("/api/products/nope/related")).status_code == 404
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+import main
+import replica
+import upstream
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+@pytest.fixture
+async def synced(supabase, tmp_path):
+    db = replica.Replica(str(tmp_path / "replica.db"))
+    await db.sync(upstream.get_client(), main.SUPABASE_URL, main.get_supabase_headers())
+    yield db
+    db.close()
+
+
+async def test_full_sync_copies_the_table(synced, supabase):
+    assert synced.ready and synced.count() == 40
+    pid, row = next(iter(supabase.rows.items()))
+    assert synced.get(pid) == {column: row.get(column) for column in replica.COLUMNS}
+
+    newest = sorted(supabase.rows.values(), key=lambda row: (row["created_at"], row["id"]), reverse=True)
+    first = synced.list(limit=5)
+    assert [row["id"] for row in first] == [row["id"] for row in newest[:5]]
+    after = (first[-1]["created_at"], first[-1]["id"])
+    assert [row["id"] for row in synced.list(limit=5, after=after)] == [row["id"] for row in newest[5:10]]
+
+
+async def test_writes_report_only_what_changed(synced, supabase):
+    pid, row = next(iter(supabase.rows.items()))
+    assert synced.upsert([row]) == []
+    assert synced.upsert([dict(row, category="hats")]) == [(pid, row["category"], "hats")]
+    assert synced.delete([pid, "missing"]) == [(pid, "hats", None)]
+    assert synced.get(pid) is None
+
+
+async def test_the_api_serves_and_updates_the_replica(api, synced, supabase, monkeypatch):
+    monkeypatch.setattr(main, "read_replica", synced)
+    writers = []
+    upsert = synced.upsert
+    monkeypatch.setattr(synced, "upsert", lambda rows: writers.append(threading.get_ident()) or upsert(rows))
+    pid = next(iter(supabase.rows))
+
+    resp = await api.patch(f"/api/admin/products/{pid}", json={"name": "Replica Coat"}, headers=ADMIN)
+    assert resp.status_code == 200
+    assert synced.get(pid)["name"] == "Replica Coat"
+    # Written off the event loop
+    assert writers and threading.get_ident() not in writers
+
+    supabase.down = True
+    assert (await api.get(f"/api/products/{pid}")).json()["name"] == "Replica Coat"
+    listing = await api.get("/api/products", params={"limit": 40})
+    assert len(listing.json()) == 40
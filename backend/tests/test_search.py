@@ -0,0 +1,67 @@
+import pytest
+
+from search import SearchIndex
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.rebuild([
+        {"id": "a", "name": "Plaid Flannel Shirt", "category": "shirts", "color": "Red Plaid"},
+        {"id": "b", "name": "Denim Jacket", "category": "jackets", "description": "Flannel lined"},
+        {"id": "c", "name": "Crème Knit", "category": "tees", "color": "Cream"},
+    ])
+    return index
+
+
+def test_name_matches_rank_above_description_matches(index):
+    assert [pid for pid, _ in index.search("flannel")] == ["a", "b"]
+
+
+def test_every_token_must_match(index):
+    assert [pid for pid, _ in index.search("flannel jacket")] == ["b"]
+    assert index.search("flannel hoodie") == []
+
+
+def test_last_token_matches_as_a_prefix(index):
+    assert [pid for pid, _ in index.search("den")] == ["b"]
+    assert index.search("den", prefix=False) == []
+
+
+def test_accents_and_case_are_folded(index):
+    assert [pid for pid, _ in index.search("CREME")] == ["c"]
+
+
+def test_upsert_and_remove_keep_the_index_current(index):
+    index.upsert({"id": "b", "name": "Corduroy Jacket", "category": "jackets"})
+    assert [pid for pid, _ in index.search("flannel")] == ["a"]
+    assert [pid for pid, _ in index.search("cord")] == ["b"]
+
+    index.remove("b")
+    assert index.search("jacket") == [] and len(index) == 2
+
+
+async def test_search_endpoint(api, supabase):
+    jacket = next(row for row in supabase.rows.values() if row["category"] == "jackets")
+    word = jacket["name"].split()[0]
+
+    resp = await api.get("/api/products/search", params={"q": word.lower(), "limit": 50})
+    assert resp.status_code == 200
+    assert all(word.lower() in (row["name"] + row["description"]).lower() for row in resp.json())
+
+    resp = await api.get("/api/products/search", params={"q": word, "category": "jackets", "fields": "id,name"})
+    assert jacket["id"] in [row["id"] for row in resp.json()]
+    assert all(set(row) == {"id", "name"} for row in resp.json())
+
+
+async def test_search_sees_product_edits(api, supabase):
+    pid = next(iter(supabase.rows))
+    await api.get("/api/products/search", params={"q": "vintage"})  # loads the catalog
+
+    await api.patch(f"/api/admin/products/{pid}", json={"name": "Houndstooth Overcoat"}, headers=ADMIN)
+    resp = await api.get("/api/products/search", params={"q": "houndstooth"})
+    assert [row["id"] for row in resp.json()] == [pid]
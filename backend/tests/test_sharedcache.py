@@ -0,0 +1,72 @@
+import os
+import asyncio
+
+import pytest
+
+import sharedcache
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two workers' handles on one shared cache file."""
+    path = str(tmp_path / "shared" / "cache.db")
+    os.makedirs(os.path.dirname(path), mode=0o700)
+    first, second = sharedcache.SharedCache(path), sharedcache.SharedCache(path)
+    yield first, second
+    first.close()
+    second.close()
+
+
+async def test_only_one_worker_loads_a_key(workers):
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(0.05)
+        return {"rows": [1, 2]}
+
+    # (within one worker, _Cache already coalesces)
+    results = await asyncio.gather(*(worker.fetch("products:all", loader, 60) for worker in workers))
+    assert len(loads) == 1
+    assert all(value == {"rows": [1, 2]} for value, _ in results)
+
+
+async def test_invalidations_reach_the_other_worker_only(workers):
+    first, second = workers
+    await first.put("products:shirts?limit=5", [1], first._current_seq())
+    await first.put("products:jackets", [2], first._current_seq())
+
+    await asyncio.wrap_future(first.publish("variants", "products:shirts"))
+    assert await second.get("products:shirts?limit=5", 60) is None
+    assert (await second.get("products:jackets", 60))[0] == [2]
+    assert await second.poll() == [("variants", "products:shirts")]
+    assert await first.poll() == []
+
+
+async def test_a_load_overtaken_by_an_invalidation_is_not_stored(workers):
+    first, second = workers
+    since = first._current_seq()
+    await asyncio.wrap_future(second.publish("prefix", "products:"))
+
+    assert not await first.put("products:all", [1], since)
+    assert await first.put("products:all", [1], second._current_seq())
+
+
+async def test_leases_are_exclusive_until_they_lapse(workers):
+    first, second = workers
+    assert await first.try_lease("change-sync", ttl=60)
+    assert not await second.try_lease("change-sync", ttl=60)
+    assert await second.lease_held("change-sync")
+
+    await first.try_lease("change-sync", ttl=-1)  # lapsed
+    assert await second.try_lease("change-sync", ttl=60)
+
+
+def test_the_directory_must_be_private(tmp_path):
+    shared = tmp_path / "open"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    with pytest.raises(PermissionError):
+        sharedcache.SharedCache(str(shared / "cache.db"))
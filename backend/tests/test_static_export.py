@@ -0,0 +1,82 @@
+import os
+import json
+
+import pytest
+
+import main
+import postgrest_mock
+import static_export
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+def read(root, relative):
+    with open(os.path.join(root, relative)) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def products():
+    return list(postgrest_mock.make_rows(12, seed=3).values())
+
+
+def test_full_export_writes_every_shard(tmp_path, products):
+    exporter = static_export.StaticExport(str(tmp_path))
+    result = exporter.export(products)
+
+    manifest = exporter.read_manifest()
+    assert result["full"] and manifest["count"] == 12
+    index = read(tmp_path, manifest["index"])
+    assert [row["id"] for row in index] == [row["id"] for row in static_export._newest_first(products)]
+    assert set(index[0]) == set(static_export.INDEX_FIELDS)
+    for category, path in manifest["categories"].items():
+        assert {row["category"] for row in read(tmp_path, path)} == {category}
+    some = products[0]
+    assert read(tmp_path, manifest["products"][some["id"]]) == some
+
+
+def test_partial_export_rewrites_only_touched_shards(tmp_path, products, monkeypatch):
+    exporter = static_export.StaticExport(str(tmp_path))
+    exporter.export(products)
+    before = exporter.read_manifest()
+
+    edited, untouched = products[0], next(p for p in products if p["category"] != products[0]["category"])
+    edited["name"] = "Renamed"
+    result = exporter.export(products, [edited["id"]], [edited["category"]])
+    after = exporter.read_manifest()
+
+    assert not result["full"]
+    assert after["products"][edited["id"]] != before["products"][edited["id"]]
+    assert after["categories"][edited["category"]] != before["categories"][edited["category"]]
+    assert after["products"][untouched["id"]] == before["products"][untouched["id"]]
+    assert after["categories"][untouched["category"]] == before["categories"][untouched["category"]]
+    # Readers holding the old manifest can still fetch what it points at...
+    old_shard = before["products"][edited["id"]]
+    assert old_shard in after["retired"] and os.path.exists(tmp_path / old_shard)
+
+    # ...until the retention period is over
+    monkeypatch.setattr(static_export, "STATIC_EXPORT_RETENTION", -1)
+    exporter.export(products, [], [])
+    assert not os.path.exists(tmp_path / old_shard)
+    assert old_shard not in exporter.read_manifest()["retired"]
+
+
+def test_deleted_products_leave_the_export(tmp_path, products):
+    exporter = static_export.StaticExport(str(tmp_path))
+    exporter.export(products)
+    gone = products.pop()
+
+    exporter.export(products, [gone["id"]], [gone["category"]])
+    manifest = exporter.read_manifest()
+    assert gone["id"] not in manifest["products"]
+    assert gone["id"] not in [row["id"] for row in read(tmp_path, manifest["index"])]
+
+
+async def test_export_endpoint(api, supabase, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "exporter", static_export.StaticExport(str(tmp_path)))
+
+    resp = await api.post("/api/admin/export", headers=ADMIN)
+    assert resp.status_code == 200 and resp.json()["full"]
+    assert set(main.exporter.read_manifest()["products"]) == set(supabase.rows)
@@ -0,0 +1,81 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import images
+import postgrest_mock
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+def photo(width: int, height: int, mode: str = "RGB") -> bytes:
+    buf = io.BytesIO()
+    Image.new(mode, (width, height), "red" if mode == "RGB" else None).save(buf, "PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Render in threads: the pipeline is the same, without process start-up."""
+    postgrest_mock.OBJECTS.clear()
+    with ThreadPoolExecutor(2) as executor:
+        monkeypatch.setattr(images, "get_pool", lambda: executor)
+        yield
+    postgrest_mock.OBJECTS.clear()
+
+
+def test_variants_are_only_scaled_down(tmp_path):
+    path = tmp_path / "wide.png"
+    path.write_bytes(photo(2000, 1000, "RGBA"))
+
+    rendered = images.render_variants(str(path))
+    sizes = {name: (v["width"], v["height"]) for name, v in rendered["variants"].items()}
+    assert sizes == {"thumb": (200, 100), "card": (640, 320), "full": (1600, 800)}
+    assert rendered["variants"]["thumb"]["webp"][:4] == b"RIFF"
+
+    path.write_bytes(photo(300, 150))
+    small = images.render_variants(str(path))["variants"]
+    assert (small["full"]["width"], small["card"]["width"], small["thumb"]["width"]) == (300, 300, 200)
+
+
+def test_unreadable_images_are_refused(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not an image")
+    with pytest.raises(images.ImageError):
+        images.render_variants(str(path))
+
+
+async def test_upload_stores_variants_and_updates_the_product(api, supabase, pool):
+    pid = next(iter(supabase.rows))
+    files = [("files", ("a.png", photo(800, 600), "image/png")), ("files", ("b.txt", b"hello", "text/plain"))]
+
+    resp = await api.post(f"/api/admin/products/{pid}/images", files=files, headers=ADMIN)
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert [error["file"] for error in body["errors"]] == ["b.txt"]
+    url = body["uploaded"][0]["url"]
+    assert url.endswith("-full.jpg") and url in supabase.rows[pid]["images"]
+    assert supabase.rows[pid]["image_manifest"][url]["srcset"]["webp"].count("w,") == 2
+    # 3 sizes x 2 formats, stored under content-addressed names
+    assert len(postgrest_mock.OBJECTS) == 6
+
+    again = await api.post(f"/api/admin/products/{pid}/images", files=files[:1], headers=ADMIN)
+    assert again.json()["uploaded"][0]["url"] == url
+    assert supabase.rows[pid]["images"].count(url) == 1 and len(postgrest_mock.OBJECTS) == 6
+
+
+async def test_upload_errors(api, supabase, pool, monkeypatch):
+    pid = next(iter(supabase.rows))
+    missing = await api.post("/api/admin/products/nope/images", files=[("files", ("a.png", photo(10, 10)))],
+                             headers=ADMIN)
+    assert missing.status_code == 404
+
+    monkeypatch.setattr(images, "IMAGE_MAX_BYTES", 100)
+    too_big = await api.post(f"/api/admin/products/{pid}/images", files=[("files", ("a.png", photo(400, 400)))],
+                             headers=ADMIN)
+    assert too_big.status_code == 400
+    assert too_big.json()["detail"]["errors"][0]["error"].startswith("larger than")
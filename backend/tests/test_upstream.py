@@ -0,0 +1,137 @@
+import socket
+
+import httpcore
+import httpx
+import pytest
+
+import upstream
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeNetwork(httpcore.AsyncNetworkBackend):
+    """Refuses connections to the addresses in `down`."""
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.tried = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.tried.append(host)
+        if host in self.down:
+            raise httpcore.ConnectError(f"{host} refused")
+        return host
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    answers = {"supabase.test": ["10.0.0.1", "10.0.0.2", "10.0.0.1"]}
+    lookups = []
+
+    async def getaddrinfo(host, port, type=0):
+        lookups.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port)) for address in answers[host]]
+
+    monkeypatch.setattr(upstream.anyio, "getaddrinfo", getaddrinfo)
+    return answers, lookups
+
+
+async def test_dns_cache_keeps_every_address(resolver):
+    _, lookups = resolver
+    network = FakeNetwork()
+    dns = upstream._CachingDNSBackend(ttl=60, backend=network)
+
+    assert await dns.connect_tcp("supabase.test", 443) == "10.0.0.1"
+    assert await dns.connect_tcp("supabase.test", 443) == "10.0.0.1"
+    assert lookups == ["supabase.test"]
+    assert dns._cache[("supabase.test", 443)][0] == ["10.0.0.1", "10.0.0.2"]
+
+
+async def test_dns_cache_falls_back_to_the_next_address(resolver):
+    _, lookups = resolver
+    network = FakeNetwork(down={"10.0.0.1"})
+    dns = upstream._CachingDNSBackend(ttl=60, backend=network)
+
+    assert await dns.connect_tcp("supabase.test", 443, timeout=2) == "10.0.0.2"
+    # The address that answered is tried first from now on
+    assert await dns.connect_tcp("supabase.test", 443) == "10.0.0.2"
+    assert network.tried == ["10.0.0.1", "10.0.0.2", "10.0.0.2"]
+    assert lookups == ["supabase.test"]
+
+
+async def test_dns_cache_drops_the_entry_when_every_address_fails(resolver):
+    answers, lookups = resolver
+    network = FakeNetwork(down={"10.0.0.1", "10.0.0.2"})
+    dns = upstream._CachingDNSBackend(ttl=60, backend=network)
+
+    with pytest.raises(httpcore.ConnectError):
+        await dns.connect_tcp("supabase.test", 443)
+    assert ("supabase.test", 443) not in dns._cache
+
+    # The host moved: the next connection resolves again
+    answers["supabase.test"] = ["10.0.0.3"]
+    assert await dns.connect_tcp("supabase.test", 443) == "10.0.0.3"
+    assert lookups == ["supabase.test", "supabase.test"]
+
+
+@pytest.fixture
+def flaky_host(monkeypatch):
+    """A transport whose calls all fail, wrapped in the retry + breaker layer."""
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRIES", 2)
+    monkeypatch.setattr(upstream, "_backoff", lambda attempt: 0)
+    monkeypatch.setattr(upstream, "_breakers", {})
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        raise httpx.ConnectError("refused", request=request)
+
+    client = httpx.AsyncClient(transport=upstream._ResilientTransport(httpx.MockTransport(handler)))
+    return client, sent
+
+
+async def test_breaker_counts_a_call_once_however_many_attempts(flaky_host):
+    client, sent = flaky_host
+    for _ in range(upstream.BREAKER_FAILURES - 1):
+        with pytest.raises(httpx.ConnectError):
+            await client.get("http://supabase.test/rest/v1/products")
+    assert len(sent) == 3 * (upstream.BREAKER_FAILURES - 1)
+    assert upstream.breaker("supabase.test").state == "closed"
+
+    with pytest.raises(httpx.ConnectError):
+        await client.get("http://supabase.test/rest/v1/products")
+    assert upstream.breaker("supabase.test").state == "open"
+    with pytest.raises(upstream.CircuitOpenError):
+        await client.get("http://supabase.test/rest/v1/products")
+
+
+async def test_breaker_probe_is_not_retried(flaky_host):
+    client, sent = flaky_host
+    circuit = upstream.breaker("supabase.test")
+    circuit.failures, circuit.opened_at = upstream.BREAKER_FAILURES, 0.0  # open, cooldown over
+
+    with pytest.raises(httpx.ConnectError):
+        await client.get("http://supabase.test/rest/v1/products")
+    assert len(sent) == 1
+    assert circuit.state == "open" and circuit.cooldown == 2 * upstream.BREAKER_COOLDOWN
+
+
+class Body(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b"x" * 10
+
+
+async def test_image_downloads_do_not_take_supabase_slots():
+    supabase, images = upstream.ConcurrencyLimiter(1, queue=0), upstream.ConcurrencyLimiter(1, queue=0)
+    transport = upstream._AdmissionTransport(
+        httpx.MockTransport(lambda request: httpx.Response(200, stream=Body())), supabase, images
+    )
+    async with httpx.AsyncClient(transport=transport) as client:
+        async with client.stream("GET", "https://cdn.test/a.jpg", extensions=upstream.IMAGE_LANE):
+            # The download holds the only image slot until its body is closed...
+            assert images.in_flight == 1 and supabase.in_flight == 0
+            with pytest.raises(upstream.UpstreamBusyError):
+                await client.get("https://cdn.test/b.jpg", extensions=upstream.IMAGE_LANE)
+            # ...while Supabase calls still go through
+            assert (await client.get("http://supabase.test/rest/v1/products")).status_code == 200
+        assert images.in_flight == 0 and supabase.in_flight == 0
@@ -0,0 +1,101 @@
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+async def test_patch_with_a_stale_version_is_409(api, supabase):
+    pid = next(iter(supabase.rows))
+    row = (await api.get(f"/api/products/{pid}")).json()
+
+    ok = await api.patch(f"/api/admin/products/{pid}", json={"price": 10, "version": row["version"]}, headers=ADMIN)
+    assert ok.status_code == 200 and ok.json()["version"] == row["version"] + 1
+
+    stale = await api.patch(f"/api/admin/products/{pid}", json={"price": 11, "version": row["version"]},
+                            headers=ADMIN)
+    assert stale.status_code == 409
+    stale = await api.patch(f"/api/admin/products/{pid}", json={"price": 11, "updated_at": row["updated_at"]},
+                            headers=ADMIN)
+    assert stale.status_code == 409
+    assert supabase.rows[pid]["price"] == 10
+    assert (await api.get(f"/api/products/{pid}")).json()["price"] == 10
+
+
+async def test_patch_of_a_missing_product_is_404(api):
+    resp = await api.patch(f"/api/admin/products/{uuid.uuid4()}", json={"price": 1, "version": 1}, headers=ADMIN)
+    assert resp.status_code == 404
+
+
+@pytest.mark.parametrize("body", [
+    {"price": 1, "version": "2"},
+    {"price": 1, "version": 1.5},
+    {"price": 1, "updated_at": "yesterday"},
+    {"price": "free"},
+    {"bogus": 1},
+])
+async def test_bad_patch_is_400_without_a_write(api, supabase, body):
+    pid = next(iter(supabase.rows))
+    before = dict(supabase.rows[pid])
+
+    resp = await api.patch(f"/api/admin/products/{pid}", json=body, headers=ADMIN)
+    assert resp.status_code == 400
+    assert supabase.rows[pid] == before
+
+
+async def test_patch_needs_admin(api, supabase):
+    pid = next(iter(supabase.rows))
+    assert (await api.patch(f"/api/admin/products/{pid}", json={"price": 1})).status_code == 401
+
+
+async def test_delete_with_a_stale_version_is_409(api, supabase):
+    pid = next(iter(supabase.rows))
+    version = supabase.rows[pid]["version"]
+    await api.patch(f"/api/admin/products/{pid}", json={"price": 10}, headers=ADMIN)
+
+    stale = await api.delete(f"/api/admin/products/{pid}", params={"version": version}, headers=ADMIN)
+    assert stale.status_code == 409 and pid in supabase.rows
+
+    ok = await api.delete(f"/api/admin/products/{pid}", params={"version": version + 1}, headers=ADMIN)
+    assert ok.status_code == 200 and pid not in supabase.rows
+    assert (await api.get(f"/api/products/{pid}")).status_code == 404
+
+
+# ── v2 ──
+
+async def test_patch_v2_with_a_stale_version_is_409(api, supabase):
+    pid = next(iter(supabase.rows))
+    version = supabase.rows[pid]["version"]
+
+    ok = await api.patch(f"/api/v2/admin/products/{pid}", json={"color": "Navy", "version": version},
+                         headers=ADMIN)
+    assert ok.status_code == 200 and ok.json()["color"] == "Navy"
+    stale = await api.patch(f"/api/v2/admin/products/{pid}", json={"color": "Rust", "version": version},
+                            headers=ADMIN)
+    assert stale.status_code == 409
+
+
+@pytest.mark.parametrize("body", [
+    {"price": -1},
+    {"name": None},
+    {"bogus": 1},
+    {"sizes": "M"},
+])
+async def test_patch_v2_rejects_bodies_the_schema_does_not_allow(api, supabase, body):
+    pid = next(iter(supabase.rows))
+    before = dict(supabase.rows[pid])
+
+    resp = await api.patch(f"/api/v2/admin/products/{pid}", json=body, headers=ADMIN)
+    assert resp.status_code == 422
+    assert supabase.rows[pid] == before
+
+
+async def test_create_v2(api, supabase):
+    resp = await api.post("/api/v2/admin/products", json={"name": "Typed Tee", "price": 15, "sizes": ["M"]},
+                          headers=ADMIN)
+    assert resp.status_code == 201
+    row = resp.json()
+    assert supabase.rows[row["id"]]["name"] == "Typed Tee"
+    assert (await api.get(f"/api/products/{row['id']}")).json()["sizes"] == ["M"]
@@ -0,0 +1,502 @@
+import os
+import time
+import random
+import socket
+import asyncio
+from typing import Optional
+
+import anyio
+import httpx
+import httpcore
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# ──────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────
+
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1") == "1"
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "50"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+UPSTREAM_DNS_TTL = float(os.getenv("UPSTREAM_DNS_TTL", "60"))
+# Retries for idempotent calls that failed in transit or with 502/503/504,
+# backing off with full jitter
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BASE = float(os.getenv("UPSTREAM_RETRY_BASE", "0.1"))  # seconds
+UPSTREAM_RETRY_MAX = float(os.getenv("UPSTREAM_RETRY_MAX", "1"))
+# Consecutive failed calls (each counted once, after its retries) that open
+# a host's circuit, and how long it stays open before one probe is let
+# through (doubling while probes fail)
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "5"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", "60"))
+# Upstream calls in flight at once per process; more wait in a queue of at
+# most UPSTREAM_QUEUE for up to UPSTREAM_QUEUE_TIMEOUT, the rest fail fast
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "32"))
+UPSTREAM_QUEUE = int(os.getenv("UPSTREAM_QUEUE", "64"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "2"))  # seconds
+# Image downloads (the /img proxy's sources, reference images for AI jobs)
+# hold a slot until their body is read, so they queue in a lane of their
+# own instead of taking slots from Supabase calls
+UPSTREAM_IMAGE_CONCURRENCY = int(os.getenv("UPSTREAM_IMAGE_CONCURRENCY", "8"))
+UPSTREAM_IMAGE_QUEUE = int(os.getenv("UPSTREAM_IMAGE_QUEUE", "32"))
+
+
+class UpstreamError(Exception):
+    """Supabase answered, but not with something we can use."""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"{response.status_code} {response.text[:200]}")
+        self.response = response
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Not sent: the host has been failing, so calls fail fast until a
+    probe succeeds. A TransportError, so existing handlers treat it like
+    any other unreachable-upstream error."""
+
+    def __init__(self, host: str, retry_after: float, request: httpx.Request):
+        super().__init__(f"circuit open for {host}, retry in {retry_after:.1f}s", request=request)
+        self.retry_after = retry_after
+
+
+class UpstreamBusyError(httpx.TransportError):
+    """Not sent: this process already has as many upstream calls in flight
+    and waiting as it allows. Like CircuitOpenError, a TransportError."""
+
+    def __init__(self, retry_after: float, request: httpx.Request):
+        super().__init__(f"upstream busy, retry in {retry_after:.0f}s", request=request)
+        self.retry_after = retry_after
+
+
+# ──────────────────────────────────────────
+# DNS CACHE
+# ──────────────────────────────────────────
+
+class _CachingDNSBackend(httpcore.AsyncNetworkBackend):
+    """Network backend that remembers getaddrinfo() results for up to
+    UPSTREAM_DNS_TTL (getaddrinfo does not report the record's own TTL).
+
+    Every address is kept and tried in turn, each with its share of the
+    connect timeout; one that refuses goes to the back of the list, and if
+    none answer the entry is dropped so the next connection resolves again.
+    Only the TCP connect target is swapped for the cached IP; TLS still uses
+    the original hostname for SNI and certificate checks.
+    """
+
+    def __init__(self, ttl: float = UPSTREAM_DNS_TTL, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self._backend = backend or httpcore.AnyIOBackend()
+        self._ttl = ttl
+        self._cache: dict = {}  # (host, port) -> ([address, ...], resolved at)
+
+    async def _resolve(self, host: str, port: int) -> list:
+        entry = self._cache.get((host, port))
+        now = time.monotonic()
+        if entry and now - entry[1] < self._ttl:
+            return entry[0]
+        try:
+            infos = await anyio.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError:
+            # Keep serving the last known addresses while the resolver is down
+            if entry:
+                return entry[0]
+            raise
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._cache[(host, port)] = (addresses, now)
+        return addresses
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addresses = await self._resolve(host, port)
+        candidates = list(addresses)
+        share = timeout / len(candidates) if timeout else timeout
+        for i, address in enumerate(candidates):
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=share, local_address=local_address, socket_options=socket_options
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                if i == len(candidates) - 1:
+                    if self._cache.get((host, port), (None,))[0] is addresses:
+                        del self._cache[(host, port)]
+                    raise
+                if address in addresses:  # try the others first from now on
+                    addresses.remove(address)
+                    addresses.append(address)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+# ──────────────────────────────────────────
+# INSTRUMENTATION
+# ──────────────────────────────────────────
+
+_OPERATIONS = {"GET": "select", "HEAD": "count", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+def _operation(request: httpx.Request) -> tuple:
+    """(target, operation) labels: the PostgREST table and what is done to
+    it, "storage" for Storage calls, "external" for anything else."""
+    path = request.url.path
+    if path.startswith("/rest/v1/"):
+        operation = _OPERATIONS.get(request.method, request.method.lower())
+        if operation == "insert" and "resolution=" in request.headers.get("prefer", ""):
+            operation = "upsert"
+        return path[9:].partition("/")[0], operation
+    if path.startswith("/storage/v1/"):
+        return "storage", request.method.lower()
+    return "external", request.method.lower()
+
+
+class _TimedTransport(httpx.AsyncBaseTransport):
+    """Records every upstream call in metrics.UPSTREAM_LATENCY, up to the
+    response headers (bodies are read by the caller afterwards)."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            target, operation = _operation(request)
+            metrics.UPSTREAM_LATENCY.labels(target, operation, status).observe(time.perf_counter() - started)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# ──────────────────────────────────────────
+# CIRCUIT BREAKER + RETRIES
+# ──────────────────────────────────────────
+#
+#   closed      calls go through; BREAKER_FAILURES failed calls in a row open
+#               it, a call counting once however many attempts it made
+#   open        calls fail at once with CircuitOpenError until the cooldown ends
+#   half-open   one probe call goes through: success closes the circuit,
+#               failure reopens it with twice the cooldown
+
+_RETRY_STATUSES = {502, 503, 504}
+_IDEMPOTENT = {"GET", "HEAD", "OPTIONS"}
+# Errors raised before the request left us, so safe to retry for any method
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitBreaker:
+    def __init__(self, host: str, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.host = host
+        self.threshold = failures
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.probing or self.retry_after() == 0 else "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; claims the probe when half-open."""
+        if self.opened_at is None:
+            return True
+        if self.probing or self.retry_after() > 0:
+            return False
+        self.probing = True
+        return True
+
+    def success(self):
+        if self.opened_at is not None:
+            print(f"✅ Upstream {self.host} recovered")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.cooldown = self.base_cooldown
+
+    def failure(self):
+        self.failures += 1
+        if self.probing:
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+        elif self.opened_at is not None or self.failures < self.threshold:
+            return
+        else:
+            self.trips += 1
+            print(f"⚠️ Upstream {self.host} failing, circuit open for {self.cooldown:.0f}s")
+        self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self):
+        """The probe ended without a verdict (e.g. cancelled)."""
+        self.probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips,
+                "retry_after": round(self.retry_after(), 1)}
+
+
+_breakers: dict = {}
+
+
+def breaker(host: str) -> CircuitBreaker:
+    found = _breakers.get(host)
+    if found is None:
+        found = _breakers[host] = CircuitBreaker(host)
+    return found
+
+
+def retry_after(error: Optional[Exception] = None) -> int:
+    """Seconds until the next probe of any open circuit (at least 1), or
+    the wait `error` suggests, for Retry-After headers."""
+    waits = [b.retry_after() for b in _breakers.values() if b.opened_at is not None]
+    waits.append(getattr(error, "retry_after", 1))
+    return max(1, int(max(waits) + 0.999))
+
+
+def stats() -> dict:
+    return {"circuits": {host: b.stats() for host, b in _breakers.items()}, "admission": limiter.stats(),
+            "image_admission": image_limiter.stats()}
+
+
+metrics.Gauge("upstream_circuits_open", "Upstream hosts whose circuit is open or half-open.",
+              fn=lambda: sum(b.opened_at is not None for b in _breakers.values()))
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(UPSTREAM_RETRY_MAX, UPSTREAM_RETRY_BASE * 2 ** attempt))
+
+
+class _ResilientTransport(httpx.AsyncBaseTransport):
+    """Circuit breaker per host around the real transport, plus bounded
+    retries. Non-idempotent calls are only retried when they never left.
+    The breaker hears of a failure once the call gives up; a probe is
+    never retried, so its verdict comes at once."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        circuit = breaker(request.url.host)
+        idempotent = request.method in _IDEMPOTENT
+        attempt = 0
+        while True:
+            if not circuit.allow():
+                metrics.UPSTREAM_SHORT_CIRCUITS.labels(request.url.host).value += 1
+                raise CircuitOpenError(request.url.host, circuit.retry_after(), request)
+            last = attempt >= UPSTREAM_RETRIES or circuit.probing
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if last or not (idempotent or isinstance(e, _NOT_SENT)):
+                    circuit.failure()
+                    raise
+            except BaseException:
+                circuit.release()
+                raise
+            else:
+                if response.status_code < 500:
+                    circuit.success()
+                    return response
+                if last or not idempotent or response.status_code not in _RETRY_STATUSES:
+                    circuit.failure()
+                    return response
+                await response.aclose()
+            attempt += 1
+            metrics.UPSTREAM_RETRIES.labels(request.url.host).value += 1
+            await asyncio.sleep(_backoff(attempt))
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# ──────────────────────────────────────────
+# ADMISSION CONTROL
+# ──────────────────────────────────────────
+#
+# Outermost layer of the client, so a call holds one slot through its
+# retries and until its body has been read. Image downloads pass
+# extensions=IMAGE_LANE and wait on image_limiter instead. A spike of cache misses then
+# queues here instead of opening hundreds of connections to Supabase, and
+# once the queue is full callers get UpstreamBusyError at once (a 503 with
+# Retry-After) rather than waiting on a pool that cannot catch up.
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int = UPSTREAM_CONCURRENCY, queue: int = UPSTREAM_QUEUE,
+                 timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self) -> bool:
+        """Take a slot; False if the queue is full or the wait timed out."""
+        if self._semaphore.locked():
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting,
+                "queue": self.queue, "rejected": self.rejected}
+
+
+limiter = ConcurrencyLimiter()
+image_limiter = ConcurrencyLimiter(UPSTREAM_IMAGE_CONCURRENCY, UPSTREAM_IMAGE_QUEUE)
+IMAGE_LANE = {"admission": "images"}
+
+metrics.Gauge("upstream_in_flight", "Upstream calls holding an admission slot.", fn=lambda: limiter.in_flight)
+metrics.Gauge("upstream_waiting", "Upstream calls queued for an admission slot.", fn=lambda: limiter.waiting)
+metrics.Gauge("upstream_rejected", "Upstream calls refused because the queue was full or timed out.",
+              fn=lambda: limiter.rejected)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives the admission slot back once it is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class _AdmissionTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: ConcurrencyLimiter,
+                 image_limiter: ConcurrencyLimiter):
+        self._transport = transport
+        self._limiter = limiter
+        self._image_limiter = image_limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        lane = self._image_limiter if request.extensions.get("admission") == "images" else self._limiter
+        if not await lane.acquire():
+            raise UpstreamBusyError(max(1.0, lane.timeout), request)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            lane.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, lane.release)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# ──────────────────────────────────────────
+# SHARED CLIENT
+# ──────────────────────────────────────────
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    if not UPSTREAM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """The shared client's layers around `transport`, by default a pooled
+    HTTP transport (tests pass one that answers in process)."""
+    global limiter, image_limiter
+    # asyncio primitives belong to the running loop
+    limiter = ConcurrencyLimiter()
+    image_limiter = ConcurrencyLimiter(UPSTREAM_IMAGE_CONCURRENCY, UPSTREAM_IMAGE_QUEUE)
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        UPSTREAM_READ_TIMEOUT,
+        connect=UPSTREAM_CONNECT_TIMEOUT,
+        pool=UPSTREAM_POOL_TIMEOUT,
+    )
+    if transport is None:
+        transport = httpx.AsyncHTTPTransport(http2=_http2_available(), limits=limits)
+        # httpx has no public hook for the resolver, so swap the pool's backend;
+        # if a future httpx moves it, connections simply resolve as usual
+        pool = getattr(transport, "_pool", None)
+        if isinstance(getattr(pool, "_network_backend", None), httpcore.AsyncNetworkBackend):
+            pool._network_backend = _CachingDNSBackend()
+        else:
+            print("⚠️  Upstream DNS cache unavailable with this httpx version")
+    if metrics.METRICS_ENABLED:
+        transport = _TimedTransport(transport)
+    transport = _ResilientTransport(transport)
+    transport = _AdmissionTransport(transport, limiter, image_limiter)
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the app-lifetime client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = build_client()
+    return _client
+
+
+async def startup():
+    get_client()
+
+
+async def shutdown():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
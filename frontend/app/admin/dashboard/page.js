@@ -83,35 +83,40 @@ export default function AdminDashboard() {
                 ? [form.header_image, ...extraUrls.filter(u => u !== form.header_image)]
                 : extraUrls;
 
-            const fd = new FormData();
-            fd.append('name', form.name);
-            fd.append('price', form.price);
-            fd.append('category', form.category);
-            fd.append('description', form.description);
-            fd.append('color', form.color);
-            fd.append('video_url', form.video_url);
-            fd.append('condition', form.condition);
-            fd.append('coupon_code', form.coupon_code);
-            fd.append('discount_amount', form.discount_amount || 0);
-            fd.append('sizes', JSON.stringify(form.sizes));
-            fd.append('measurements', JSON.stringify(
-                Object.fromEntries(Object.entries(form.measurements).filter(([, v]) => v))
-            ));
-            fd.append('header_image', form.header_image || '');
-            fd.append('images', JSON.stringify(allImages));
+            const body = {
+                name: form.name,
+                price: Number(form.price),
+                category: form.category,
+                description: form.description,
+                color: form.color,
+                video_url: form.video_url,
+                condition: form.condition,
+                coupon_code: form.coupon_code,
+                discount_amount: Number(form.discount_amount) || 0,
+                sizes: form.sizes,
+                measurements: Object.fromEntries(Object.entries(form.measurements).filter(([, v]) => v)),
+                header_image: form.header_image || '',
+                images: allImages,
+            };
 
             const url = editId
-                ? `${API_URL}/api/admin/products/${editId}`
-                : `${API_URL}/api/admin/products`;
+                ? `${API_URL}/api/v2/admin/products/${editId}`
+                : `${API_URL}/api/v2/admin/products`;
             const method = editId ? 'PUT' : 'POST';
 
             const res = await fetch(url, {
                 method,
-                headers: { Authorization: `Bearer ${token}` },
-                body: fd,
+                headers: { Authorization: `Bearer ${token}`, 'Content-Type': 'application/json' },
+                body: JSON.stringify(body),
             });
 
-            if (!res.ok) throw new Error((await res.json()).detail || 'Request failed');
+            if (!res.ok) {
+                const { detail } = await res.json();
+                // v2 validation errors are a list of {loc, msg}
+                throw new Error(Array.isArray(detail)
+                    ? detail.map(d => `${d.loc.join('.')}: ${d.msg}`).join('; ')
+                    : detail || 'Request failed');
+            }
             showSuccess(editId ? 'Product updated!' : 'Product added to store!');
             resetForm();
             loadProducts();
@@ -9,33 +9,52 @@ import styles from './page.module.css';
 
 const API_URL = 'https://dicks-and-toes-shop-api.onrender.com';
 
+const SORTS = [
+    { value: 'newest', label: 'Newest' },
+    { value: 'price_asc', label: 'Price: low to high' },
+    { value: 'price_desc', label: 'Price: high to low' },
+    { value: 'discount', label: 'Biggest discount' },
+];
+
 function CollectionsInner() {
     const searchParams = useSearchParams();
     const [products, setProducts] = useState([]);
     const [filtered, setFiltered] = useState([]);
     const [category, setCategory] = useState(searchParams.get('category') || 'all');
     const [search, setSearch] = useState('');
+    const [sort, setSort] = useState('newest');
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
-        fetch(`${API_URL}/api/products`)
-            .then(r => r.json())
+        // Sorted server-side, so the order (and effective price) is the API's
+        fetch(`${API_URL}/api/products?sort=${sort}`)
+            .then(r => {
+                if (!r.ok) throw new Error(`HTTP ${r.status}`);
+                return r.json();
+            })
             .then(data => { setProducts(data); setLoading(false); })
             .catch(() => setLoading(false));
-    }, []);
+    }, [sort]);
 
     useEffect(() => {
-        let result = [...products];
-        if (category !== 'all') result = result.filter(p => p.category === category);
-        if (search.trim()) {
-            const q = search.toLowerCase();
-            result = result.filter(p =>
-                p.name.toLowerCase().includes(q) ||
-                (p.description || '').toLowerCase().includes(q) ||
-                (p.color || '').toLowerCase().includes(q)
-            );
+        const q = search.trim();
+        if (!q) {
+            setFiltered(category === 'all' ? products : products.filter(p => p.category === category));
+            return;
         }
-        setFiltered(result);
+        // Ranked search runs server-side; debounce so typing doesn't spam it
+        const controller = new AbortController();
+        const timer = setTimeout(() => {
+            const params = new URLSearchParams({ q, category, limit: '100' });
+            fetch(`${API_URL}/api/products/search?${params}`, { signal: controller.signal })
+                .then(r => r.json())
+                .then(data => setFiltered(Array.isArray(data) ? data : []))
+                .catch(() => {});
+        }, 150);
+        return () => {
+            clearTimeout(timer);
+            controller.abort();
+        };
     }, [category, search, products]);
 
     return (
@@ -60,6 +79,14 @@ function CollectionsInner() {
                                     value={search}
                                     onChange={e => setSearch(e.target.value)}
                                 />
+                                <select
+                                    className={`form-input ${styles.sort}`}
+                                    value={sort}
+                                    onChange={e => setSort(e.target.value)}
+                                    aria-label="Sort by"
+                                >
+                                    {SORTS.map(s => <option key={s.value} value={s.value}>{s.label}</option>)}
+                                </select>
                             </div>
                         </div>
                         <div className={styles.filterWrap}>
@@ -16,8 +16,11 @@ export default function HomePage() {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    fetch(`${API_URL}/api/products`)
-      .then(r => r.json())
+    fetch(`${API_URL}/api/products?fields=id,name,price,category,header_image,sizes`)
+      .then(r => {
+        if (!r.ok) throw new Error(`HTTP ${r.status}`);
+        return r.json();
+      })
       .then(data => {
         setProducts(data);
         setFiltered(data);
@@ -6,6 +6,7 @@ import Footer from '@/components/Footer';
 import ImageGallery from '@/components/ImageGallery';
 import SizeChart from '@/components/SizeChart';
 import WhatsAppButton from '@/components/WhatsAppButton';
+import ProductCard from '@/components/ProductCard';
 import styles from './page.module.css';
 
 const API_URL = 'https://dicks-and-toes-shop-api.onrender.com';
@@ -34,16 +35,18 @@ export default function ProductDetailPage() {
     const [couponInput, setCouponInput] = useState('');
     const [appliedDiscount, setAppliedDiscount] = useState(0);
     const [couponStatus, setCouponStatus] = useState(null); // 'success' | 'error' | null
+    const [related, setRelated] = useState([]);
 
     useEffect(() => {
-        Promise.all([
-            fetch(`${API_URL}/api/products/${id}`).then(r => {
+        // Product and shop config in one round trip
+        fetch(`${API_URL}/api/products/batch?ids=${encodeURIComponent(id)}&config=true`)
+            .then(r => {
                 if (!r.ok) throw new Error('Not found');
                 return r.json();
-            }),
-            fetch(`${API_URL}/api/config`).then(r => r.json()).catch(() => ({})),
-        ])
-            .then(([productData, config]) => {
+            })
+            .then(({ items, config = {} }) => {
+                const productData = items[0];
+                if (!productData) throw new Error('Not found');
                 // Normalize JSONB arrays so they're always clean string arrays
                 productData.sizes = safeArray(productData.sizes);
                 productData.images = safeArray(productData.images);
@@ -53,6 +56,12 @@ export default function ProductDetailPage() {
                 setLoading(false);
             })
             .catch(() => { setError(true); setLoading(false); });
+
+        // Cross-sell; the page works fine without it
+        fetch(`${API_URL}/api/products/${id}/related?limit=4&fields=id,name,price,category,header_image,sizes`)
+            .then(r => (r.ok ? r.json() : []))
+            .then(data => setRelated(Array.isArray(data) ? data : []))
+            .catch(() => setRelated([]));
     }, [id]);
 
     if (loading) {
@@ -254,6 +263,15 @@ export default function ProductDetailPage() {
                             </div>
                         </div>
                     </div>
+
+                    {related.length > 0 && (
+                        <section className={styles.related}>
+                            <h3 className={styles.sectionTitle}>You might also like</h3>
+                            <div className={styles.relatedGrid}>
+                                {related.map(p => <ProductCard key={p.id} product={p} />)}
+                            </div>
+                        </section>
+                    )}
                 </div>
             </main>
             <Footer />
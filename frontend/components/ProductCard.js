@@ -2,6 +2,14 @@
 import Link from 'next/link';
 import styles from './ProductCard.module.css';
 
+const API_URL = 'https://dicks-and-toes-shop-api.onrender.com';
+const CARD_WIDTHS = [320, 480, 640, 960];
+
+// Resized, cached copies from the API's image proxy instead of full-size originals
+function proxied(url, width) {
+    return `${API_URL}/img?src=${encodeURIComponent(url)}&w=${width}`;
+}
+
 function getImageSrc(url) {
     if (!url) return 'https://images.unsplash.com/photo-1523381210434-271e8be1f52b?w=600&q=80';
     if (Array.isArray(url)) return url[0] || 'https://images.unsplash.com/photo-1523381210434-271e8be1f52b?w=600&q=80';
@@ -20,6 +28,7 @@ function safeArray(val) {
 
 export default function ProductCard({ product }) {
     const imageSrc = getImageSrc(product.header_image);
+    const canProxy = !!product.header_image && typeof product.header_image === 'string';
     const price = typeof product.price === 'number'
         ? `₹${product.price.toLocaleString('en-IN')}`
         : product.price;
@@ -29,11 +38,16 @@ export default function ProductCard({ product }) {
         <Link href={`/product/${product.id}`} className={styles.card}>
             <div className={styles.imageWrap}>
                 <img
-                    src={imageSrc}
+                    src={canProxy ? proxied(imageSrc, 640) : imageSrc}
+                    srcSet={canProxy ? CARD_WIDTHS.map(w => `${proxied(imageSrc, w)} ${w}w`).join(', ') : undefined}
+                    sizes="(max-width: 600px) 50vw, (max-width: 1024px) 33vw, 25vw"
+                    loading="lazy"
+                    decoding="async"
                     alt={product.name}
                     className={styles.image}
                     style={{ width: '100%', height: '100%', objectFit: 'cover', display: 'block' }}
                     onError={(e) => {
+                        e.target.srcset = '';
                         e.target.src = 'https://images.unsplash.com/photo-1523381210434-271e8be1f52b?w=600&q=80';
                     }}
                 />